@@ -0,0 +1,35 @@
+import redis
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import AppUser
+from .tokens import revoke_user
+
+
+def revoke_user_tokens(user_id):
+    try:
+        revoke_user(user_id)
+    except redis.RedisError as e:
+        print(f"❌ Could not revoke tokens of user {user_id}: {e}")
+
+
+# Token-only authentication never reads the users table,
+# deactivated and deleted users are pushed to the revocation cache instead
+
+@receiver(post_save, sender=AppUser)
+def revoke_deactivated_user_tokens(sender, instance, created, **kwargs):
+    if not created and not instance.is_active:
+        revoke_user_tokens(instance.id)
+
+
+@receiver(post_save, sender=AppUser)
+def revoke_tokens_on_password_change(sender, instance, created, **kwargs):
+    # set_password() keeps the raw password on `_password` until save() has run the
+    # post_save handlers. Hash upgrades on login clear it first, so they do not revoke.
+    if not created and getattr(instance, '_password', None) is not None:
+        revoke_user_tokens(instance.id)
+
+
+@receiver(post_delete, sender=AppUser)
+def revoke_deleted_user_tokens(sender, instance, **kwargs):
+    revoke_user_tokens(instance.id)
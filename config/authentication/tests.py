@@ -1,3 +1,55 @@
+from unittest import skipUnless
+
 from django.test import TestCase
+from rest_framework_simplejwt.tokens import AccessToken
+
+from utils.redis_client import get_redis, redis_available
+from .models import AppUser
+from .tokens import authenticate_access_token, get_revoked_user_key, revoke_token, stamp_auth_time
+
 
-# Create your tests here.
+@skipUnless(redis_available(), 'Redis is not reachable')
+class TokenRevocationTests(TestCase):
+    def setUp(self):
+        self.user = AppUser.objects.create_user(username='client', password='secret', user_type='client')
+        get_redis().delete(get_revoked_user_key(self.user.id))
+    
+    def issue_token(self):
+        return stamp_auth_time(AccessToken.for_user(self.user))
+    
+    def assertAccepted(self, token):
+        self.assertEqual(authenticate_access_token(str(token)).id, self.user.id)
+    
+    def assertRevoked(self, token):
+        self.assertIsNone(authenticate_access_token(str(token)))
+    
+    def test_password_change(self):
+        token = self.issue_token()
+        self.assertAccepted(token)
+        
+        self.user.set_password('new-secret')
+        self.user.save()
+        self.assertRevoked(token)
+        
+        # A login right after the change, usually within the same second, is accepted
+        self.assertAccepted(self.issue_token())
+    
+    def test_saving_without_password_change_keeps_tokens(self):
+        token = self.issue_token()
+        self.user.first_name = 'Renamed'
+        self.user.save()
+        self.assertAccepted(token)
+    
+    def test_deactivation(self):
+        token = self.issue_token()
+        self.user.is_active = False
+        self.user.save()
+        self.assertRevoked(token)
+    
+    def test_logout_revokes_only_that_token(self):
+        token = self.issue_token()
+        other_device = self.issue_token()
+        
+        revoke_token(token)
+        self.assertRevoked(token)
+        self.assertAccepted(other_device)
@@ -0,0 +1,111 @@
+import time
+
+import redis
+from django.conf import settings
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from utils.redis_client import get_redis
+
+
+class ClaimsUser(TokenUser):
+    """
+    User built from the claims of a verified access token, no database row
+    behind it. Carries the `user_type` and `full_name` claims added at login.
+    """
+    
+    @property
+    def id(self):
+        # Keep the primary key an int whatever type the claim was encoded with
+        return int(self.token[api_settings.USER_ID_CLAIM])
+    
+    @property
+    def pk(self):
+        return self.id
+    
+    @property
+    def user_type(self):
+        return self.token.get('user_type')
+    
+    @property
+    def full_name(self):
+        return self.token.get('full_name') or self.username
+    
+    def get_full_name(self):
+        return self.full_name
+    
+    def __str__(self):
+        return f"{self.full_name} ({self.user_type})"
+
+
+def get_access_token_lifetime():
+    return int(settings.SIMPLE_JWT['ACCESS_TOKEN_LIFETIME'].total_seconds())
+
+
+def get_revoked_token_key(jti):
+    return f"auth:revoked:jti:{jti}"
+
+
+def get_revoked_user_key(user_id):
+    # Holds a timestamp, tokens of the user issued before it are revoked
+    return f"auth:revoked:user:{user_id}"
+
+
+def stamp_auth_time(token):
+    """
+    Record when the user logged in with sub-second precision. `iat` only has
+    whole seconds, so a login in the same second as a password change would
+    look revoked. Refreshed access tokens inherit the claim.
+    """
+    token['auth_time'] = time.time()
+    return token
+
+
+def revoke_token(token):
+    """Revoke one access token until it would have expired anyway"""
+    remaining = int(token['exp'] - time.time())
+    if remaining > 0:
+        get_redis().set(get_revoked_token_key(token['jti']), 1, ex=remaining)
+
+
+def revoke_user(user_id):
+    """Revoke every access token issued to the user so far (deactivation, password change)"""
+    get_redis().set(get_revoked_user_key(user_id), time.time(), ex=get_access_token_lifetime())
+
+
+def is_revoked(token):
+    """
+    Check the token against the revocation cache. When Redis is unavailable
+    the signature check alone decides, access tokens are short-lived.
+    """
+    try:
+        pipe = get_redis().pipeline(transaction=False)
+        pipe.exists(get_revoked_token_key(token.get('jti')))
+        pipe.get(get_revoked_user_key(token.get(api_settings.USER_ID_CLAIM)))
+        token_revoked, user_revoked_at = pipe.execute()
+    except redis.RedisError as e:
+        print(f"❌ Token revocation check failed, trusting the signature: {e}")
+        return False
+    
+    if token_revoked:
+        return True
+    # Tokens issued before auth_time was stamped only have the whole-second `iat`
+    issued_at = token.get('auth_time', token.get('iat', 0))
+    return user_revoked_at is not None and issued_at <= float(user_revoked_at)
+
+
+def authenticate_access_token(raw_token):
+    """
+    Verify an access token once (signature, expiry, token type) and return
+    a ClaimsUser, or None when it is invalid or revoked.
+    """
+    try:
+        token = AccessToken(raw_token)
+    except TokenError:
+        return None
+    
+    if is_revoked(token):
+        return None
+    return ClaimsUser(token)
@@ -20,6 +20,7 @@ from rest_framework_simplejwt.exceptions import TokenError, InvalidToken
 from .models import AppUser
 from .forms import SupervisorSignUpForm, ClientSignUpForm, LoginForm
 from .serializers import ClientSignupSerializer, UserProfileSerializer
+from .tokens import stamp_auth_time
 from project_management.models import Project, UserProjectRole
 
 # Python standard library
@@ -216,6 +217,7 @@ class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
         # Add custom claims
         token['user_type'] = user.user_type
         token['full_name'] = user.get_full_name()
+        stamp_auth_time(token)
         
         return token
 
@@ -245,6 +247,7 @@ def client_signup(request):
         # Add custom claims
         refresh['user_type'] = user.user_type
         refresh['full_name'] = user.get_full_name()
+        stamp_auth_time(refresh)
         
         # Return user data with tokens
         user_serializer = UserProfileSerializer(user)
@@ -302,6 +305,14 @@ def client_logout(request):
                 # Continue logout even if blacklisting fails
                 pass
         
+        # Token-only authentication (WebSocket) must stop accepting the access token too
+        try:
+            from .tokens import revoke_token
+            if request.auth is not None:
+                revoke_token(request.auth)
+        except Exception:
+            pass
+        
         # Deactivate user's FCM tokens
         try:
             from notification_management.models import FCMToken
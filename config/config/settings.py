@@ -241,20 +241,134 @@ SIMPLE_JWT = {
 
 ASGI_APPLICATION = 'config.asgi.application'
 
+REDIS_URL = config('REDIS_URL')
+
 CHANNEL_LAYERS = {
     'default': {
         'BACKEND': 'channels_redis.core.RedisChannelLayer',
         'CONFIG': {
-            'hosts': [config('REDIS_URL')],
+            'hosts': [REDIS_URL],
             'capacity': 1500,  # How many messages can be queued
             'expiry': 60,      # How long messages are kept (seconds)
         },
     },
 }
 
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': config('REDIS_LOCATION'),
+    },
+}
+
+# API response cache
+# Dashboard endpoints are cached per user and dropped as soon as a detection, camera or
+# project they cover is written. Concurrent misses wait up to the lock timeout for the
+# request already computing the response.
+API_CACHE_SECONDS = config('API_CACHE_SECONDS', default=30, cast=int)
+API_CACHE_LOCK_SECONDS = config('API_CACHE_LOCK_SECONDS', default=10, cast=int)
+
+# Accessible project ids per user, dropped on project and role writes
+PROJECT_ACCESS_CACHE_SECONDS = config('PROJECT_ACCESS_CACHE_SECONDS', default=300, cast=int)
+
 FILE_UPLOAD_MAX_MEMORY_SIZE = 10485760  # 10MB
 DATA_UPLOAD_MAX_MEMORY_SIZE = 10485760  # 10MB
 
 STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 
-OPENWEATHER_API_KEY = config('OPENWEATHER_API_KEY')
\ No newline at end of file
+OPENWEATHER_API_KEY = config('OPENWEATHER_API_KEY')
+
+# Detection incidents
+# Hits of the same type from one camera closer than the gap are grouped into one incident,
+# and only one frame per sample interval is stored as a Detection row.
+DETECTION_INCIDENT_GAP_SECONDS = config('DETECTION_INCIDENT_GAP_SECONDS', default=120, cast=int)
+DETECTION_INCIDENT_SAMPLE_SECONDS = config('DETECTION_INCIDENT_SAMPLE_SECONDS', default=30, cast=int)
+
+# Object tracking
+# Boxes overlapping a live track by at least the IoU threshold continue it,
+# tracks not matched for max age seconds are dropped.
+TRACKER_IOU_THRESHOLD = config('TRACKER_IOU_THRESHOLD', default=0.3, cast=float)
+TRACKER_MAX_AGE_SECONDS = config('TRACKER_MAX_AGE_SECONDS', default=15, cast=int)
+
+# Detection media writer
+# fsync policy: 'none', 'file' or 'directory'. With DETECTION_MEDIA_WAIT the row is
+# inserted once its files are durable, otherwise it is inserted as pending right away.
+DETECTION_MEDIA_QUEUE_SIZE = config('DETECTION_MEDIA_QUEUE_SIZE', default=64, cast=int)
+DETECTION_MEDIA_WORKERS = config('DETECTION_MEDIA_WORKERS', default=4, cast=int)
+DETECTION_MEDIA_FSYNC = config('DETECTION_MEDIA_FSYNC', default='file')
+DETECTION_MEDIA_WAIT = config('DETECTION_MEDIA_WAIT', default=False, cast=bool)
+
+# Notification dispatch
+# Worker threads per priority lane and the lane serving each detection type,
+# unknown types and system notifications use the system lane.
+NOTIFICATION_LANE_WORKERS = {
+    'critical': config('NOTIFICATION_CRITICAL_WORKERS', default=4, cast=int),
+    'normal': config('NOTIFICATION_NORMAL_WORKERS', default=2, cast=int),
+    'system': config('NOTIFICATION_SYSTEM_WORKERS', default=1, cast=int),
+}
+NOTIFICATION_LANE_TYPES = {
+    'fire': 'critical',
+    'smoke': 'critical',
+    'person': 'normal',
+}
+
+# Push notifications
+# Use 'notification_management.push.FakeFCMTransport' to test without Firebase.
+FCM_TRANSPORT = config('FCM_TRANSPORT', default='notification_management.push.FirebaseTransport')
+FCM_SEND_WORKERS = config('FCM_SEND_WORKERS', default=4, cast=int)
+FAKE_FCM_LATENCY_MS = config('FAKE_FCM_LATENCY_MS', default=50, cast=int)
+FAKE_FCM_FAILURE_RATE = config('FAKE_FCM_FAILURE_RATE', default=0.0, cast=float)
+
+# WebSocket presence
+# Online users get the WebSocket message first and a push only if they do not
+# acknowledge it within the ack window.
+PRESENCE_TTL_SECONDS = config('PRESENCE_TTL_SECONDS', default=60, cast=int)
+NOTIFICATION_ACK_WINDOW_SECONDS = config('NOTIFICATION_ACK_WINDOW_SECONDS', default=10, cast=int)
+
+# Notification coalescing
+# Per detection type, at most one notification per camera within the window in seconds,
+# later detections increment its counter and are announced in one digest when it closes.
+NOTIFICATION_COALESCE_WINDOWS = config(
+    'NOTIFICATION_COALESCE_WINDOWS',
+    default='fire:30,smoke:60,person:120',
+    cast=lambda value: {
+        name.strip(): int(seconds)
+        for name, seconds in (item.split(':') for item in value.split(',') if item.strip())
+    }
+)
+
+# Push outbox
+# Failed pushes are retried with exponential backoff (base * 2^(attempt-1), capped)
+# and moved to the dead state after PUSH_OUTBOX_MAX_ATTEMPTS.
+PUSH_OUTBOX_BATCH_SIZE = config('PUSH_OUTBOX_BATCH_SIZE', default=500, cast=int)
+PUSH_OUTBOX_MAX_ATTEMPTS = config('PUSH_OUTBOX_MAX_ATTEMPTS', default=8, cast=int)
+PUSH_OUTBOX_BACKOFF_SECONDS = config('PUSH_OUTBOX_BACKOFF_SECONDS', default=2, cast=int)
+PUSH_OUTBOX_MAX_BACKOFF_SECONDS = config('PUSH_OUTBOX_MAX_BACKOFF_SECONDS', default=900, cast=int)
+PUSH_OUTBOX_LEASE_SECONDS = config('PUSH_OUTBOX_LEASE_SECONDS', default=60, cast=int)
+PUSH_OUTBOX_STUCK_SECONDS = config('PUSH_OUTBOX_STUCK_SECONDS', default=300, cast=int)
+
+# WebSocket reconnect replay
+# The last NOTIFICATION_REPLAY_STREAM_LENGTH notifications of each user are kept
+# in a Redis stream, reconnects older than the stream are served from Postgres.
+NOTIFICATION_REPLAY_STREAM_LENGTH = config('NOTIFICATION_REPLAY_STREAM_LENGTH', default=200, cast=int)
+NOTIFICATION_REPLAY_TTL_SECONDS = config('NOTIFICATION_REPLAY_TTL_SECONDS', default=7 * 24 * 3600, cast=int)
+NOTIFICATION_REPLAY_LIMIT = config('NOTIFICATION_REPLAY_LIMIT', default=200, cast=int)
+
+# Read marks sent over WebSocket are buffered per connection and written together
+NOTIFICATION_READ_FLUSH_MS = config('NOTIFICATION_READ_FLUSH_MS', default=300, cast=int)
+
+# Unread counters are cached in Redis and recounted from Postgres when they expire,
+# run `manage.py reconcile_unread_counts` periodically to correct drift sooner
+NOTIFICATION_UNREAD_TTL_SECONDS = config('NOTIFICATION_UNREAD_TTL_SECONDS', default=3600, cast=int)
+
+# Notifications returned by the list API when the client does not paginate
+NOTIFICATION_LIST_LIMIT = config('NOTIFICATION_LIST_LIMIT', default=200, cast=int)
+
+# Notification retention, see `manage.py purge_notifications`
+# Days read and unread notifications are kept, 0 keeps them forever.
+NOTIFICATION_RETENTION_DAYS = {
+    'read': config('NOTIFICATION_RETENTION_READ_DAYS', default=30, cast=int),
+    'unread': config('NOTIFICATION_RETENTION_UNREAD_DAYS', default=180, cast=int),
+}
+NOTIFICATION_RETENTION_BATCH_SIZE = config('NOTIFICATION_RETENTION_BATCH_SIZE', default=2000, cast=int)
+NOTIFICATION_ARCHIVE_DIR = config('NOTIFICATION_ARCHIVE_DIR', default=os.path.join(BASE_DIR, 'archive', 'notifications'))
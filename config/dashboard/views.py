@@ -5,7 +5,8 @@ from django.utils import timezone
 
 # Local app imports
 from project_management.models import Project, Camera
-from detection_management.models import Detection
+from detection_management.models import Detection, DetectionRollup
+from detection_management import rollups
 
 # Python standard library
 from datetime import timedelta
@@ -32,9 +33,9 @@ def dashboard_view(request):
     if latest_project:
         latest_project.total_boundaries = latest_project.get_total_farm_boundaries()
         latest_project.total_cameras = latest_project.get_total_cameras()
-        latest_project.total_detections = Detection.objects.filter(
-            camera__project=latest_project
-        ).count()
+        latest_project.total_detections = DetectionRollup.objects.filter(
+            project=latest_project
+        ).aggregate(total=rollups.detection_count())['total']
     
     # Get latest detection from user's projects
     latest_detection = Detection.objects.filter(
@@ -56,19 +57,15 @@ def dashboard_view(request):
         is_active=True
     ).count()
     
-    # Get detection count for today
+    # Detection count for today and alert count for the last 24 hours, read from the hourly
+    # rollups: today starts at midnight so it is exact, the 24h window starts on the hour before
     today = timezone.now().replace(hour=0, minute=0, second=0, microsecond=0)
-    detection_count = Detection.objects.filter(
-        camera__project__in=user_projects,
-        detected_at__gte=today
-    ).count()
-    
-    # Get alert count (you can customize this based on your alert system)
-    alert_count = Detection.objects.filter(
-        camera__project__in=user_projects,
-        is_false_positive=False,
-        detected_at__gte=timezone.now() - timedelta(hours=24)
-    ).count()
+    counts = DetectionRollup.objects.filter(project__in=user_projects).aggregate(
+        detection_count=rollups.detection_count(rollups.since(today)),
+        alert_count=rollups.valid_count(rollups.since(timezone.now() - timedelta(hours=24))),
+    )
+    detection_count = counts['detection_count']
+    alert_count = counts['alert_count']
     
     context = {
         'latest_project': latest_project,
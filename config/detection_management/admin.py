@@ -2,11 +2,13 @@
 from django.contrib import admin
 from django.utils.html import format_html
 from django.utils import timezone
+from django.db import transaction
 from django.db.models import Count, Q
 from django.urls import reverse
 from django.utils.safestring import mark_safe
 import json
-from .models import DetectionType, Detection
+from .models import DetectionType, Detection, DetectionIncident
+from . import rollups
 
 
 @admin.register(DetectionType)
@@ -43,7 +45,7 @@ class DetectionAdmin(admin.ModelAdmin):
         'detected_at', 'is_false_positive', 'image_preview', 'detection_area'
     ]
     list_filter = [
-        'detection_type', 'is_false_positive', 'detected_at', 
+        'detection_type', 'is_false_positive', 'opens_incident', 'media_status', 'detected_at', 
         'camera__project', 'camera__camera_type', 'camera__farm_boundary'
     ]
     search_fields = ['camera__id', 'detection_type__name', 'notes', 'camera__description']
@@ -57,10 +59,10 @@ class DetectionAdmin(admin.ModelAdmin):
     
     fieldsets = (
         ('Detection Information', {
-            'fields': ('camera', 'detection_type', 'confidence_score', 'detected_at')
+            'fields': ('camera', 'detection_type', 'confidence_score', 'detected_at', 'incident', 'opens_incident')
         }),
         ('Images', {
-            'fields': ('image_original', 'image_annotated', 'image_preview_large', 'annotated_preview_large'),
+            'fields': ('image_original', 'image_annotated', 'media_status', 'image_preview_large', 'annotated_preview_large'),
             'classes': ('wide',)
         }),
         ('Detection Data', {
@@ -77,7 +79,7 @@ class DetectionAdmin(admin.ModelAdmin):
     def get_queryset(self, request):
         queryset = super().get_queryset(request)
         return queryset.select_related(
-            'camera', 'detection_type', 'camera__project', 'camera__farm_boundary'
+            'camera', 'detection_type', 'camera__project', 'camera__farm_boundary', 'incident'
         )
     
     def camera_info(self, obj):
@@ -187,16 +189,33 @@ class DetectionAdmin(admin.ModelAdmin):
         return f"{area:.4f} pixels² ({box_count} bounding boxes)"
     detection_area_calculated.short_description = 'Total Detection Area'
     
+    def save_model(self, request, obj, form, change):
+        """Move the detection between rollup buckets when a counted field is edited"""
+        if not change or not {'camera', 'detection_type', 'is_false_positive'} & set(form.changed_data):
+            return super().save_model(request, obj, form, change)
+        
+        with transaction.atomic():
+            previous = Detection.objects.select_for_update().get(pk=obj.pk)
+            rollups.forget_detections([previous])
+            super().save_model(request, obj, form, change)
+            rollups.record_detections([obj])
+    
+    def delete_model(self, request, obj):
+        rollups.delete_detections(Detection.objects.filter(pk=obj.pk))
+    
+    def delete_queryset(self, request, queryset):
+        rollups.delete_detections(queryset)
+    
     # Admin Actions
     def mark_as_false_positive(self, request, queryset):
         """Mark selected detections as false positives"""
-        updated = queryset.update(is_false_positive=True)
+        updated = rollups.set_false_positive(queryset, True)
         self.message_user(request, f'{updated} detections marked as false positive.')
     mark_as_false_positive.short_description = "Mark selected detections as false positive"
     
     def mark_as_valid(self, request, queryset):
         """Mark selected detections as valid (not false positive)"""
-        updated = queryset.update(is_false_positive=False)
+        updated = rollups.set_false_positive(queryset, False)
         self.message_user(request, f'{updated} detections marked as valid.')
     mark_as_valid.short_description = "Mark selected detections as valid"
     
@@ -207,5 +226,24 @@ class DetectionAdmin(admin.ModelAdmin):
     export_detections.short_description = "Export selected detections"
 
 
+@admin.register(DetectionIncident)
+class DetectionIncidentAdmin(admin.ModelAdmin):
+    list_display = [
+        'id', 'camera', 'detection_type', 'started_at', 'last_seen_at',
+        'hit_count', 'sampled_count', 'max_confidence'
+    ]
+    list_filter = ['detection_type', 'camera__project', 'started_at']
+    search_fields = ['camera__id', 'detection_type__name', 'camera__description']
+    readonly_fields = [
+        'started_at', 'last_seen_at', 'last_sampled_at', 'hit_count', 'sampled_count', 'max_confidence'
+    ]
+    date_hierarchy = 'started_at'
+    list_per_page = 25
+    
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        return queryset.select_related('camera', 'detection_type')
+
+
 # Optional: Custom admin site customization
 admin.site.site_header = "Smart Farm Watcher Admin"
\ No newline at end of file
@@ -23,6 +23,9 @@ urlpatterns = [
     # Detection endpoints
     path('detections/<int:detection_id>/', api_views.detection_detail, name='detection_detail'),
     path('detections/<int:detection_id>/toggle-false-positive/', api_views.toggle_false_positive, name='toggle_false_positive'),
+    
+    # Incident endpoints
+    path('incidents/<int:incident_id>/', api_views.incident_detail, name='incident_detail'),
 
     path('history/', api_views.detection_history, name='detection_history'),
 
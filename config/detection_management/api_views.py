@@ -4,20 +4,21 @@ from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.response import Response
 from rest_framework.pagination import PageNumberPagination
 from django.utils import timezone
-from django.db.models import Count, Q
+from django.db.models import Q
 from datetime import timedelta
 from django.shortcuts import get_object_or_404
 
+from project_management.access import get_accessible_project_ids
 from project_management.models import Project, Camera
-from .models import Detection
+from .models import Detection, DetectionIncident, DetectionRollup
+from .incidents import get_incident_gap
+from .registry import detection_type_registry
+from . import response_cache, rollups
 
 
 def get_user_projects(user):
     """Get all projects accessible to the user"""
-    return Project.objects.filter(
-        Q(created_by=user) | Q(user_roles__user=user),
-        is_active=True
-    ).distinct()
+    return Project.objects.filter(id__in=get_accessible_project_ids(user))
 
 
 def format_detection_data(detection):
@@ -39,9 +40,49 @@ def format_detection_data(detection):
         'image_annotated_url': detection.image_annotated.url if detection.image_annotated else None,
         'created_at': detection.detected_at.isoformat(),
         'notes': detection.notes or '',
+        'incident_id': str(detection.incident_id) if detection.incident_id else None,
+        'media_status': detection.media_status,
     }
 
 
+def format_incident_data(incident):
+    """Format incident data for API response"""
+    return {
+        'id': str(incident.id),
+        'type': incident.detection_type.name.title(),
+        'camera_id': f"Camera {incident.camera.id:02d}",
+        'camera_name': incident.camera.description or f"Camera {incident.camera.id}",
+        'project_id': str(incident.camera.project_id),
+        'started_at': incident.started_at.isoformat(),
+        'last_seen_at': incident.last_seen_at.isoformat(),
+        'duration_seconds': round(incident.get_duration_seconds()),
+        'hit_count': incident.hit_count,
+        'sampled_count': incident.sampled_count,
+        'max_confidence': float(incident.max_confidence),
+        'is_open': incident.is_open(get_incident_gap()),
+    }
+
+
+def apply_incident_filters(detections, request):
+    """Narrow a detection queryset by the `incident` and `group` query parameters"""
+    incident_id = request.GET.get('incident')
+    if incident_id:
+        detections = detections.filter(incident_id=incident_id)
+    
+    # One row per incident: keep only the frame that opened it
+    if request.GET.get('group') == 'incident':
+        detections = detections.filter(opens_incident=True)
+    
+    return detections
+
+
+def format_grouped_detection_data(detection):
+    """Format a detection together with the incident it belongs to"""
+    detection_data = format_detection_data(detection)
+    detection_data['incident'] = format_incident_data(detection.incident) if detection.incident else None
+    return detection_data
+
+
 def format_project_data(project):
     """Format project data for API response"""
     return {
@@ -62,76 +103,73 @@ def format_project_data(project):
     }
 
 
+def build_dashboard_stats(project_ids):
+    """Dashboard statistics response data for the given projects"""
+    cameras = Camera.objects.filter(project_id__in=project_ids, is_active=True).count()
+    
+    # Calculate time periods
+    now = timezone.now()
+    today_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    week_start = now - timedelta(days=7)
+    month_start = now - timedelta(days=30)
+    
+    # Every detection count in a single aggregate query over the hourly rollups
+    extra = {}
+    alert_type_ids = detection_type_registry.ids('fire', 'smoke')
+    if alert_type_ids:
+        # Active alerts: today's fire/smoke detections that are not false positives
+        extra['alerts'] = rollups.valid_count(
+            rollups.since(today_start) & Q(detection_type_id__in=alert_type_ids)
+        )
+    
+    counts = rollups.summarize(
+        DetectionRollup.objects.filter(project_id__in=project_ids),
+        windows={'today': today_start, 'week': week_start, 'month': month_start},
+        **extra
+    )
+    
+    # Calculate statistics
+    stats = {
+        'projects': len(project_ids),
+        'cameras': cameras,
+        'alerts': counts.get('alerts', 0),
+        'detections': counts['today'],
+        'total_detections': counts['total'],
+        'detection_breakdown': {
+            'fire': counts['fire'],
+            'smoke': counts['smoke'],
+            'person': counts['person'],
+            'total': counts['total'],
+        },
+        'time_periods': {
+            'today': counts['today'],
+            'week': counts['week'],
+            'month': counts['month'],
+        },
+        'false_positives': counts['false_positives'],
+    }
+    
+    return {
+        'success': True,
+        'stats': stats,
+        'timestamp': now.isoformat()
+    }
+
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def dashboard_stats(request):
     """Get dashboard statistics for the home screen"""
     try:
         user = request.user
-        user_projects = get_user_projects(user)
         
-        # Get all cameras from user's projects
-        user_cameras = Camera.objects.filter(
-            project__in=user_projects,
-            is_active=True
-        )
+        # The project ids key the cache and every count filters on the literal list
+        project_ids = get_accessible_project_ids(user)
         
-        # Get all detections from user's projects
-        all_detections = Detection.objects.filter(camera__project__in=user_projects)
-        
-        # Calculate time periods
-        now = timezone.now()
-        today_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
-        week_start = now - timedelta(days=7)
-        month_start = now - timedelta(days=30)
-        
-        # Get active alerts (recent fire/smoke detections that are not false positives)
-        active_alerts = all_detections.filter(
-            detected_at__gte=today_start,
-            is_false_positive=False,
-            detection_type__name__in=['fire', 'smoke']
-        ).count()
-        
-        # Get today's detections
-        today_detections = all_detections.filter(
-            detected_at__gte=today_start
-        ).count()
-        
-        # Get detection type breakdown
-        detection_stats = all_detections.values('detection_type__name').annotate(
-            count=Count('id')
+        data = response_cache.get_or_compute(
+            'dashboard_stats', user, project_ids, lambda: build_dashboard_stats(project_ids)
         )
-        
-        detection_breakdown = {}
-        for stat in detection_stats:
-            detection_breakdown[stat['detection_type__name']] = stat['count']
-        
-        # Calculate statistics
-        stats = {
-            'projects': user_projects.count(),
-            'cameras': user_cameras.count(),
-            'alerts': active_alerts,
-            'detections': today_detections,
-            'total_detections': all_detections.count(),
-            'detection_breakdown': {
-                'fire': detection_breakdown.get('fire', 0),
-                'smoke': detection_breakdown.get('smoke', 0),
-                'person': detection_breakdown.get('person', 0),
-                'total': all_detections.count(),
-            },
-            'time_periods': {
-                'today': all_detections.filter(detected_at__gte=today_start).count(),
-                'week': all_detections.filter(detected_at__gte=week_start).count(),
-                'month': all_detections.filter(detected_at__gte=month_start).count(),
-            },
-            'false_positives': all_detections.filter(is_false_positive=True).count(),
-        }
-        
-        return Response({
-            'success': True,
-            'stats': stats,
-            'timestamp': now.isoformat()
-        })
+        return Response(data)
         
     except Exception as e:
         return Response({
@@ -140,34 +178,40 @@ def dashboard_stats(request):
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+def build_latest_detection(project_ids):
+    """Latest detection response data for the given projects"""
+    latest_detection = Detection.objects.filter(
+        camera__project_id__in=project_ids
+    ).select_related(
+        'camera', 'camera__project', 'camera__farm_boundary', 'detection_type'
+    ).order_by('-detected_at').first()
+    
+    if not latest_detection:
+        return {
+            'success': True,
+            'detection': None,
+            'message': 'No detections found'
+        }
+    
+    return {
+        'success': True,
+        'detection': format_detection_data(latest_detection)
+    }
+
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def latest_detection(request):
     """Get the latest detection for the home screen"""
     try:
         user = request.user
-        user_projects = get_user_projects(user)
+        project_ids = get_accessible_project_ids(user)
         
         # Get latest detection from user's projects
-        latest_detection = Detection.objects.filter(
-            camera__project__in=user_projects
-        ).select_related(
-            'camera', 'camera__project', 'camera__farm_boundary', 'detection_type'
-        ).order_by('-detected_at').first()
-        
-        if not latest_detection:
-            return Response({
-                'success': True,
-                'detection': None,
-                'message': 'No detections found'
-            })
-        
-        detection_data = format_detection_data(latest_detection)
-        
-        return Response({
-            'success': True,
-            'detection': detection_data
-        })
+        data = response_cache.get_or_compute(
+            'latest_detection', user, project_ids, lambda: build_latest_detection(project_ids)
+        )
+        return Response(data)
         
     except Exception as e:
         return Response({
@@ -176,30 +220,36 @@ def latest_detection(request):
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+def build_latest_project(project_ids):
+    """Latest project response data for the given projects"""
+    latest_project = Project.objects.filter(id__in=project_ids).order_by('-created_at').first()
+    
+    if not latest_project:
+        return {
+            'success': True,
+            'project': None,
+            'message': 'No projects found'
+        }
+    
+    return {
+        'success': True,
+        'project': format_project_data(latest_project)
+    }
+
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def latest_project(request):
     """Get the latest/most recent project for the home screen"""
     try:
         user = request.user
-        user_projects = get_user_projects(user)
+        project_ids = get_accessible_project_ids(user)
         
         # Get user's latest project
-        latest_project = user_projects.order_by('-created_at').first()
-        
-        if not latest_project:
-            return Response({
-                'success': True,
-                'project': None,
-                'message': 'No projects found'
-            })
-        
-        project_data = format_project_data(latest_project)
-        
-        return Response({
-            'success': True,
-            'project': project_data
-        })
+        data = response_cache.get_or_compute(
+            'latest_project', user, project_ids, lambda: build_latest_project(project_ids)
+        )
+        return Response(data)
         
     except Exception as e:
         return Response({
@@ -208,31 +258,44 @@ def latest_project(request):
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+def build_recent_detections(project_ids, request):
+    """Recent detections response data for the given projects, filtered by the request parameters"""
+    # Get limit from query params (default 10)
+    limit = int(request.GET.get('limit', 10))
+    
+    # Get recent detections
+    recent_detections = Detection.objects.filter(
+        camera__project_id__in=project_ids
+    ).select_related(
+        'camera', 'camera__project', 'camera__farm_boundary', 'detection_type',
+        'incident', 'incident__camera', 'incident__detection_type'
+    )
+    recent_detections = apply_incident_filters(recent_detections, request)
+    recent_detections = recent_detections.order_by('-detected_at')[:limit]
+    
+    detections_data = [format_grouped_detection_data(detection) for detection in recent_detections]
+    
+    return {
+        'success': True,
+        'detections': detections_data,
+        'count': len(detections_data)
+    }
+
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def recent_detections(request):
     """Get recent detections for the home screen"""
     try:
         user = request.user
-        user_projects = get_user_projects(user)
-        
-        # Get limit from query params (default 10)
-        limit = int(request.GET.get('limit', 10))
-        
-        # Get recent detections
-        recent_detections = Detection.objects.filter(
-            camera__project__in=user_projects
-        ).select_related(
-            'camera', 'camera__project', 'camera__farm_boundary', 'detection_type'
-        ).order_by('-detected_at')[:limit]
-        
-        detections_data = [format_detection_data(detection) for detection in recent_detections]
+        project_ids = get_accessible_project_ids(user)
         
-        return Response({
-            'success': True,
-            'detections': detections_data,
-            'count': len(detections_data)
-        })
+        data = response_cache.get_or_compute(
+            'recent_detections', user, project_ids,
+            lambda: build_recent_detections(project_ids, request),
+            params=request.GET.dict()
+        )
+        return Response(data)
         
     except Exception as e:
         return Response({
@@ -247,7 +310,7 @@ def detection_detail(request, detection_id):
     """Get detailed information about a specific detection"""
     try:
         user = request.user
-        user_projects = get_user_projects(user)
+        project_ids = get_accessible_project_ids(user)
         
         # Get detection
         detection = get_object_or_404(
@@ -255,7 +318,7 @@ def detection_detail(request, detection_id):
                 'camera', 'camera__project', 'camera__farm_boundary', 'detection_type'
             ),
             id=detection_id,
-            camera__project__in=user_projects
+            camera__project_id__in=project_ids
         )
         
         detection_data = format_detection_data(detection)
@@ -312,18 +375,18 @@ def toggle_false_positive(request, detection_id):
     """Toggle false positive status of a detection"""
     try:
         user = request.user
-        user_projects = get_user_projects(user)
+        project_ids = get_accessible_project_ids(user)
         
         # Get detection
         detection = get_object_or_404(
             Detection,
             id=detection_id,
-            camera__project__in=user_projects
+            camera__project_id__in=project_ids
         )
         
-        # Toggle false positive status
+        # Toggle false positive status, moving the detection between rollup counts
         detection.is_false_positive = not detection.is_false_positive
-        detection.save()
+        rollups.set_false_positive(Detection.objects.filter(id=detection.id), detection.is_false_positive)
         
         status_text = "false positive" if detection.is_false_positive else "valid"
         
@@ -370,10 +433,10 @@ def project_detections(request, project_id):
     """Get all detections for a specific project"""
     try:
         user = request.user
-        user_projects = get_user_projects(user)
+        project_ids = get_accessible_project_ids(user)
         
         # Verify user has access to this project
-        project = get_object_or_404(Project, id=project_id, id__in=user_projects.values_list('id', flat=True))
+        project = get_object_or_404(Project, id=project_id, id__in=project_ids)
         
         # Get detections for this project
         detections = Detection.objects.filter(
@@ -408,13 +471,13 @@ def camera_detections(request, camera_id):
     """Get all detections for a specific camera"""
     try:
         user = request.user
-        user_projects = get_user_projects(user)
+        project_ids = get_accessible_project_ids(user)
         
         # Verify user has access to this camera
         camera = get_object_or_404(
             Camera,
             id=camera_id,
-            project__in=user_projects,
+            project_id__in=project_ids,
             is_active=True
         )
         
@@ -502,21 +565,25 @@ def detection_history(request):
     """Get paginated detection history with filtering options"""
     try:
         user = request.user
-        user_projects = get_user_projects(user)
+        project_ids = get_accessible_project_ids(user)
         
         # Base queryset - detections from user's projects
         detections = Detection.objects.filter(
-            camera__project__in=user_projects
+            camera__project_id__in=project_ids
         ).select_related(
-            'camera', 'camera__project', 'camera__farm_boundary', 'detection_type'
+            'camera', 'camera__project', 'camera__farm_boundary', 'detection_type',
+            'incident', 'incident__camera', 'incident__detection_type'
         )
         
         # Apply filters based on query parameters
         
+        # Filter by incident or collapse to one row per incident
+        detections = apply_incident_filters(detections, request)
+        
         # Filter by detection type
         detection_type = request.GET.get('type')
         if detection_type and detection_type != 'all':
-            detections = detections.filter(detection_type__name__iexact=detection_type)
+            detections = detections.filter(detection_type_id=detection_type_registry.get_id(detection_type.lower()))
         
         # Filter by status
         status_filter = request.GET.get('status')
@@ -573,7 +640,7 @@ def detection_history(request):
         # Format detection data
         detections_data = []
         for detection in paginated_detections:
-            detection_data = format_detection_data(detection)
+            detection_data = format_grouped_detection_data(detection)
             detections_data.append(detection_data)
         
         # Calculate pagination info
@@ -597,6 +664,8 @@ def detection_history(request):
                 'status': status_filter or 'all',
                 'time_range': time_range or 'all',
                 'search': search_query or '',
+                'incident': request.GET.get('incident') or '',
+                'group': request.GET.get('group') or '',
             },
             'timestamp': timezone.now().isoformat()
         })
@@ -605,4 +674,42 @@ def detection_history(request):
         return Response({
             'success': False,
             'error': str(e)
-        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
\ No newline at end of file
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def incident_detail(request, incident_id):
+    """Get an incident with its stored detections"""
+    try:
+        user = request.user
+        project_ids = get_accessible_project_ids(user)
+        
+        incident = get_object_or_404(
+            DetectionIncident.objects.select_related('camera', 'detection_type'),
+            id=incident_id,
+            camera__project_id__in=project_ids
+        )
+        
+        detections = incident.detections.select_related(
+            'camera', 'camera__project', 'camera__farm_boundary', 'detection_type'
+        ).order_by('-detected_at')
+        
+        # Apply pagination
+        paginator = PageNumberPagination()
+        paginator.page_size = 20
+        paginated_detections = paginator.paginate_queryset(detections, request)
+        
+        detections_data = [format_detection_data(detection) for detection in paginated_detections]
+        
+        return paginator.get_paginated_response({
+            'success': True,
+            'incident': format_incident_data(incident),
+            'detections': detections_data
+        })
+        
+    except Exception as e:
+        return Response({
+            'success': False,
+            'error': str(e)
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
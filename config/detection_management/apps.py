@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class DetectionManagementConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'detection_management'
+    
+    def ready(self):
+        import detection_management.signals
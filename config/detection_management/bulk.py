@@ -0,0 +1,171 @@
+import io
+from datetime import datetime
+from functools import partial
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from PIL import Image
+
+from .incidents import record_incident_hit
+from .media import media_writer, when_all_done
+from .models import Detection
+from .registry import detection_type_registry
+from .rollups import record_detections
+from .response_cache import invalidate_projects
+from .signals import detections_created
+
+
+def encode_jpeg(image_array):
+    """Encode an annotated image array as JPEG bytes"""
+    buffer = io.BytesIO()
+    Image.fromarray(image_array).save(buffer, format='JPEG')
+    return buffer.getvalue()
+
+
+def queue_detection_files(detection, original_name, original_bytes, annotated_name, annotated_array):
+    """Reserve the image names on the detection and queue both writes"""
+    for field_file, filename in ((detection.image_original, original_name), (detection.image_annotated, annotated_name)):
+        field_file.name = field_file.field.generate_filename(detection, filename)
+    
+    return [
+        media_writer.submit(detection.image_original, original_bytes),
+        media_writer.submit(detection.image_annotated, partial(encode_jpeg, annotated_array)),
+    ]
+
+
+def delete_written_files(file_futures):
+    """Remove the written images of rows that were rolled back or lost one of their images"""
+    storage = Detection._meta.get_field('image_original').storage
+    for future in (future for futures in file_futures for future in futures):
+        if future.exception() is not None:
+            continue
+        try:
+            storage.delete(future.result())
+        except Exception as e:
+            print(f"❌ Could not delete orphaned detection image {future.result()}: {e}")
+
+
+def collect_media_results(detections, file_futures):
+    """
+    Apply the write results to the detections.
+    Returns (ready, failed) lists of detections.
+    """
+    ready, failed = [], []
+    for detection, futures in zip(detections, file_futures):
+        try:
+            stored_names = [future.result() for future in futures]
+        except Exception as e:
+            print(f"❌ Writing images of detection {detection.id} failed: {e}")
+            # The image that did get written has nothing left pointing at it
+            delete_written_files([futures])
+            detection.media_status = 'failed'
+            failed.append(detection)
+            continue
+        
+        detection.image_original.name, detection.image_annotated.name = stored_names
+        detection.media_status = 'ready'
+        ready.append(detection)
+    
+    return ready, failed
+
+
+def finalize_pending_media(detections, file_futures):
+    """Mark pending detections once their files are written, then announce them"""
+    close_old_connections()
+    
+    try:
+        ready, failed = collect_media_results(detections, file_futures)
+        for detection in ready:
+            Detection.objects.filter(id=detection.id).update(
+                media_status='ready',
+                image_original=detection.image_original.name,
+                image_annotated=detection.image_annotated.name
+            )
+        if failed:
+            Detection.objects.filter(id__in=[d.id for d in failed]).update(media_status='failed')
+        invalidate_projects([detections[0].camera.project_id])
+        
+        # Rows without their images are kept (media_status='failed') but nobody is notified
+        if ready:
+            detections_created.send(sender=Detection, detections=ready)
+    except Exception as e:
+        print(f"❌ Finalizing detection media failed: {e}")
+        import traceback
+        traceback.print_exc()
+
+
+def save_detections_bulk(camera, groups, original_image):
+    """
+    Save every detection found in one frame with a single INSERT.
+    `groups` is a list of (detection_type_name, detections, annotated_image).
+    Frames folded into an open incident are skipped. Returns the saved detections.
+    
+    Image files are written by the media writer. With DETECTION_MEDIA_WAIT the
+    rows are inserted once the files are durable, otherwise they are inserted
+    right away as pending and marked ready when the writes finish.
+    """
+    original_image.seek(0)
+    original_bytes = original_image.read()
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S_%f')
+    
+    wait_for_media = getattr(settings, 'DETECTION_MEDIA_WAIT', False)
+    detections = []
+    file_futures = []
+    try:
+        # The incident counters and the rows they sampled commit together
+        with transaction.atomic():
+            for detection_type_name, detections_found, annotated_image in groups:
+                detection_type = detection_type_registry.get_or_create(detection_type_name)
+                avg_confidence = sum(d['confidence'] for d in detections_found) / len(detections_found) if detections_found else 0
+                
+                incident, opened, sample = record_incident_hit(camera, detection_type, avg_confidence)
+                if not sample:
+                    print(f"↪️ {detection_type_name} hit folded into incident #{incident.id} (no new row)")
+                    continue
+                
+                detection = Detection(
+                    camera=camera,
+                    detection_type=detection_type,
+                    confidence_score=avg_confidence,
+                    bounding_boxes=detections_found,
+                    incident=incident,
+                    opens_incident=opened,
+                    media_status='pending'
+                )
+                base_name = f"camera_{camera.id}_{detection_type_name}_{timestamp}"
+                file_futures.append(queue_detection_files(
+                    detection, f"{base_name}_original.jpg", original_bytes, f"{base_name}_annotated.jpg", annotated_image
+                ))
+                detections.append(detection)
+            
+            if not detections:
+                return []
+            
+            if wait_for_media:
+                ready, failed = collect_media_results(detections, file_futures)
+            
+            all_futures = [future for futures in file_futures for future in futures]
+            Detection.objects.bulk_create(detections)
+            record_detections(detections)
+            invalidate_projects([camera.project_id])
+            if wait_for_media:
+                # Rows whose images failed are stored as failed but not announced
+                if ready:
+                    transaction.on_commit(
+                        lambda: detections_created.send(sender=Detection, detections=ready)
+                    )
+            else:
+                transaction.on_commit(lambda: when_all_done(
+                    all_futures,
+                    partial(finalize_pending_media, detections, file_futures)
+                ))
+    except Exception:
+        # The rows were rolled back, their images (written or still queued) have no owner
+        when_all_done(
+            [future for futures in file_futures for future in futures],
+            partial(delete_written_files, file_futures)
+        )
+        raise
+    
+    print(f"✅ Bulk saved {len(detections)} detections: {[d.id for d in detections]}")
+    return detections
@@ -0,0 +1,101 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Value
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from project_management.models import Camera
+from .models import DetectionIncident
+
+
+def get_incident_gap():
+    """Maximum silence between two hits of the same incident"""
+    return timedelta(seconds=getattr(settings, 'DETECTION_INCIDENT_GAP_SECONDS', 120))
+
+
+def get_sample_interval():
+    """Minimum time between two stored frames of the same incident"""
+    return timedelta(seconds=getattr(settings, 'DETECTION_INCIDENT_SAMPLE_SECONDS', 30))
+
+
+def record_incident_hit(camera, detection_type, confidence, seen_at=None):
+    """
+    Attach a frame-level hit to the open incident of this camera and type,
+    opening a new incident when the last hit is older than the configured gap.
+
+    Returns (incident, opened, sample) where `sample` tells the caller
+    whether this frame should be stored as a Detection row.
+    
+    Hits of one camera are serialized on its row lock, so concurrent workers
+    never both find no open incident and open one each. Call it inside the
+    transaction that stores the sampled row to hold the lock until then.
+    """
+    seen_at = seen_at or timezone.now()
+    
+    with transaction.atomic():
+        Camera.objects.select_for_update().only('id').get(id=camera.id)
+        
+        incident = DetectionIncident.objects.select_for_update().filter(
+            camera=camera,
+            detection_type=detection_type,
+            last_seen_at__gte=seen_at - get_incident_gap()
+        ).order_by('-last_seen_at').first()
+        
+        if incident is None:
+            incident = DetectionIncident.objects.create(
+                camera=camera,
+                detection_type=detection_type,
+                started_at=seen_at,
+                last_seen_at=seen_at,
+                last_sampled_at=seen_at,
+                sampled_count=1,
+                max_confidence=confidence,
+            )
+            print(f"🆕 Opened {detection_type.name} incident #{incident.id} for Camera #{camera.id}")
+            return incident, True, True
+        
+        sample = (
+            incident.last_sampled_at is None or
+            seen_at - incident.last_sampled_at >= get_sample_interval()
+        )
+        
+        incident.last_seen_at = seen_at
+        incident.hit_count += 1
+        incident.max_confidence = max(incident.max_confidence, confidence)
+        update_fields = ['last_seen_at', 'hit_count', 'max_confidence']
+        
+        if sample:
+            incident.last_sampled_at = seen_at
+            incident.sampled_count += 1
+            update_fields += ['last_sampled_at', 'sampled_count']
+        
+        incident.save(update_fields=update_fields)
+    
+    return incident, False, sample
+
+
+def refresh_incident(camera, detection_type, confidence, seen_at=None):
+    """
+    Count a hit on the open incident without sampling a frame, for frames
+    whose boxes all continue existing tracks. Keeps a long-lived incident
+    open past the gap even though no new Detection row is stored.
+
+    Returns the number of incidents refreshed (0 when none is open).
+    """
+    seen_at = seen_at or timezone.now()
+    
+    incident_id = DetectionIncident.objects.filter(
+        camera=camera,
+        detection_type=detection_type,
+        last_seen_at__gte=seen_at - get_incident_gap()
+    ).order_by('-last_seen_at').values_list('id', flat=True).first()
+    if incident_id is None:
+        return 0
+    
+    return DetectionIncident.objects.filter(id=incident_id).update(
+        last_seen_at=Greatest(F('last_seen_at'), Value(seen_at)),
+        hit_count=F('hit_count') + 1,
+        max_confidence=Greatest(F('max_confidence'), Value(confidence))
+    )
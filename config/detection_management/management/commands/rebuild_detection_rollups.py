@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from detection_management import rollups
+from detection_management.models import DetectionRollup
+
+
+class Command(BaseCommand):
+    help = 'Recount the hourly detection rollups from the Detection table (backfill or repair after raw SQL edits)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--project', type=int, action='append', dest='projects',
+            help='Only rebuild this project, may be repeated'
+        )
+        parser.add_argument(
+            '--if-empty', action='store_true',
+            help='Only backfill when no rollup exists yet (safe to run on every start)'
+        )
+
+    def handle(self, *args, **options):
+        if options['if_empty'] and DetectionRollup.objects.exists():
+            self.stdout.write("Rollups already populated, nothing to backfill")
+            return
+
+        started = time.perf_counter()
+        buckets = rollups.rebuild(project_ids=options['projects'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt {buckets} rollup buckets in {time.perf_counter() - started:.1f}s"
+        ))
@@ -0,0 +1,126 @@
+import json
+import os
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from detection_management.models import Detection
+
+
+class Command(BaseCommand):
+    help = 'Move detection images from the flat layout into detections/<original|annotated>/<yyyy>/<mm>/<dd>/<camera_id>/'
+
+    image_fields = ['image_original', 'image_annotated']
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Detections moved per batch')
+        parser.add_argument(
+            '--state-file',
+            default=os.path.join(settings.MEDIA_ROOT, '.shard_detection_media.json'),
+            help='File recording the last migrated detection id, used to resume'
+        )
+        parser.add_argument('--restart', action='store_true', help='Ignore saved progress and start from the first detection')
+        parser.add_argument('--dry-run', action='store_true', help='Only report what would be moved')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        state_file = options['state_file']
+        dry_run = options['dry_run']
+
+        last_id = 0 if options['restart'] else self.load_progress(state_file)
+        if last_id:
+            self.stdout.write(f"Resuming after detection #{last_id}")
+
+        totals = {'moved': 0, 'already_sharded': 0, 'missing': 0}
+
+        while True:
+            batch = list(
+                Detection.objects.filter(id__gt=last_id).order_by('id').only(
+                    'id', 'camera_id', 'detected_at', *self.image_fields
+                )[:batch_size]
+            )
+            if not batch:
+                break
+
+            changed = []
+            for detection in batch:
+                if self.migrate_detection(detection, totals, dry_run):
+                    changed.append(detection)
+
+            if not dry_run:
+                with transaction.atomic():
+                    Detection.objects.bulk_update(changed, self.image_fields)
+                self.save_progress(state_file, batch[-1].id)
+
+            last_id = batch[-1].id
+            self.stdout.write(
+                f"Processed up to detection #{last_id}: {totals['moved']} files moved, "
+                f"{totals['already_sharded']} already sharded, {totals['missing']} missing"
+            )
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Done{' (dry run)' if dry_run else ''}: {totals['moved']} files moved, "
+            f"{totals['already_sharded']} already sharded, {totals['missing']} missing"
+        ))
+
+    def migrate_detection(self, detection, totals, dry_run):
+        """Move the images of one detection, returns True when a file name changed"""
+        changed = False
+
+        for field_name in self.image_fields:
+            field_file = getattr(detection, field_name)
+            if not field_file.name:
+                continue
+
+            old_name = field_file.name
+            new_name = field_file.field.upload_to(detection, os.path.basename(old_name))
+            if old_name == new_name:
+                totals['already_sharded'] += 1
+                continue
+
+            if not default_storage.exists(old_name):
+                # A previous run may have moved the file before it could save the row
+                if default_storage.exists(new_name):
+                    field_file.name = new_name
+                    changed = True
+                else:
+                    totals['missing'] += 1
+                continue
+
+            if not dry_run:
+                self.move_file(old_name, new_name)
+                field_file.name = new_name
+                changed = True
+            totals['moved'] += 1
+
+        return changed
+
+    def move_file(self, old_name, new_name):
+        """Move a stored file, renaming in place when the storage is on the local disk"""
+        try:
+            old_path = default_storage.path(old_name)
+            new_path = default_storage.path(new_name)
+        except NotImplementedError:
+            with default_storage.open(old_name, 'rb') as source:
+                default_storage.save(new_name, source)
+            default_storage.delete(old_name)
+            return
+
+        os.makedirs(os.path.dirname(new_path), exist_ok=True)
+        os.replace(old_path, new_path)
+
+    def load_progress(self, state_file):
+        try:
+            with open(state_file) as f:
+                return json.load(f).get('last_id', 0)
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    def save_progress(self, state_file, last_id):
+        # Write then rename so an interrupted run never leaves a truncated state file
+        tmp_file = f"{state_file}.tmp"
+        with open(tmp_file, 'w') as f:
+            json.dump({'last_id': last_id}, f)
+        os.replace(tmp_file, state_file)
@@ -0,0 +1,92 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+
+FSYNC_NONE = 'none'
+FSYNC_FILE = 'file'
+FSYNC_DIRECTORY = 'directory'
+
+
+class MediaWriter:
+    """
+    Write detection images off the request thread.
+    At most `max_pending` writes are queued, further submits block until a
+    slot frees up so a slow volume slows ingestion down instead of filling memory.
+    `fsync_policy` decides how durable a write is before its future resolves:
+    'none' (page cache), 'file' (fsync the file) or 'directory' (file and its directory).
+    """
+    
+    def __init__(self, max_pending=None, workers=None, fsync_policy=None):
+        self.max_pending = max_pending or getattr(settings, 'DETECTION_MEDIA_QUEUE_SIZE', 64)
+        self.workers = workers or getattr(settings, 'DETECTION_MEDIA_WORKERS', 4)
+        self.fsync_policy = fsync_policy or getattr(settings, 'DETECTION_MEDIA_FSYNC', FSYNC_FILE)
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='detection-media')
+    
+    def submit(self, field_file, content):
+        """
+        Queue writing `content` (bytes, or a callable returning bytes) to the
+        name already set on `field_file`. Returns a future resolving to the stored name.
+        """
+        self._slots.acquire()
+        try:
+            future = self._executor.submit(self._write, field_file.storage, field_file.name, content)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda f: self._slots.release())
+        return future
+    
+    def _write(self, storage, name, content):
+        data = content() if callable(content) else content
+        stored_name = storage.save(name, ContentFile(data))
+        self._sync(storage, stored_name)
+        return stored_name
+    
+    def _sync(self, storage, name):
+        if self.fsync_policy == FSYNC_NONE:
+            return
+        
+        try:
+            path = storage.path(name)
+        except NotImplementedError:
+            # Remote storages handle durability themselves
+            return
+        
+        paths = [path]
+        if self.fsync_policy == FSYNC_DIRECTORY:
+            paths.append(os.path.dirname(path))
+        
+        for sync_path in paths:
+            fd = os.open(sync_path, os.O_RDONLY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+
+# Runs completion callbacks so they never execute on a request thread
+_completion_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='detection-media-done')
+
+
+def when_all_done(futures, callback):
+    """Run `callback()` in the background once every future has finished"""
+    remaining = [len(futures)]
+    lock = threading.Lock()
+    
+    def on_done(future):
+        with lock:
+            remaining[0] -= 1
+            is_last = remaining[0] == 0
+        if is_last:
+            _completion_executor.submit(callback)
+    
+    for future in futures:
+        future.add_done_callback(on_done)
+
+
+# Shared writer used by the ingestion path
+media_writer = MediaWriter()
@@ -1,5 +1,22 @@
 from django.db import models
-from project_management.models import Camera
+from django.utils import timezone
+from django.utils.deconstruct import deconstructible
+from project_management.models import Camera, Project
+
+
+@deconstructible
+class ShardedDetectionPath:
+    """upload_to placing detection images under detections/<subdirectory>/<yyyy>/<mm>/<dd>/<camera_id>/"""
+    
+    def __init__(self, subdirectory):
+        self.subdirectory = subdirectory
+    
+    def __call__(self, instance, filename):
+        detected_at = timezone.localtime(instance.detected_at or timezone.now())
+        return f"detections/{self.subdirectory}/{detected_at:%Y/%m/%d}/{instance.camera_id}/{filename}"
+    
+    def __eq__(self, other):
+        return isinstance(other, ShardedDetectionPath) and self.subdirectory == other.subdirectory
 
 
 class DetectionType(models.Model):
@@ -15,23 +32,70 @@ class DetectionType(models.Model):
         ordering = ['name']
 
 
+class DetectionIncident(models.Model):
+    """Group consecutive detections of the same type from one camera"""
+    camera = models.ForeignKey(Camera, on_delete=models.CASCADE, related_name='incidents')
+    detection_type = models.ForeignKey(DetectionType, on_delete=models.CASCADE, related_name='incidents')
+    started_at = models.DateTimeField(default=timezone.now)
+    last_seen_at = models.DateTimeField(default=timezone.now)
+    last_sampled_at = models.DateTimeField(null=True, blank=True)
+    hit_count = models.PositiveIntegerField(default=1)  # Frames that reported this incident
+    sampled_count = models.PositiveIntegerField(default=0)  # Frames stored as Detection rows
+    max_confidence = models.DecimalField(max_digits=5, decimal_places=4, default=0)
+    
+    class Meta:
+        ordering = ['-last_seen_at']
+        indexes = [
+            models.Index(fields=['camera', 'detection_type', '-last_seen_at']),
+            models.Index(fields=['-started_at']),
+        ]
+    
+    def __str__(self):
+        return f"{self.detection_type.name} incident #{self.id} on Camera #{self.camera_id}"
+    
+    def is_open(self, gap, now=None):
+        """Check whether a new hit within `gap` would still join this incident"""
+        now = now or timezone.now()
+        return now - self.last_seen_at <= gap
+    
+    def get_duration_seconds(self):
+        """Time between the first and the last hit of the incident"""
+        return (self.last_seen_at - self.started_at).total_seconds()
+
+
 class Detection(models.Model):
     """Store detection results from cameras"""
+    MEDIA_STATUSES = [
+        ('ready', 'Ready'),      # Both image files are written
+        ('pending', 'Pending'),  # Row saved, image writes still queued
+        ('failed', 'Failed'),    # An image write failed
+    ]
+    
     camera = models.ForeignKey(Camera, on_delete=models.CASCADE, related_name='detections')
     detection_type = models.ForeignKey(DetectionType, on_delete=models.CASCADE)
     confidence_score = models.DecimalField(max_digits=5, decimal_places=4)  # 0.0000 to 1.0000
     bounding_boxes = models.JSONField()  # Store bounding box coordinates
-    image_original = models.ImageField(upload_to='detections/original/')
-    image_annotated = models.ImageField(upload_to='detections/annotated/')
+    image_original = models.ImageField(upload_to=ShardedDetectionPath('original'))
+    image_annotated = models.ImageField(upload_to=ShardedDetectionPath('annotated'))
     detected_at = models.DateTimeField(auto_now_add=True)
     is_false_positive = models.BooleanField(default=False)
     notes = models.TextField(blank=True)
+    incident = models.ForeignKey(
+        DetectionIncident,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='detections'
+    )
+    opens_incident = models.BooleanField(default=True)  # First stored frame of its incident
+    media_status = models.CharField(max_length=10, choices=MEDIA_STATUSES, default='ready', db_index=True)
     
     class Meta:
         ordering = ['-detected_at']
         indexes = [
             models.Index(fields=['camera', '-detected_at']),
             models.Index(fields=['detection_type', '-detected_at']),
+            models.Index(fields=['incident', '-detected_at']),
         ]
     
     def __str__(self):
@@ -48,4 +112,33 @@ class Detection(models.Model):
             height = box.get('height', 0)
             total_area += width * height
         
-        return total_area
\ No newline at end of file
+        return total_area
+
+
+class DetectionRollup(models.Model):
+    """
+    Detection counts per camera, detection type and hour, kept up to date on
+    insert, delete and false positive changes (see rollups.py). Statistics
+    read these buckets instead of counting Detection rows. Detections deleted
+    outside rollups.delete_detections() need rebuild_detection_rollups.
+    """
+    camera = models.ForeignKey(Camera, on_delete=models.CASCADE, related_name='detection_rollups')
+    project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name='detection_rollups')
+    detection_type = models.ForeignKey(DetectionType, on_delete=models.CASCADE)
+    hour = models.DateTimeField()  # Start of the bucket, in UTC
+    total = models.PositiveIntegerField(default=0)
+    false_positives = models.PositiveIntegerField(default=0)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['camera', 'project', 'detection_type', 'hour'],
+                name='unique_detection_rollup_bucket'
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['project', 'hour']),
+        ]
+    
+    def __str__(self):
+        return f"{self.total} {self.detection_type.name} detections on Camera #{self.camera_id} at {self.hour:%Y-%m-%d %H:00}"
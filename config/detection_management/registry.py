@@ -0,0 +1,98 @@
+import threading
+import time
+
+import redis
+
+from utils.redis_client import get_redis
+from .models import DetectionType
+
+
+class DetectionTypeRegistry:
+    """
+    Process-wide cache of DetectionType rows keyed by name.
+    Loaded on first use and reloaded when a DetectionType changes, either in
+    this process (signals) or in another worker (shared version key in Redis).
+    """
+    
+    version_key = 'detection_types:version'
+    version_check_interval = 30  # seconds
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        # (by_name, by_id) swapped as one reference, readers keep the snapshot they got
+        self._snapshot = None
+        self._version = None
+        self._checked_at = 0
+    
+    def _remote_version(self):
+        try:
+            return get_redis().get(self.version_key)
+        except redis.RedisError:
+            return self._version
+    
+    def _ensure_loaded(self):
+        """Get the current (by_name, by_id) snapshot, loading it first if needed"""
+        now = time.monotonic()
+        snapshot = self._snapshot
+        if snapshot is not None and now - self._checked_at < self.version_check_interval:
+            return snapshot
+        
+        with self._lock:
+            remote_version = self._remote_version()
+            self._checked_at = now
+            if self._snapshot is not None and remote_version == self._version:
+                return self._snapshot
+            
+            detection_types = list(DetectionType.objects.all())
+            self._snapshot = (
+                {detection_type.name: detection_type for detection_type in detection_types},
+                {detection_type.id: detection_type for detection_type in detection_types},
+            )
+            self._version = remote_version
+            return self._snapshot
+    
+    def invalidate(self):
+        """Drop the local cache and tell other workers to reload theirs"""
+        with self._lock:
+            self._snapshot = None
+        try:
+            get_redis().incr(self.version_key)
+        except redis.RedisError as e:
+            print(f"❌ Could not publish detection type change: {e}")
+    
+    def get(self, name):
+        """Get the DetectionType named `name`, or None"""
+        by_name, _ = self._ensure_loaded()
+        return by_name.get(name)
+    
+    def get_id(self, name):
+        """Get the id of the DetectionType named `name`, or None"""
+        detection_type = self.get(name)
+        return detection_type.id if detection_type else None
+    
+    def get_name(self, detection_type_id):
+        """Get the name of the DetectionType with this id, or None"""
+        _, by_id = self._ensure_loaded()
+        detection_type = by_id.get(detection_type_id)
+        return detection_type.name if detection_type else None
+    
+    def ids(self, *names):
+        """Get the ids of every existing DetectionType among `names`"""
+        return [detection_type_id for detection_type_id in map(self.get_id, names) if detection_type_id is not None]
+    
+    def get_or_create(self, name):
+        """Get the DetectionType named `name`, creating it if needed"""
+        detection_type = self.get(name)
+        if detection_type is None:
+            detection_type, created = DetectionType.objects.get_or_create(
+                name=name,
+                defaults={'description': f'{name.title()} detection'}
+            )
+            if created:
+                print(f"Created new detection type: {name}")
+            else:
+                self.invalidate()
+        return detection_type
+
+
+detection_type_registry = DetectionTypeRegistry()
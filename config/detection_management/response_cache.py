@@ -0,0 +1,100 @@
+import hashlib
+import json
+import time
+import uuid
+
+import redis
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+# Each project has a version that changes whenever one of its detections,
+# cameras or the project itself is written. Cached responses are keyed by the
+# versions of the user's projects, so a write makes every response covering
+# that project unreachable without having to find and delete them.
+
+
+def get_project_version_key(project_id):
+    return f"api:project:{project_id}:version"
+
+
+def get_cache_timeout():
+    return getattr(settings, 'API_CACHE_SECONDS', 30)
+
+
+def get_lock_timeout():
+    return getattr(settings, 'API_CACHE_LOCK_SECONDS', 10)
+
+
+def bump_projects(project_ids):
+    """Give the projects a new version, dropping every cached response that covers them"""
+    version = uuid.uuid4().hex
+    try:
+        cache.set_many(
+            {get_project_version_key(project_id): version for project_id in set(project_ids)},
+            timeout=None
+        )
+    except redis.RedisError as e:
+        print(f"❌ API cache invalidation failed for projects {sorted(set(project_ids))}: {e}")
+
+
+def invalidate_projects(project_ids):
+    """Bump the projects once the current transaction commits, so readers never re-cache old rows"""
+    project_ids = [project_id for project_id in set(project_ids) if project_id is not None]
+    if project_ids:
+        transaction.on_commit(lambda: bump_projects(project_ids))
+
+
+def get_response_key(name, user, project_ids, params):
+    project_ids = sorted(project_ids)
+    versions = cache.get_many([get_project_version_key(project_id) for project_id in project_ids])
+    fingerprint = json.dumps([
+        project_ids,
+        [versions.get(get_project_version_key(project_id)) for project_id in project_ids],
+        sorted(params.items()),
+    ])
+    return f"api:{name}:{user.id}:{hashlib.md5(fingerprint.encode()).hexdigest()}"
+
+
+def get_or_compute(name, user, project_ids, compute, params=None):
+    """
+    Response data of endpoint `name` for `user` from the cache, computed with
+    `compute()` on a miss. Concurrent misses for the same key compute once:
+    the first takes a lock, the others wait for its result (up to the lock
+    timeout) before computing themselves. Falls back to `compute()` when Redis
+    is unavailable.
+    """
+    try:
+        key = get_response_key(name, user, project_ids, params or {})
+        data = cache.get(key)
+        if data is not None:
+            return data
+        
+        lock_key = f"{key}:lock"
+        locked = cache.add(lock_key, 1, timeout=get_lock_timeout())
+        if not locked:
+            deadline = time.monotonic() + get_lock_timeout()
+            while time.monotonic() < deadline:
+                time.sleep(0.05)
+                data = cache.get(key)
+                if data is not None:
+                    return data
+                if cache.get(lock_key) is None:
+                    break
+    except redis.RedisError as e:
+        print(f"❌ API cache read failed for {name}: {e}")
+        return compute()
+    
+    try:
+        data = compute()
+        try:
+            cache.set(key, data, timeout=get_cache_timeout())
+        except redis.RedisError as e:
+            print(f"❌ API cache write failed for {name}: {e}")
+        return data
+    finally:
+        if locked:
+            try:
+                cache.delete(lock_key)
+            except redis.RedisError:
+                pass
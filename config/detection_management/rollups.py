@@ -0,0 +1,220 @@
+from collections import defaultdict
+from datetime import timezone as dt_timezone
+
+from django.db import connection, transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import Coalesce, TruncHour
+
+from project_management.models import Camera, Project
+from .models import Detection, DetectionRollup
+from .registry import detection_type_registry
+from . import response_cache
+
+
+def bucket_hour(moment):
+    """Start of the UTC hour bucket holding `moment`"""
+    return moment.astimezone(dt_timezone.utc).replace(minute=0, second=0, microsecond=0)
+
+
+def detection_count(condition=None):
+    """Aggregate summing detections of the rollup rows matching `condition`"""
+    return Coalesce(Sum('total', filter=condition), 0)
+
+
+def false_positive_count(condition=None):
+    return Coalesce(Sum('false_positives', filter=condition), 0)
+
+
+def valid_count(condition=None):
+    return Coalesce(Sum(F('total') - F('false_positives'), filter=condition), 0)
+
+
+def since(moment):
+    """
+    Condition on buckets from `moment` on. Buckets are whole hours, so the
+    window is rounded down to the hour: a 24h window covers up to 25 hours,
+    windows starting on the hour (today, this week) are exact.
+    """
+    return Q(hour__gte=bucket_hour(moment))
+
+
+def build_aggregates(windows=None, type_names=('fire', 'smoke', 'person')):
+    """
+    Aggregates for the usual statistics: total, false_positives, valid, one
+    count per detection type name and one per window (name -> start datetime).
+    """
+    aggregates = {
+        'total': detection_count(),
+        'false_positives': false_positive_count(),
+        'valid': valid_count(),
+    }
+    for type_name in type_names:
+        aggregates[type_name] = detection_count(Q(detection_type_id=detection_type_registry.get_id(type_name)))
+    for window_name, start in (windows or {}).items():
+        aggregates[window_name] = detection_count(since(start))
+    return aggregates
+
+
+def summarize(rollups, windows=None, type_names=('fire', 'smoke', 'person'), **extra):
+    """Run build_aggregates() plus `extra` aggregates over a DetectionRollup queryset in one query"""
+    return rollups.aggregate(**build_aggregates(windows, type_names), **extra)
+
+
+def get_project_ids_by_camera(camera_ids):
+    return dict(Camera.objects.filter(id__in=set(camera_ids)).values_list('id', 'project_id'))
+
+
+def upsert(deltas):
+    """Add non-negative (total, false_positives) deltas to their buckets, creating missing ones"""
+    if not deltas:
+        return
+    
+    table = DetectionRollup._meta.db_table
+    rows = [
+        (camera_id, project_id, detection_type_id, hour, total, false_positives)
+        for (camera_id, project_id, detection_type_id, hour), (total, false_positives) in deltas.items()
+    ]
+    values = ', '.join(['(%s, %s, %s, %s, %s, %s)'] * len(rows))
+    sql = (
+        f"INSERT INTO {table} (camera_id, project_id, detection_type_id, hour, total, false_positives) "
+        f"VALUES {values} "
+        f"ON CONFLICT (camera_id, project_id, detection_type_id, hour) DO UPDATE SET "
+        f"total = {table}.total + EXCLUDED.total, "
+        f"false_positives = {table}.false_positives + EXCLUDED.false_positives"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [value for row in rows for value in row])
+
+
+def adjust(deltas):
+    """Apply (total, false_positives) deltas that may be negative to existing buckets"""
+    for (camera_id, project_id, detection_type_id, hour), (total, false_positives) in deltas.items():
+        DetectionRollup.objects.filter(
+            camera_id=camera_id, project_id=project_id, detection_type_id=detection_type_id, hour=hour
+        ).update(
+            total=F('total') + total,
+            false_positives=F('false_positives') + false_positives
+        )
+
+
+def collect_deltas(detections, total, false_positives):
+    """
+    Group detections into buckets. `total` and `false_positives` are the
+    per-detection deltas, `false_positives` may be a callable of the detection.
+    """
+    project_ids = get_project_ids_by_camera(detection.camera_id for detection in detections)
+    deltas = defaultdict(lambda: [0, 0])
+    for detection in detections:
+        key = (
+            detection.camera_id,
+            project_ids[detection.camera_id],
+            detection.detection_type_id,
+            bucket_hour(detection.detected_at),
+        )
+        deltas[key][0] += total
+        deltas[key][1] += false_positives(detection) if callable(false_positives) else false_positives
+    return {key: tuple(delta) for key, delta in deltas.items()}
+
+
+def record_detections(detections):
+    """Count newly inserted detections, call inside the inserting transaction"""
+    detections = [detection for detection in detections if detection.detected_at]
+    if detections:
+        upsert(collect_deltas(detections, 1, lambda detection: int(detection.is_false_positive)))
+
+
+def forget_detections(detections):
+    """Uncount detections, e.g. before an edit moves them to another bucket"""
+    detections = [detection for detection in detections if detection.detected_at]
+    if detections:
+        adjust(collect_deltas(detections, -1, lambda detection: -int(detection.is_false_positive)))
+
+
+def delete_detections(detections):
+    """
+    Delete a Detection queryset and uncount it with one adjust per bucket.
+    Deleting a camera or project needs nothing here, its buckets cascade.
+    Returns the result of delete().
+    """
+    with transaction.atomic():
+        ids = list(detections.select_for_update(of=('self',)).values_list('id', flat=True))
+        detections = Detection.objects.filter(id__in=ids)
+        deltas = {
+            (bucket['camera_id'], bucket['camera__project_id'], bucket['detection_type_id'], bucket['bucket']):
+                (-bucket['bucket_total'], -bucket['bucket_false_positives'])
+            for bucket in count_buckets(detections)
+        }
+        result = detections.delete()
+        adjust(deltas)
+        response_cache.invalidate_projects(project_id for _, project_id, _, _ in deltas)
+    return result
+
+
+def move_camera(camera_id, project_id):
+    """Point the buckets of a camera moved to another project at its new project"""
+    DetectionRollup.objects.filter(camera_id=camera_id).exclude(project_id=project_id).update(project_id=project_id)
+
+
+def set_false_positive(detections, value):
+    """
+    Set the false positive flag of a Detection queryset and move the changed
+    rows between the valid and false positive counts. Returns the rows changed.
+    """
+    with transaction.atomic():
+        changed = list(
+            detections.filter(is_false_positive=not value).select_for_update().only(
+                'id', 'camera_id', 'detection_type_id', 'detected_at'
+            )
+        )
+        if not changed:
+            return 0
+        
+        Detection.objects.filter(id__in=[detection.id for detection in changed]).update(is_false_positive=value)
+        deltas = collect_deltas(changed, 0, 1 if value else -1)
+        adjust(deltas)
+        response_cache.invalidate_projects(project_id for _, project_id, _, _ in deltas)
+    return len(changed)
+
+
+def count_buckets(detections):
+    """Group a Detection queryset into buckets with their total and false positive counts"""
+    return detections.annotate(
+        bucket=TruncHour('detected_at', tzinfo=dt_timezone.utc)
+    ).values(
+        'camera_id', 'camera__project_id', 'detection_type_id', 'bucket'
+    ).annotate(
+        bucket_total=Count('id'),
+        bucket_false_positives=Count('id', filter=Q(is_false_positive=True)),
+    ).order_by()
+
+
+def rebuild(project_ids=None):
+    """Recount every bucket (of `project_ids` when given) from the Detection table, returns the buckets written"""
+    detections = Detection.objects.all()
+    rollups = DetectionRollup.objects.all()
+    if project_ids is not None:
+        detections = detections.filter(camera__project_id__in=project_ids)
+        rollups = rollups.filter(project_id__in=project_ids)
+    
+    buckets = count_buckets(detections)
+    
+    with transaction.atomic():
+        # Writers block until the recount commits, so no increment is lost or counted twice
+        with connection.cursor() as cursor:
+            cursor.execute(f"LOCK TABLE {DetectionRollup._meta.db_table} IN SHARE ROW EXCLUSIVE MODE")
+        rollups.delete()
+        created = DetectionRollup.objects.bulk_create([
+            DetectionRollup(
+                camera_id=bucket['camera_id'],
+                project_id=bucket['camera__project_id'],
+                detection_type_id=bucket['detection_type_id'],
+                hour=bucket['bucket'],
+                total=bucket['bucket_total'],
+                false_positives=bucket['bucket_false_positives'],
+            )
+            for bucket in buckets.iterator()
+        ], batch_size=1000)
+        response_cache.invalidate_projects(
+            project_ids if project_ids is not None else Project.objects.values_list('id', flat=True)
+        )
+    return len(created)
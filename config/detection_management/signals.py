@@ -0,0 +1,71 @@
+from django.db.models.signals import post_save, post_delete, pre_save
+from django.dispatch import Signal, receiver
+
+from project_management.models import Camera, FarmBoundary, Project
+from .models import Detection, DetectionType
+from .registry import detection_type_registry
+from . import response_cache, rollups
+
+# Camera fields written by heartbeats, they do not appear in any cached response
+HEARTBEAT_FIELDS = {'heartbeat_check', 'last_heartbeat'}
+
+# Sent once per bulk write, after the transaction commits, with `detections`
+# holding the saved Detection instances. bulk_create skips post_save, so
+# downstream handlers listen to this instead.
+detections_created = Signal()
+
+
+@receiver([post_save, post_delete], sender=DetectionType)
+def refresh_detection_type_registry(sender, **kwargs):
+    """Reload the cached detection types whenever one changes"""
+    detection_type_registry.invalidate()
+
+
+@receiver(post_save, sender=Detection)
+def count_created_detection(sender, instance, created, **kwargs):
+    """Single inserts update the rollups here, bulk inserts do it in save_detections_bulk"""
+    if created:
+        rollups.record_detections([instance])
+
+
+# Deletes have no per-row receiver, that would run for every detection of a
+# deleted camera or project and stop fast deletes: their buckets cascade, and
+# other deletes go through rollups.delete_detections()
+@receiver(post_save, sender=Detection)
+def invalidate_detection_responses(sender, instance, **kwargs):
+    response_cache.invalidate_projects([instance.camera.project_id])
+
+
+@receiver(pre_save, sender=Camera)
+def invalidate_previous_camera_project(sender, instance, update_fields=None, **kwargs):
+    """A camera moved to another project leaves the responses of its old project stale"""
+    if instance.pk is None or (update_fields and set(update_fields) <= HEARTBEAT_FIELDS):
+        return
+    response_cache.invalidate_projects(
+        Camera.objects.filter(pk=instance.pk).exclude(project_id=instance.project_id).values_list('project_id', flat=True)
+    )
+
+
+@receiver([post_save, post_delete], sender=Camera)
+def invalidate_camera_responses(sender, instance, update_fields=None, **kwargs):
+    if update_fields and set(update_fields) <= HEARTBEAT_FIELDS:
+        return
+    response_cache.invalidate_projects([instance.project_id])
+
+
+@receiver(post_save, sender=Camera)
+def move_camera_rollups(sender, instance, created, update_fields=None, **kwargs):
+    """The camera's history follows it to its new project"""
+    if created or (update_fields and 'project' not in update_fields and 'project_id' not in update_fields):
+        return
+    rollups.move_camera(instance.pk, instance.project_id)
+
+
+@receiver([post_save, post_delete], sender=FarmBoundary)
+def invalidate_farm_boundary_responses(sender, instance, **kwargs):
+    response_cache.invalidate_projects([instance.project_id])
+
+
+@receiver([post_save, post_delete], sender=Project)
+def invalidate_project_responses(sender, instance, **kwargs):
+    response_cache.invalidate_projects([instance.id])
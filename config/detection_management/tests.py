@@ -1,3 +1,302 @@
-from django.test import TestCase
+import io
+import os
+import shutil
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+import redis
+from django.core.files.storage import FileSystemStorage
+from django.db import DatabaseError
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from authentication.models import AppUser
+from project_management.models import Camera, FarmBoundary, Project, UserProjectRole
+from .bulk import save_detections_bulk
+from .incidents import record_incident_hit
+from .media import FSYNC_DIRECTORY, FSYNC_FILE, FSYNC_NONE, MediaWriter
+from .models import Detection, DetectionIncident, DetectionRollup, DetectionType
+from .registry import detection_type_registry
+from .tracking import IoUTracker
+from . import rollups, views
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class DashboardStatsQueryTests(TestCase):
+    def setUp(self):
+        self.user = AppUser.objects.create_user(username='owner', password='secret', user_type='supervisor')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        
+        self.detection_types = {
+            name: DetectionType.objects.create(name=name)
+            for name in ('fire', 'smoke', 'person')
+        }
+        self.project_count = 0
+    
+    def add_project(self, detections_per_type=1):
+        # Run the cache invalidations the writes below schedule on commit
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.create_project(detections_per_type)
+    
+    def create_project(self, detections_per_type):
+        self.project_count += 1
+        owner = AppUser.objects.create_user(
+            username=f'owner{self.project_count}', password='secret', user_type='supervisor'
+        )
+        project = Project.objects.create(name=f'Farm {self.project_count}', created_by=owner)
+        UserProjectRole.objects.create(user=self.user, project=project, role='client')
+        boundary = FarmBoundary.objects.create(project=project)
+        camera = Camera.objects.create(
+            project=project,
+            farm_boundary=boundary,
+            camera_type='cellular',
+            cellular_identifier=f'camera-{self.project_count}'
+        )
+        for detection_type in self.detection_types.values():
+            for _ in range(detections_per_type):
+                Detection.objects.create(
+                    camera=camera,
+                    detection_type=detection_type,
+                    confidence_score=0.9,
+                    bounding_boxes=[],
+                    image_original='test_original.jpg',
+                    image_annotated='test_annotated.jpg'
+                )
+        return camera
+    
+    def get_stats(self):
+        response = self.client.get(reverse('dashboard_stats'))
+        self.assertEqual(response.status_code, 200)
+        return response.json()['stats']
+    
+    def test_query_count_is_constant(self):
+        self.add_project()
+        detection_type_registry.ids('fire')  # Warm the type cache
+        
+        with self.assertNumQueries(3):
+            self.get_stats()
+        
+        for _ in range(3):
+            self.add_project(detections_per_type=2)
+        detection_type_registry.ids('fire')
+        
+        with self.assertNumQueries(3):
+            self.get_stats()
+    
+    def test_counts(self):
+        camera = self.add_project()
+        rollups.set_false_positive(
+            Detection.objects.filter(camera=camera, detection_type=self.detection_types['smoke']), True
+        )
+        Detection.objects.filter(camera=camera, detection_type=self.detection_types['person']).update(
+            detected_at=timezone.now() - timedelta(days=10)
+        )
+        rollups.rebuild()  # The update above bypasses the rollups
+        
+        stats = self.get_stats()
+        
+        self.assertEqual(stats['projects'], 1)
+        self.assertEqual(stats['cameras'], 1)
+        self.assertEqual(stats['total_detections'], 3)
+        self.assertEqual(stats['alerts'], 1)
+        self.assertEqual(stats['false_positives'], 1)
+        self.assertEqual(stats['time_periods']['week'], 2)
+        self.assertEqual(stats['time_periods']['month'], 3)
+        self.assertEqual(stats['detection_breakdown'], {'fire': 1, 'smoke': 1, 'person': 1, 'total': 3})
+    
+    def test_rollups_match_rebuild(self):
+        camera = self.add_project(detections_per_type=2)
+        rollups.set_false_positive(Detection.objects.filter(id=Detection.objects.filter(camera=camera).first().id), True)
+        rollups.delete_detections(Detection.objects.filter(
+            id=Detection.objects.filter(camera=camera, detection_type=self.detection_types['person']).first().id
+        ))
+        
+        incremental = self.get_stats()
+        with self.captureOnCommitCallbacks(execute=True):
+            rollups.rebuild()
+        self.assertEqual(self.get_stats(), incremental)
+        self.assertEqual(incremental['total_detections'], 5)
+        self.assertEqual(incremental['false_positives'], 1)
+    
+    def test_cached_until_detection_written(self):
+        camera = self.add_project()
+        detection_type_registry.ids('fire')
+        self.assertEqual(self.get_stats()['total_detections'], 3)
+        
+        # The project ids and the response both come from the cache
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get_stats()['total_detections'], 3)
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            Detection.objects.create(
+                camera=camera,
+                detection_type=self.detection_types['fire'],
+                confidence_score=0.9,
+                bounding_boxes=[],
+                image_original='test_original.jpg',
+                image_annotated='test_annotated.jpg'
+            )
+        self.assertEqual(self.get_stats()['total_detections'], 4)
+    
+    def test_project_ids_follow_role_changes(self):
+        self.add_project()
+        self.assertEqual(self.get_stats()['projects'], 1)
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            UserProjectRole.objects.filter(user=self.user).delete()
+        self.assertEqual(self.get_stats()['projects'], 0)
+    
+    def test_moved_camera_takes_its_history(self):
+        camera = self.add_project()
+        with self.captureOnCommitCallbacks(execute=True):
+            owner = AppUser.objects.create_user(username='other-owner', password='secret', user_type='supervisor')
+            other_project = Project.objects.create(name='Other Farm', created_by=owner)
+        
+        camera.project = other_project
+        camera.save()
+        
+        self.assertFalse(DetectionRollup.objects.exclude(project=other_project).exists())
+        self.assertEqual(
+            DetectionRollup.objects.filter(project=other_project).aggregate(total=rollups.detection_count())['total'], 3
+        )
+
+
+class IncidentTrackingTests(TestCase):
+    def setUp(self):
+        owner = AppUser.objects.create_user(username='owner', password='secret', user_type='supervisor')
+        project = Project.objects.create(name='Farm', created_by=owner)
+        self.camera = Camera.objects.create(
+            project=project,
+            farm_boundary=FarmBoundary.objects.create(project=project),
+            camera_type='cellular',
+            cellular_identifier='camera-1'
+        )
+        self.fire = detection_type_registry.get_or_create('fire')
+        self.start = timezone.now()
+    
+    def send_frame(self, seconds, boxes):
+        """Run one frame through the tracker and incident code as the ingestion view does"""
+        seen_at = self.start + timedelta(seconds=seconds)
+        with mock.patch('detection_management.tracking.time.time', return_value=seen_at.timestamp()), \
+                mock.patch('detection_management.incidents.timezone.now', return_value=seen_at):
+            if views.has_new_tracks(self.camera, 'fire', boxes):
+                return record_incident_hit(self.camera, self.fire, 0.9)
+    
+    @mock.patch('detection_management.tracking.get_redis', side_effect=redis.ConnectionError)
+    def test_continuing_tracks_keep_the_incident_open(self, get_redis):
+        box = {'x1': 100, 'y1': 100, 'x2': 200, 'y2': 200, 'confidence': 0.9}
+        other_box = {'x1': 400, 'y1': 400, 'x2': 500, 'y2': 500, 'confidence': 0.8}
+        
+        # Redis is unreachable so the tracker keeps its state in this fresh instance
+        with mock.patch.object(views, 'detection_tracker', IoUTracker()):
+            incident, opened, sample = self.send_frame(0, [dict(box)])
+            self.assertTrue(opened)
+            
+            # The same fire for well over the 120s incident gap, no new track and no new row
+            for seconds in range(10, 160, 10):
+                self.assertIsNone(self.send_frame(seconds, [dict(box)]))
+            
+            joined, opened, sample = self.send_frame(160, [dict(box), dict(other_box)])
+        
+        self.assertFalse(opened)
+        self.assertEqual(joined.id, incident.id)
+        self.assertEqual(DetectionIncident.objects.count(), 1)
+        
+        incident.refresh_from_db()
+        self.assertEqual(incident.hit_count, 17)
+        self.assertEqual(incident.last_seen_at, self.start + timedelta(seconds=160))
+        self.assertFalse(Detection.objects.exists())
+
+
+class MediaWriterTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        self.storage = FileSystemStorage(location=self.media_root)
+    
+    def field_file(self, name):
+        return SimpleNamespace(storage=self.storage, name=name)
+    
+    def test_submit_blocks_when_the_queue_is_full(self):
+        writer = MediaWriter(max_pending=2, workers=2, fsync_policy=FSYNC_NONE)
+        release = threading.Event()
+        
+        def slow_content():
+            release.wait(5)
+            return b'image'
+        
+        futures = [writer.submit(self.field_file(f'{index}.jpg'), slow_content) for index in range(2)]
+        third = threading.Thread(target=lambda: futures.append(writer.submit(self.field_file('2.jpg'), b'image')))
+        third.start()
+        third.join(0.2)
+        self.assertTrue(third.is_alive())
+        
+        release.set()
+        third.join(5)
+        self.assertFalse(third.is_alive())
+        self.assertEqual(sorted(future.result(5) for future in futures), ['0.jpg', '1.jpg', '2.jpg'])
+    
+    def test_fsync_policy(self):
+        for policy, fsyncs in ((FSYNC_NONE, 0), (FSYNC_FILE, 1), (FSYNC_DIRECTORY, 2)):
+            writer = MediaWriter(fsync_policy=policy)
+            with mock.patch('detection_management.media.os.fsync') as fsync:
+                writer.submit(self.field_file(f'{policy}.jpg'), b'image').result(5)
+            self.assertEqual(fsync.call_count, fsyncs, policy)
+
+
+class DetectionMediaCleanupTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=media_root, DETECTION_MEDIA_WAIT=True)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.media_root = media_root
+        
+        owner = AppUser.objects.create_user(username='owner', password='secret', user_type='supervisor')
+        project = Project.objects.create(name='Farm', created_by=owner)
+        self.camera = Camera.objects.create(
+            project=project,
+            farm_boundary=FarmBoundary.objects.create(project=project),
+            camera_type='cellular',
+            cellular_identifier='camera-1'
+        )
+    
+    def save_frame(self):
+        box = {'x1': 0, 'y1': 0, 'x2': 2, 'y2': 2, 'confidence': 0.9}
+        return save_detections_bulk(
+            self.camera, [('fire', [box], np.zeros((4, 4, 3), dtype=np.uint8))], io.BytesIO(b'original')
+        )
+    
+    def stored_files(self):
+        return [name for _, _, names in os.walk(self.media_root) for name in names]
+    
+    def wait_for_no_files(self):
+        # Rolled-back files are deleted in the background once their writes finish
+        deadline = time.monotonic() + 5
+        while self.stored_files() and time.monotonic() < deadline:
+            time.sleep(0.05)
+        return self.stored_files()
+    
+    def test_failed_write_marks_the_row_and_removes_the_other_image(self):
+        with mock.patch('detection_management.bulk.encode_jpeg', side_effect=OSError('No space left on device')):
+            detection, = self.save_frame()
+        
+        self.assertEqual(Detection.objects.get(id=detection.id).media_status, 'failed')
+        self.assertEqual(self.stored_files(), [])
+    
+    def test_rolled_back_insert_removes_its_images(self):
+        with mock.patch.object(Detection.objects, 'bulk_create', side_effect=DatabaseError('insert failed')):
+            with self.assertRaises(DatabaseError):
+                self.save_frame()
+        
+        self.assertFalse(Detection.objects.exists())
+        self.assertEqual(self.wait_for_no_files(), [])
@@ -0,0 +1,121 @@
+import json
+import time
+
+import redis
+from django.conf import settings
+
+from utils.redis_client import get_redis
+
+
+def box_iou(box_a, box_b):
+    """Intersection over union of two boxes in x1/y1/x2/y2 format"""
+    inter_x1 = max(box_a['x1'], box_b['x1'])
+    inter_y1 = max(box_a['y1'], box_b['y1'])
+    inter_x2 = min(box_a['x2'], box_b['x2'])
+    inter_y2 = min(box_a['y2'], box_b['y2'])
+    
+    inter_area = max(0.0, inter_x2 - inter_x1) * max(0.0, inter_y2 - inter_y1)
+    if inter_area == 0:
+        return 0.0
+    
+    area_a = (box_a['x2'] - box_a['x1']) * (box_a['y2'] - box_a['y1'])
+    area_b = (box_b['x2'] - box_b['x1']) * (box_b['y2'] - box_b['y1'])
+    union = area_a + area_b - inter_area
+    return inter_area / union if union > 0 else 0.0
+
+
+def greedy_match(tracks, boxes, iou_threshold):
+    """
+    Match boxes to tracks by descending IoU, each track and box used once.
+    Returns a dict of box index -> track index.
+    """
+    candidates = []
+    for track_index, track in enumerate(tracks):
+        for box_index, box in enumerate(boxes):
+            iou = box_iou(track['box'], box)
+            if iou >= iou_threshold:
+                candidates.append((iou, track_index, box_index))
+    
+    candidates.sort(reverse=True)
+    
+    matches = {}
+    used_tracks = set()
+    for iou, track_index, box_index in candidates:
+        if track_index in used_tracks or box_index in matches:
+            continue
+        matches[box_index] = track_index
+        used_tracks.add(track_index)
+    
+    return matches
+
+
+class IoUTracker:
+    """
+    Lightweight multi-object tracker keyed per camera and detection type.
+    Track state lives in Redis so every worker sees the same tracks, with a
+    process-local fallback when Redis is unreachable.
+    """
+    
+    key_prefix = 'tracker'
+    
+    def __init__(self, iou_threshold=None, max_age=None):
+        self.iou_threshold = iou_threshold if iou_threshold is not None else getattr(settings, 'TRACKER_IOU_THRESHOLD', 0.3)
+        self.max_age = max_age if max_age is not None else getattr(settings, 'TRACKER_MAX_AGE_SECONDS', 15)
+        self._local_state = {}
+        self._local_next_id = 0
+    
+    def get_state_key(self, camera_id, detection_type):
+        return f"{self.key_prefix}:camera:{camera_id}:{detection_type}"
+    
+    def update(self, camera_id, detection_type, boxes, now=None):
+        """
+        Assign a `track_id` to every box and update the camera's tracks.
+        Returns the boxes that started a new track.
+        """
+        now = now or time.time()
+        key = self.get_state_key(camera_id, detection_type)
+        
+        try:
+            client = get_redis()
+            with client.lock(f"{key}:lock", timeout=5, blocking_timeout=2):
+                tracks = json.loads(client.get(key) or '[]')
+                new_boxes = self._step(tracks, boxes, now, lambda: client.incr(f"{self.key_prefix}:next_id"))
+                client.set(key, json.dumps(tracks), ex=self.max_age)
+        except redis.RedisError as e:
+            print(f"❌ Tracker state unavailable in Redis, using local state: {e}")
+            tracks = self._local_state.get(key, [])
+            new_boxes = self._step(tracks, boxes, now, self._next_local_id)
+            self._local_state[key] = tracks
+        
+        return new_boxes
+    
+    def _next_local_id(self):
+        self._local_next_id += 1
+        return f"local-{self._local_next_id}"
+    
+    def _step(self, tracks, boxes, now, next_id):
+        """Advance `tracks` in place with the boxes of one frame"""
+        tracks[:] = [track for track in tracks if now - track['last_seen'] <= self.max_age]
+        matches = greedy_match(tracks, boxes, self.iou_threshold)
+        
+        new_boxes = []
+        for box_index, box in enumerate(boxes):
+            coords = {k: box[k] for k in ('x1', 'y1', 'x2', 'y2')}
+            
+            if box_index in matches:
+                track = tracks[matches[box_index]]
+                track['box'] = coords
+                track['last_seen'] = now
+                track['hits'] += 1
+            else:
+                track = {'track_id': next_id(), 'box': coords, 'last_seen': now, 'hits': 1}
+                tracks.append(track)
+                new_boxes.append(box)
+            
+            box['track_id'] = track['track_id']
+        
+        return new_boxes
+
+
+# Shared tracker instance used by the ingestion views
+detection_tracker = IoUTracker()
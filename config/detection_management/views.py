@@ -1,8 +1,7 @@
 # Python standard library
 import json
 import os
-import io
-from datetime import datetime, timedelta
+from datetime import timedelta
 
 # Third-party libraries
 import cv2
@@ -15,14 +14,18 @@ from django.http import JsonResponse
 from django.contrib.auth.decorators import login_required
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods, require_POST
-from django.core.files.base import ContentFile
 from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
 from django.db.models import Q
 from django.utils import timezone
 
 # Local app imports
 from project_management.models import Project, Camera, UserProjectRole
-from .models import Detection, DetectionType
+from .models import Detection, DetectionRollup
+from .tracking import detection_tracker
+from .bulk import save_detections_bulk
+from .incidents import refresh_incident
+from .registry import detection_type_registry
+from . import rollups
 
 
 # Load AI models (initialize once)
@@ -145,58 +148,33 @@ def annotate_image(image_array, detections, detection_type):
 
 
 def save_detection(camera, detection_type_name, detections, original_image, annotated_image):
-    """Save detection to database"""
+    """Save detection to database, returns None when the frame is folded into an open incident"""
     print(f"Saving {detection_type_name} detection to database...")
     
-    # Get or create detection type
-    detection_type, created = DetectionType.objects.get_or_create(
-        name=detection_type_name,
-        defaults={'description': f'{detection_type_name.title()} detection'}
-    )
-    
-    if created:
-        print(f"Created new detection type: {detection_type_name}")
-    
-    # Calculate average confidence
-    avg_confidence = sum(d['confidence'] for d in detections) / len(detections) if detections else 0
-    print(f"Average confidence: {avg_confidence}")
-    
-    # Create detection record
-    detection = Detection(
-        camera=camera,
-        detection_type=detection_type,
-        confidence_score=avg_confidence,
-        bounding_boxes=detections
-    )
-    
-    # Save original image
-    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-    original_filename = f"camera_{camera.id}_{detection_type_name}_{timestamp}_original.jpg"
-    print(f"Saving original image as: {original_filename}")
-    
-    detection.image_original.save(original_filename, original_image, save=False)
-    
-    # Save annotated image
-    annotated_pil = Image.fromarray(annotated_image)
-    annotated_buffer = io.BytesIO()
-    annotated_pil.save(annotated_buffer, format='JPEG')
-    annotated_buffer.seek(0)
-    
-    annotated_filename = f"camera_{camera.id}_{detection_type_name}_{timestamp}_annotated.jpg"
-    print(f"Saving annotated image as: {annotated_filename}")
-    
-    detection.image_annotated.save(
-        annotated_filename,
-        ContentFile(annotated_buffer.getvalue()),
-        save=False
-    )
-    
-    detection.save()
+    saved = save_detections_bulk(camera, [(detection_type_name, detections, annotated_image)], original_image)
+    if not saved:
+        return None
+    
+    detection = saved[0]
     print(f"✅ Detection saved to database with ID: {detection.id}")
     
     return detection
 
 
+def has_new_tracks(camera, detection_type_name, detections):
+    """
+    Update the camera tracks and tell whether any box started a new track.
+    Frames that only continue tracks still count as a hit on the open incident.
+    """
+    new_boxes = detection_tracker.update(camera.id, detection_type_name, detections)
+    if not new_boxes:
+        print(f"↪️ {len(detections)} {detection_type_name} boxes continue existing tracks, nothing to save")
+        detection_type = detection_type_registry.get_or_create(detection_type_name)
+        avg_confidence = sum(d['confidence'] for d in detections) / len(detections)
+        refresh_incident(camera, detection_type, avg_confidence)
+    return bool(new_boxes)
+
+
 def get_camera_by_identifier(camera_id=None, ip_port=None, cellular_id=None):
     """Get camera by different identifier types"""
     camera = None
@@ -238,8 +216,13 @@ def get_camera_by_identifier(camera_id=None, ip_port=None, cellular_id=None):
 
 
 def process_fire_smoke_detection(image_array, camera, image_file):
-    """Process fire and smoke detection using FireShield model"""
+    """
+    Process fire and smoke detection using FireShield model.
+    Returns (detections_created, fire_smoke_seen), frames that only continue
+    existing tracks or an open incident count as seen even though no new row is created.
+    """
     detections_created = []
+    fire_smoke_seen = False
     
     print("\n--- FIRE & SMOKE DETECTION ---")
     if fire_model:
@@ -262,21 +245,20 @@ def process_fire_smoke_detection(image_array, camera, image_file):
                 elif detection_type == 'smoke':
                     smoke_only.append(detection)
             
-            # Save fire detections
-            if fire_only:
-                annotated_image = annotate_image(image_array, fire_only, 'fire')
-                detection = save_detection(camera, 'fire', fire_only, image_file, annotated_image)
-                detections_created.append(detection.id)
-                print(f"✅ Fire detection saved with ID: {detection.id}")
+            # Collect fire and smoke detections, then save them in one write
+            groups = []
+            if fire_only and has_new_tracks(camera, 'fire', fire_only):
+                groups.append(('fire', fire_only, annotate_image(image_array, fire_only, 'fire')))
+            
+            if smoke_only and has_new_tracks(camera, 'smoke', smoke_only):
+                groups.append(('smoke', smoke_only, annotate_image(image_array, smoke_only, 'smoke')))
             
-            # Save smoke detections
-            if smoke_only:
-                annotated_image = annotate_image(image_array, smoke_only, 'smoke')
-                detection = save_detection(camera, 'smoke', smoke_only, image_file, annotated_image)
-                detections_created.append(detection.id)
-                print(f"✅ Smoke detection saved with ID: {detection.id}")
+            if groups:
+                saved = save_detections_bulk(camera, groups, image_file)
+                detections_created.extend(detection.id for detection in saved)
             
-            if not fire_only and not smoke_only:
+            fire_smoke_seen = bool(fire_only or smoke_only)
+            if not fire_smoke_seen:
                 print("❌ No fire or smoke detected")
                 
         except Exception as e:
@@ -298,17 +280,16 @@ def process_fire_smoke_detection(image_array, camera, image_file):
             'confidence': 0.75, 'class': 1
         }]
         
-        annotated_image = annotate_image(image_array, dummy_fire, 'fire')
-        detection = save_detection(camera, 'fire', dummy_fire, image_file, annotated_image)
-        detections_created.append(detection.id)
-        
-        annotated_image = annotate_image(image_array, dummy_smoke, 'smoke')
-        detection = save_detection(camera, 'smoke', dummy_smoke, image_file, annotated_image)
-        detections_created.append(detection.id)
+        saved = save_detections_bulk(camera, [
+            ('fire', dummy_fire, annotate_image(image_array, dummy_fire, 'fire')),
+            ('smoke', dummy_smoke, annotate_image(image_array, dummy_smoke, 'smoke')),
+        ], image_file)
+        detections_created.extend(detection.id for detection in saved)
         
+        fire_smoke_seen = True
         print(f"✅ Dummy fire and smoke detections created")
     
-    return detections_created
+    return detections_created, fire_smoke_seen
 
 
 def process_person_detection(image_array, camera, image_file):
@@ -337,12 +318,13 @@ def process_person_detection(image_array, camera, image_file):
             
             print(f"Filtered person detections: {len(person_detections)}")
             
-            if person_detections:
+            if person_detections and has_new_tracks(camera, 'person', person_detections):
                 annotated_image = annotate_image(image_array, person_detections, 'person')
                 detection = save_detection(camera, 'person', person_detections, image_file, annotated_image)
-                detections_created.append(detection.id)
-                print(f"✅ Person detection saved with ID: {detection.id}")
-            else:
+                if detection:
+                    detections_created.append(detection.id)
+                    print(f"✅ Person detection saved with ID: {detection.id}")
+            elif not person_detections:
                 print("❌ No person detected")
                 
         except Exception as e:
@@ -407,16 +389,16 @@ def receive_image(request):
         detections_created = []
 
         # Process fire and smoke detection FIRST
-        fire_smoke_detections = process_fire_smoke_detection(image_array, camera, image_file)
+        fire_smoke_detections, fire_smoke_seen = process_fire_smoke_detection(image_array, camera, image_file)
         detections_created.extend(fire_smoke_detections)
 
         # Only process person detection if NO fire/smoke was detected
-        if len(fire_smoke_detections) == 0:
+        if not fire_smoke_seen:
             print("No fire/smoke detected, proceeding with person detection...")
             person_detections = process_person_detection(image_array, camera, image_file)
             detections_created.extend(person_detections)
         else:
-            print(f"Fire/smoke detected ({len(fire_smoke_detections)} detections), skipping person detection for safety")
+            print(f"Fire/smoke detected ({len(fire_smoke_detections)} new detections), skipping person detection for safety")
 
         print(f"\n=== FINAL RESULT ===")
         print(f"Camera: {camera}")
@@ -427,8 +409,8 @@ def receive_image(request):
             'camera_id': camera.id,
             'camera_type': camera.camera_type,
             'detections_created': detections_created,
-            'fire_smoke_detected': len(fire_smoke_detections) > 0,
-            'person_detection_skipped': len(fire_smoke_detections) > 0,
+            'fire_smoke_detected': fire_smoke_seen,
+            'person_detection_skipped': fire_smoke_seen,
             'message': f'Processed {len(detections_created)} detections for {camera.get_camera_type_display()}'
         })
         
@@ -481,17 +463,18 @@ def detection_dashboard(request):
                 'project': camera.project
             })
     
-    # Get detection statistics for filtered cameras
+    # Get detection statistics for filtered cameras from the hourly rollups
     if selected_project:
-        all_detections = Detection.objects.filter(camera__project=selected_project)
+        detection_rollups = DetectionRollup.objects.filter(project=selected_project)
     else:
-        all_detections = Detection.objects.filter(camera__project__in=user_projects)
+        detection_rollups = DetectionRollup.objects.filter(project__in=user_projects)
+    counts = rollups.summarize(detection_rollups)
     
     stats = {
-        'total_detections': all_detections.count(),
-        'fire_detections': all_detections.filter(detection_type__name='fire').count(),
-        'smoke_detections': all_detections.filter(detection_type__name='smoke').count(),
-        'person_detections': all_detections.filter(detection_type__name='person').count(),
+        'total_detections': counts['total'],
+        'fire_detections': counts['fire'],
+        'smoke_detections': counts['smoke'],
+        'person_detections': counts['person'],
         'total_cameras': user_cameras.count()
     }
     
@@ -522,7 +505,7 @@ def camera_detections(request, camera_id):
     
     # Apply filters
     if detection_type:
-        detections_queryset = detections_queryset.filter(detection_type__name=detection_type)
+        detections_queryset = detections_queryset.filter(detection_type_id=detection_type_registry.get_id(detection_type))
     
     if status_filter == 'valid':
         detections_queryset = detections_queryset.filter(is_false_positive=False)
@@ -553,9 +536,12 @@ def camera_detections(request, camera_id):
         detections = paginator.page(paginator.num_pages)
     
     # Get detection type choices for filter dropdown
-    detection_types = Detection.objects.filter(
-        camera=camera
-    ).values_list('detection_type__name', flat=True).distinct()
+    detection_types = [
+        detection_type_registry.get_name(detection_type_id)
+        for detection_type_id in Detection.objects.filter(
+            camera=camera
+        ).values_list('detection_type_id', flat=True).distinct()
+    ]
     
     # Calculate summary stats for the camera
     total_detections = Detection.objects.filter(camera=camera).count()
@@ -595,7 +581,7 @@ def mark_false_positive(request, detection_id):
         )
         
         detection.is_false_positive = not detection.is_false_positive
-        detection.save()
+        rollups.set_false_positive(Detection.objects.filter(id=detection.id), detection.is_false_positive)
         
         status_text = "false positive" if detection.is_false_positive else "valid"
         message = f"Detection marked as {status_text}."
@@ -623,7 +609,7 @@ def apply_detection_filters(detections, search_query, detection_type, status, da
         )
     
     if detection_type:
-        detections = detections.filter(detection_type__name=detection_type)
+        detections = detections.filter(detection_type_id=detection_type_registry.get_id(detection_type))
     
     if status == 'valid':
         detections = detections.filter(is_false_positive=False)
@@ -716,9 +702,9 @@ def detection_by_camera(request, camera_id):
     # Get detection statistics for this camera
     stats = {
         'total_detections': detections.count(),
-        'fire_detections': detections.filter(detection_type__name='fire').count(),
-        'smoke_detections': detections.filter(detection_type__name='smoke').count(),
-        'person_detections': detections.filter(detection_type__name='person').count(),
+        'fire_detections': detections.filter(detection_type_id=detection_type_registry.get_id('fire')).count(),
+        'smoke_detections': detections.filter(detection_type_id=detection_type_registry.get_id('smoke')).count(),
+        'person_detections': detections.filter(detection_type_id=detection_type_registry.get_id('person')).count(),
         'false_positives': detections.filter(is_false_positive=True).count(),
     }
     
@@ -743,37 +729,41 @@ def detection_statistics(request):
         camera__project__in=user_projects
     ).select_related('camera', 'camera__project', 'detection_type')
     
-    # Calculate statistics
+    # Calculate statistics from the hourly rollups
     now = timezone.now()
+    detection_rollups = DetectionRollup.objects.filter(project__in=user_projects)
+    counts = rollups.summarize(detection_rollups, windows={
+        'today': now.replace(hour=0, minute=0, second=0, microsecond=0),
+        'week': now - timedelta(days=7),
+        'month': now - timedelta(days=30),
+    })
     stats = {
-        'total_detections': all_detections.count(),
-        'fire_detections': all_detections.filter(detection_type__name='fire').count(),
-        'smoke_detections': all_detections.filter(detection_type__name='smoke').count(),
-        'person_detections': all_detections.filter(detection_type__name='person').count(),
-        'false_positives': all_detections.filter(is_false_positive=True).count(),
-        'valid_detections': all_detections.filter(is_false_positive=False).count(),
-        'today_detections': all_detections.filter(
-            detected_at__gte=now.replace(hour=0, minute=0, second=0, microsecond=0)
-        ).count(),
-        'week_detections': all_detections.filter(
-            detected_at__gte=now - timedelta(days=7)
-        ).count(),
-        'month_detections': all_detections.filter(
-            detected_at__gte=now - timedelta(days=30)
-        ).count(),
+        'total_detections': counts['total'],
+        'fire_detections': counts['fire'],
+        'smoke_detections': counts['smoke'],
+        'person_detections': counts['person'],
+        'false_positives': counts['false_positives'],
+        'valid_detections': counts['valid'],
+        'today_detections': counts['today'],
+        'week_detections': counts['week'],
+        'month_detections': counts['month'],
     }
     
-    # Get detections by project
+    # Get detections by project, one grouped query for all of them
+    counts_by_project = {
+        row['project_id']: row
+        for row in detection_rollups.values('project_id').annotate(**rollups.build_aggregates()).order_by()
+    }
     project_stats = []
     for project in user_projects:
-        project_detections = all_detections.filter(camera__project=project)
+        project_counts = counts_by_project.get(project.id, {})
         project_stats.append({
             'project': project,
-            'total': project_detections.count(),
-            'fire': project_detections.filter(detection_type__name='fire').count(),
-            'smoke': project_detections.filter(detection_type__name='smoke').count(),
-            'person': project_detections.filter(detection_type__name='person').count(),
-            'false_positives': project_detections.filter(is_false_positive=True).count(),
+            'total': project_counts.get('total', 0),
+            'fire': project_counts.get('fire', 0),
+            'smoke': project_counts.get('smoke', 0),
+            'person': project_counts.get('person', 0),
+            'false_positives': project_counts.get('false_positives', 0),
         })
     
     # Get recent detections for activity feed
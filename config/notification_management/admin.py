@@ -1,5 +1,7 @@
 from django.contrib import admin
-from .models import Notification, FCMToken
+from django.utils import timezone
+from .models import Notification, FCMToken, PushOutbox
+from .outbox import stuck_deliveries_filter
 
 @admin.register(Notification)
 class NotificationAdmin(admin.ModelAdmin):
@@ -16,4 +18,42 @@ class NotificationAdmin(admin.ModelAdmin):
 class FCMTokenAdmin(admin.ModelAdmin):
     list_display = ['user', 'token', 'created_at']
     search_fields = ['user__username', 'token']
-    readonly_fields = ['created_at']
\ No newline at end of file
+    readonly_fields = ['created_at']
+
+class StuckDeliveryFilter(admin.SimpleListFilter):
+    title = 'delivery health'
+    parameter_name = 'health'
+    
+    def lookups(self, request, model_admin):
+        return [('stuck', 'Stuck'), ('dead', 'Dead letter')]
+    
+    def queryset(self, request, queryset):
+        if self.value() == 'stuck':
+            return queryset.filter(stuck_deliveries_filter())
+        if self.value() == 'dead':
+            return queryset.filter(status='dead')
+        return queryset
+
+@admin.register(PushOutbox)
+class PushOutboxAdmin(admin.ModelAdmin):
+    list_display = ['idempotency_key', 'user', 'status', 'attempts', 'priority', 'next_attempt_at', 'last_error', 'created_at']
+    list_filter = [StuckDeliveryFilter, 'status', 'priority', 'requires_ack', 'created_at']
+    search_fields = ['idempotency_key', 'user__username', 'token', 'last_error']
+    readonly_fields = ['created_at', 'updated_at', 'sent_at']
+    raw_id_fields = ['user', 'detection', 'notification']
+    actions = ['retry_now', 'move_to_dead_letter']
+    
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('user')
+    
+    @admin.action(description='Retry selected deliveries now')
+    def retry_now(self, request, queryset):
+        updated = queryset.exclude(status='sent').update(
+            status='retrying', attempts=0, next_attempt_at=timezone.now(), last_error=''
+        )
+        self.message_user(request, f'{updated} deliveries queued for retry')
+    
+    @admin.action(description='Move selected deliveries to dead letter')
+    def move_to_dead_letter(self, request, queryset):
+        updated = queryset.exclude(status__in=['sent', 'skipped']).update(status='dead')
+        self.message_user(request, f'{updated} deliveries moved to dead letter')
@@ -0,0 +1,78 @@
+import redis
+from django.conf import settings
+
+from utils.redis_client import get_redis
+
+
+def get_coalesce_window(detection_type_name):
+    """Seconds during which further detections of this type on one camera are folded into a digest"""
+    return getattr(settings, 'NOTIFICATION_COALESCE_WINDOWS', {}).get(detection_type_name, 0)
+
+
+def get_window_key(camera_id, detection_type_name):
+    # Holds the id of the detection whose notifications collect the digest
+    return f"coalesce:{camera_id}:{detection_type_name}"
+
+
+def get_pending_key(camera_id, detection_type_name):
+    # Number of detections folded into the open window and not announced yet
+    return f"coalesce:{camera_id}:{detection_type_name}:pending"
+
+
+def open_window(detection):
+    """
+    Start the digest window of a detection that opened an incident. Returns
+    the window in seconds, after which the caller flushes the digest, or 0
+    when coalescing is disabled for the type.
+    """
+    detection_type_name = detection.detection_type.name
+    window = get_coalesce_window(detection_type_name)
+    if not window:
+        return 0
+    
+    try:
+        pipe = get_redis().pipeline()
+        pipe.set(get_window_key(detection.camera_id, detection_type_name), detection.id, ex=window)
+        pipe.delete(get_pending_key(detection.camera_id, detection_type_name))
+        pipe.execute()
+        return window
+    except redis.RedisError as e:
+        print(f"❌ Notification coalescing unavailable, later frames stay silent: {e}")
+        return 0
+
+
+def join_window(detection, incident_detection_id):
+    """
+    Count a detection continuing an incident into the pending digest of its
+    camera and type. Returns the window in seconds when no window was open and
+    this detection opened one, the caller then schedules its flush, 0 otherwise.
+    """
+    detection_type_name = detection.detection_type.name
+    window = get_coalesce_window(detection_type_name)
+    if not window:
+        return 0
+    
+    pending_key = get_pending_key(detection.camera_id, detection_type_name)
+    try:
+        pipe = get_redis().pipeline()
+        pipe.incr(pending_key)
+        pipe.expire(pending_key, window * 2)
+        pipe.set(get_window_key(detection.camera_id, detection_type_name), incident_detection_id, nx=True, ex=window)
+        _, _, opened = pipe.execute()
+        return window if opened else 0
+    except redis.RedisError as e:
+        print(f"❌ Could not count coalesced detection {detection.id}: {e}")
+        return 0
+
+
+def pop_pending_count(camera_id, detection_type_name):
+    """Get and reset the number of detections folded into the window, and close it"""
+    try:
+        pipe = get_redis().pipeline()
+        pipe.getdel(get_pending_key(camera_id, detection_type_name))
+        pipe.delete(get_window_key(camera_id, detection_type_name))
+        pending, _ = pipe.execute()
+        return int(pending or 0)
+    except redis.RedisError as e:
+        print(f"❌ Could not read coalesced detections: {e}")
+        return 0
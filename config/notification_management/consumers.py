@@ -1,72 +1,191 @@
+import asyncio
 import json
+import redis
+from urllib.parse import parse_qs
+from asgiref.sync import sync_to_async
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
-from django.contrib.auth.models import AnonymousUser
-from rest_framework_simplejwt.tokens import UntypedToken
-from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
-from django.contrib.auth import get_user_model
-from .models import Notification
-
-User = get_user_model()
+from django.utils.dateparse import parse_datetime
+from authentication.tokens import authenticate_access_token
+from .fanout import get_member_project_ids
+from .groups import get_project_group_name, get_user_group_name
+from . import presence, read_state, replay, unread
 
 class NotificationConsumer(AsyncWebsocketConsumer):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Read marks buffered until the next flush
+        self.pending_read_ids = set()
+        self.pending_read_up_to = None
+        self.read_flush_task = None
+    
     async def connect(self):
-        # Get token from query string
-        token = self.scope['query_string'].decode().split('token=')[-1]
+        # Get token and replay cursor from query string
+        params = parse_qs(self.scope['query_string'].decode())
+        token = params.get('token', [''])[0]
         
-        # Authenticate user
-        user = await self.get_user_from_token(token)
-        if user and user.is_authenticated:
+        # Authenticate from the token claims alone, no users table lookup
+        user = await sync_to_async(authenticate_access_token)(token)
+        if user is not None:
             self.user = user
-            self.group_name = f"notifications_{user.id}"
+            self.group_name = get_user_group_name(user.id)
             
-            # Join notification group
-            await self.channel_layer.group_add(
-                self.group_name,
-                self.channel_name
-            )
+            # Join the user's own group and one group per project the user is
+            # notified for, detections are broadcast once per project
+            self.group_names = [self.group_name]
+            await self.channel_layer.group_add(self.group_name, self.channel_name)
+            await self.join_project_groups()
             await self.accept()
+            await self.update_presence(presence.mark_online)
+            await self.unread_count({'unread_count': await self.get_unread_count()})
+            
+            # Groups are joined first so nothing falls between replay and live
+            # messages, clients drop duplicates by id
+            last_id, since = self.get_replay_cursor(params)
+            if last_id is not None or since is not None:
+                await self.replay_missed(last_id, since)
         else:
             await self.close()
     
     async def disconnect(self, close_code):
-        if hasattr(self, 'group_name'):
+        if self.read_flush_task:
+            self.read_flush_task.cancel()
+            await self.flush_read_marks()
+        
+        for group_name in getattr(self, 'group_names', []):
             await self.channel_layer.group_discard(
-                self.group_name,
+                group_name,
                 self.channel_name
             )
+        if hasattr(self, 'user'):
+            await self.update_presence(presence.mark_offline)
     
     async def receive(self, text_data):
-        # Handle mark as read requests
+        # Handle mark as read, heartbeat and acknowledgement messages
         try:
             data = json.loads(text_data)
-            if data.get('action') == 'mark_read':
-                notification_id = data.get('notification_id')
-                await self.mark_notification_read(notification_id)
-        except json.JSONDecodeError:
+            action = data.get('action')
+            if action == 'mark_read':
+                self.buffer_read_marks(*read_state.parse_read_request(data))
+            elif action == 'heartbeat':
+                await self.update_presence(presence.mark_online)
+            elif action == 'ack' and data.get('detection_id'):
+                await sync_to_async(presence.acknowledge)(self.user.id, data['detection_id'])
+        except (json.JSONDecodeError, TypeError, ValueError):
             pass
+        except redis.RedisError as e:
+            print(f"❌ Presence update failed for user {self.user.id}: {e}")
+    
+    async def join_project_groups(self):
+        """Match the joined project groups to the projects the user is an active member of now"""
+        project_group_names = {
+            get_project_group_name(project_id) for project_id in await self.get_member_project_ids()
+        }
+        joined = set(self.group_names[1:])
+        
+        for group_name in project_group_names - joined:
+            await self.channel_layer.group_add(group_name, self.channel_name)
+        for group_name in joined - project_group_names:
+            await self.channel_layer.group_discard(group_name, self.channel_name)
+        self.group_names = [self.group_name, *sorted(project_group_names)]
+    
+    async def projects_changed(self, event):
+        # A role or project of this user changed, sent through the user's group
+        await self.join_project_groups()
+    
+    async def update_presence(self, update):
+        try:
+            await sync_to_async(update)(self.user.id, self.channel_name)
+        except redis.RedisError as e:
+            print(f"❌ Presence update failed for user {self.user.id}: {e}")
+    
+    def get_replay_cursor(self, params):
+        """Read `last_id` (notification id) or `since` (ISO datetime or epoch seconds)"""
+        last_id = params.get('last_id', [None])[0]
+        since = params.get('since', [None])[0]
+        
+        try:
+            last_id = int(last_id) if last_id else None
+        except ValueError:
+            last_id = None
+        
+        try:
+            parsed = parse_datetime(since) if since else None
+            since = parsed.timestamp() if parsed else float(since) if since else None
+        except ValueError:
+            since = None
+        
+        return last_id, since
+    
+    async def replay_missed(self, last_id, since):
+        payloads, source, truncated = await database_sync_to_async(replay.get_missed_notifications)(
+            self.user.id, last_id=last_id, since=since
+        )
+        for payload in payloads:
+            await self.send(text_data=json.dumps(payload, default=str))
+        
+        # Tells the client the replay is over, with `truncated` it should page through the REST list
+        await self.send(text_data=json.dumps({
+            'notification_type': 'replay_complete',
+            'count': len(payloads),
+            'source': source,
+            'truncated': truncated,
+        }))
+    
+    def buffer_read_marks(self, ids, up_to_id):
+        """Queue read marks, they are written together at the end of the flush interval"""
+        self.pending_read_ids.update(ids)
+        if up_to_id is not None:
+            self.pending_read_up_to = max(up_to_id, self.pending_read_up_to or 0)
+        
+        if self.read_flush_task is None and (self.pending_read_ids or self.pending_read_up_to is not None):
+            self.read_flush_task = asyncio.ensure_future(self.flush_read_marks_later())
+    
+    async def flush_read_marks_later(self):
+        await asyncio.sleep(read_state.get_flush_interval())
+        self.read_flush_task = None
+        await self.flush_read_marks()
+    
+    async def flush_read_marks(self):
+        ids, up_to_id = self.pending_read_ids, self.pending_read_up_to
+        self.pending_read_ids, self.pending_read_up_to = set(), None
+        if not ids and up_to_id is None:
+            return
+        
+        try:
+            updated, unread_count = await self.write_read_marks(ids, up_to_id)
+        except Exception as e:
+            print(f"❌ Marking notifications read failed for user {self.user.id}: {e}")
+            return
+        
+        # Every connection of the user updates its badge, including this one
+        await self.channel_layer.group_send(
+            self.group_name,
+            {'type': 'unread_count', 'unread_count': unread_count, 'marked_read': updated}
+        )
+    
+    @database_sync_to_async
+    def write_read_marks(self, ids, up_to_id):
+        updated = read_state.mark_read(self.user.id, ids=ids, up_to_id=up_to_id)
+        return updated, unread.get_unread_count(self.user.id)
+    
+    async def unread_count(self, event):
+        await self.send(text_data=json.dumps({
+            'notification_type': 'unread_count',
+            'unread_count': event['unread_count'],
+        }))
     
     async def notification_message(self, event):
-        # Send notification to WebSocket
+        # Send notification to WebSocket, the event is shared by the whole
+        # project, the new badge count follows as an unread_count message
         await self.send(text_data=json.dumps(event['notification']))
     
     @database_sync_to_async
-    def get_user_from_token(self, token):
-        try:
-            UntypedToken(token)
-            from rest_framework_simplejwt.authentication import JWTAuthentication
-            jwt_auth = JWTAuthentication()
-            validated_token = jwt_auth.get_validated_token(token)
-            user = jwt_auth.get_user(validated_token)
-            return user
-        except (InvalidToken, TokenError):
-            return AnonymousUser()
+    def get_unread_count(self):
+        return unread.get_unread_count(self.user.id)
     
     @database_sync_to_async
-    def mark_notification_read(self, notification_id):
-        try:
-            notification = Notification.objects.get(id=notification_id, user=self.user)
-            notification.is_read = True
-            notification.save()
-        except Notification.DoesNotExist:
-            pass
\ No newline at end of file
+    def get_member_project_ids(self):
+        # The same members fanout.get_project_recipients notifies, so every
+        # socket in a project group has its own Notification row
+        return get_member_project_ids(self.user.id)
@@ -0,0 +1,183 @@
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+from django.conf import settings
+from django.db import close_old_connections
+
+# Lanes from highest to lowest priority
+LANE_CRITICAL = 'critical'
+LANE_NORMAL = 'normal'
+LANE_SYSTEM = 'system'
+LANES = [LANE_CRITICAL, LANE_NORMAL, LANE_SYSTEM]
+
+# Latency samples kept per lane for the metrics
+LATENCY_SAMPLES = 1000
+
+
+def get_lane_for_detection_type(detection_type_name):
+    """Lane serving notifications of this detection type"""
+    return getattr(settings, 'NOTIFICATION_LANE_TYPES', {}).get(detection_type_name, LANE_SYSTEM)
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class LaneStats:
+    """Counters and recent end-to-end latencies of one lane"""
+    
+    def __init__(self):
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.latencies = deque(maxlen=LATENCY_SAMPLES)
+    
+    def as_dict(self, queued):
+        latencies = sorted(self.latencies)
+        return {
+            'queued': queued,
+            'submitted': self.submitted,
+            'completed': self.completed,
+            'failed': self.failed,
+            'latency_seconds': {
+                'samples': len(latencies),
+                'p50': percentile(latencies, 0.5),
+                'p95': percentile(latencies, 0.95),
+                'max': latencies[-1] if latencies else None,
+            },
+        }
+
+
+class NotificationDispatcher:
+    """
+    Run notification fanout on background threads so the request that saved
+    a detection never waits on database inserts, channel layer or Firebase calls.
+    
+    Work is queued in priority lanes. Every lane has its own worker budget and
+    a worker always takes the highest-priority task it is allowed to serve:
+    critical workers only serve the critical lane, normal workers serve
+    critical before normal, and system workers serve everything in priority
+    order. Fire and smoke therefore never wait behind person or system work,
+    and can use every worker when they burst.
+    """
+    
+    def __init__(self, lane_workers=None):
+        self.lane_workers = lane_workers or getattr(settings, 'NOTIFICATION_LANE_WORKERS', {
+            LANE_CRITICAL: 4, LANE_NORMAL: 2, LANE_SYSTEM: 1
+        })
+        self._queues = {lane: deque() for lane in LANES}
+        self._stats = {lane: LaneStats() for lane in LANES}
+        self._condition = threading.Condition()
+        self._threads = []
+        # Delayed tasks wait in one heap ordered by due time, served by a single thread
+        self._scheduled = []
+        self._schedule_condition = threading.Condition()
+        self._schedule_sequence = itertools.count()
+        self._schedule_thread = None
+    
+    def _start_workers(self):
+        # Called with the condition held, workers start on first use
+        for lane_index, lane in enumerate(LANES):
+            served_lanes = LANES[:lane_index + 1]
+            for worker_index in range(self.lane_workers.get(lane, 0)):
+                thread = threading.Thread(
+                    target=self._work,
+                    args=(served_lanes,),
+                    name=f'notification-dispatch-{lane}-{worker_index}',
+                    daemon=True
+                )
+                thread.start()
+                self._threads.append(thread)
+    
+    def submit(self, func, *args, lane=LANE_SYSTEM, **kwargs):
+        """Queue `func(*args, **kwargs)` in `lane` and return its future"""
+        future = Future()
+        with self._condition:
+            if not self._threads:
+                self._start_workers()
+            self._queues[lane].append((future, func, args, kwargs))
+            self._stats[lane].submitted += 1
+            self._condition.notify_all()
+        return future
+    
+    def schedule(self, delay, func, *args, lane=LANE_SYSTEM, **kwargs):
+        """Queue `func(*args, **kwargs)` in `lane` after `delay` seconds"""
+        due = time.monotonic() + max(delay, 0)
+        with self._schedule_condition:
+            if self._schedule_thread is None:
+                self._schedule_thread = threading.Thread(
+                    target=self._run_scheduled,
+                    name='notification-dispatch-scheduler',
+                    daemon=True
+                )
+                self._schedule_thread.start()
+            # The sequence keeps tasks due at the same time in order and never compares functions
+            heapq.heappush(self._scheduled, (due, next(self._schedule_sequence), func, args, lane, kwargs))
+            self._schedule_condition.notify()
+    
+    def _run_scheduled(self):
+        while True:
+            with self._schedule_condition:
+                while not self._scheduled or self._scheduled[0][0] > time.monotonic():
+                    timeout = self._scheduled[0][0] - time.monotonic() if self._scheduled else None
+                    self._schedule_condition.wait(timeout)
+                _, _, func, args, lane, kwargs = heapq.heappop(self._scheduled)
+            
+            self.submit(func, *args, lane=lane, **kwargs)
+    
+    def record_latency(self, lane, seconds):
+        """Record the time from detection saved to push sent for a notification of `lane`"""
+        with self._condition:
+            self._stats[lane].latencies.append(seconds)
+    
+    def get_stats(self):
+        """Queue depth, counters and latency percentiles per lane"""
+        with self._condition:
+            return {
+                lane: self._stats[lane].as_dict(queued=len(self._queues[lane]))
+                for lane in LANES
+            }
+    
+    def _next_task(self, served_lanes):
+        while True:
+            for lane in served_lanes:
+                if self._queues[lane]:
+                    return lane, self._queues[lane].popleft()
+            self._condition.wait()
+    
+    def _work(self, served_lanes):
+        while True:
+            with self._condition:
+                lane, (future, func, args, kwargs) = self._next_task(served_lanes)
+            
+            if not future.set_running_or_notify_cancel():
+                continue
+            
+            succeeded = True
+            close_old_connections()
+            try:
+                future.set_result(func(*args, **kwargs))
+            except Exception as e:
+                succeeded = False
+                future.set_exception(e)
+                print(f"❌ Notification dispatch failed in {func.__name__} ({lane} lane): {e}")
+                import traceback
+                traceback.print_exc()
+            finally:
+                close_old_connections()
+            
+            with self._condition:
+                if succeeded:
+                    self._stats[lane].completed += 1
+                else:
+                    self._stats[lane].failed += 1
+
+
+notification_dispatcher = NotificationDispatcher()
@@ -0,0 +1,233 @@
+from channels.layers import get_channel_layer
+from asgiref.sync import async_to_sync
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from detection_management.models import Detection
+from project_management.models import UserProjectRole
+from .dispatcher import get_lane_for_detection_type, notification_dispatcher
+from .groups import get_project_group_name
+from .models import Notification
+from .serializers import NotificationSerializer
+from . import coalescing, outbox, presence, read_state, replay, unread
+
+
+def build_project_payload(notification):
+    """
+    Serialize a detection notification once for the whole project.
+    Per-user fields are left out, clients fetch their own notification
+    (id, read state) when they need it.
+    """
+    return {
+        **NotificationSerializer(notification).data,
+        'id': None,
+        'is_read': False,
+        'project_id': notification.detection.camera.project_id,
+    }
+
+
+def get_project_recipients(project_id):
+    """Get all users with access to this project, with their FCM token in the same query"""
+    return [
+        project_user.user
+        for project_user in UserProjectRole.objects.filter(
+            project_id=project_id,
+            is_active=True
+        ).select_related('user', 'user__fcm_token')
+    ]
+
+
+def get_member_project_ids(user_id):
+    """Projects whose detections notify the user, the membership get_project_recipients reads"""
+    return list(
+        UserProjectRole.objects.filter(user_id=user_id, is_active=True)
+        .values_list('project_id', flat=True).distinct()
+    )
+
+
+def fanout_detection(detection_id):
+    """Create notifications and send both WebSocket and FCM for a new detection"""
+    try:
+        instance = Detection.objects.select_related(
+            'camera', 'camera__project', 'detection_type'
+        ).get(id=detection_id)
+    except Detection.DoesNotExist:
+        print(f"❌ Detection {detection_id} no longer exists, skipping notifications")
+        return
+    
+    if instance.is_false_positive:
+        return
+    
+    # Users are notified once per incident, later sampled frames are counted into its digest
+    if not instance.opens_incident:
+        join_incident(instance)
+        return
+    
+    project = instance.camera.project
+    
+    users_to_notify = get_project_recipients(project.id)
+    
+    print(f"📨 Will notify {len(users_to_notify)} users")
+    if not users_to_notify:
+        return
+    
+    lane = get_lane_for_detection_type(instance.detection_type.name)
+    
+    window = coalescing.open_window(instance)
+    if window:
+        notification_dispatcher.schedule(
+            window, flush_digest, instance.id, instance.camera_id, project.id, instance.detection_type.name,
+            lane=lane
+        )
+    
+    title = f'New {instance.detection_type.name.capitalize()} Detection'
+    message = f'Camera #{instance.camera.id} detected {instance.detection_type.name} with {instance.confidence_score:.1%} confidence'
+    push_title = f'🚨 New {instance.detection_type.name} Detection'
+    push_body = f'Camera #{instance.camera.id} detected {instance.detection_type.name}'
+    push_data = {
+        'detection_id': str(instance.id),
+        'type': 'detection',
+        'camera_id': str(instance.camera.id),
+        'project_id': str(project.id),
+    }
+    
+    # Users without a live WebSocket get their push right away, online users
+    # only if they do not acknowledge the WebSocket message in time
+    online_user_ids, offline_user_ids = presence.split_by_presence(user.id for user in users_to_notify)
+    
+    # Notifications and their pushes are committed together, so a push is
+    # never lost once the notification exists
+    with transaction.atomic():
+        notifications = Notification.objects.bulk_create([
+            Notification(
+                user=user,
+                detection=instance,
+                notification_type='detection',
+                title=title,
+                message=message
+            )
+            for user in users_to_notify
+        ])
+        notifications_by_user = {notification.user_id: notification for notification in notifications}
+        key_prefix = f"detection:{instance.id}"
+        outbox.enqueue(
+            outbox.build_deliveries(
+                [user for user in users_to_notify if user.id in offline_user_ids],
+                key_prefix, push_title, push_body, push_data,
+                lane=lane, detection=instance, notifications_by_user=notifications_by_user
+            ) + outbox.build_deliveries(
+                [user for user in users_to_notify if user.id in online_user_ids],
+                key_prefix, push_title, push_body, push_data,
+                lane=lane, detection=instance, notifications_by_user=notifications_by_user,
+                delay=presence.get_ack_window(), requires_ack=True
+            )
+        )
+    print(f"✅ {len(notifications)} database notifications created")
+    
+    unread_counts = unread.adjust([notification.user_id for notification in notifications], 1)
+    
+    # Send WebSocket notification (for real-time updates when user is active)
+    # once to the project group instead of once per user
+    payload = build_project_payload(notifications[0])
+    channel_layer = get_channel_layer()
+    try:
+        async_to_sync(channel_layer.group_send)(
+            get_project_group_name(project.id),
+            {
+                'type': 'notification_message',
+                'notification': payload
+            }
+        )
+    except Exception as e:
+        print(f"❌ WebSocket notification failed for project {project.id}: {e}")
+    
+    # Only connected users need their new badge count now, offline ones read it on connect
+    if online_user_ids:
+        online_counts = {user_id: unread_counts[user_id] for user_id in online_user_ids if user_id in unread_counts}
+        online_counts.update(unread.get_unread_counts(online_user_ids - online_counts.keys()))
+        read_state.broadcast_unread_counts(online_counts)
+    
+    # Keep the per-user copies for clients that reconnect after missing the broadcast
+    replay.record_notifications(notifications, payload)
+    
+    # This task already runs on the detection's lane, deliver its due pushes now
+    outbox.drain_outbox(detection_id=instance.id)
+    notification_dispatcher.record_latency(lane, (timezone.now() - instance.detected_at).total_seconds())
+    
+    if online_user_ids:
+        print(f"🟢 {len(online_user_ids)} users online, delaying their push for acknowledgement")
+        notification_dispatcher.schedule(
+            presence.get_ack_window(), outbox.drain_outbox, detection_id=instance.id, lane=lane
+        )
+    
+    print(f"🎉 Detection notification processing completed for {len(users_to_notify)} users")
+
+
+def join_incident(instance):
+    """Count a detection continuing an incident on the notifications of the frame that opened it"""
+    incident_detection_id = Detection.objects.filter(
+        incident_id=instance.incident_id, opens_incident=True
+    ).values_list('id', flat=True).first()
+    if incident_detection_id is None:
+        return
+    
+    coalesced = Notification.objects.filter(detection_id=incident_detection_id).update(
+        occurrence_count=F('occurrence_count') + 1,
+        last_occurred_at=instance.detected_at
+    )
+    print(f"🧺 Detection {instance.id} coalesced into {coalesced} notifications of detection {incident_detection_id}")
+    if not coalesced:
+        return
+    
+    # The first frame after a digest went out opens the next window
+    window = coalescing.join_window(instance, incident_detection_id)
+    if window:
+        notification_dispatcher.schedule(
+            window, flush_digest, incident_detection_id, instance.camera_id, instance.camera.project_id,
+            instance.detection_type.name, lane=get_lane_for_detection_type(instance.detection_type.name)
+        )
+
+
+def flush_digest(detection_id, camera_id, project_id, detection_type_name):
+    """Announce the detections coalesced while the window of `detection_id` was open"""
+    pending = coalescing.pop_pending_count(camera_id, detection_type_name)
+    if not pending:
+        return
+    
+    print(f"🧺 Flushing digest of {pending} {detection_type_name} detections for Camera #{camera_id}")
+    
+    try:
+        async_to_sync(get_channel_layer().group_send)(
+            get_project_group_name(project_id),
+            {
+                'type': 'notification_message',
+                'notification': {
+                    'notification_type': 'digest',
+                    'detection_id': detection_id,
+                    'detection_type': detection_type_name,
+                    'camera_id': camera_id,
+                    'project_id': project_id,
+                    'occurrence_count': pending,
+                }
+            }
+        )
+    except Exception as e:
+        print(f"❌ WebSocket digest failed for project {project_id}: {e}")
+    
+    users_to_notify = get_project_recipients(project_id)
+    online_user_ids, offline_user_ids = presence.split_by_presence(user.id for user in users_to_notify)
+    outbox.enqueue(outbox.build_deliveries(
+        [user for user in users_to_notify if user.id in offline_user_ids],
+        f"digest:{detection_id}:{pending}",
+        f'🚨 {pending} more {detection_type_name} detections',
+        f'Camera #{camera_id} kept detecting {detection_type_name}',
+        {
+            'detection_id': str(detection_id),
+            'type': 'digest',
+            'camera_id': str(camera_id),
+            'project_id': str(project_id),
+            'occurrence_count': str(pending),
+        },
+        lane=get_lane_for_detection_type(detection_type_name)
+    ))
+    outbox.drain_outbox(idempotency_key__startswith=f"digest:{detection_id}:")
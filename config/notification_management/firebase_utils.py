@@ -6,9 +6,24 @@ import os
 # Initialize Firebase Admin (add your service account key)
 SERVICE_ACCOUNT_PATH = os.path.join(settings.BASE_DIR, 'serviceAccountKey.json')
 
-if not firebase_admin._apps:
-    cred = credentials.Certificate(SERVICE_ACCOUNT_PATH)
-    firebase_admin.initialize_app(cred)
+
+def get_firebase_app():
+    """Initialize Firebase Admin on first use so the fake transport works without credentials"""
+    if not firebase_admin._apps:
+        cred = credentials.Certificate(SERVICE_ACCOUNT_PATH)
+        firebase_admin.initialize_app(cred)
+    return firebase_admin.get_app()
+
+
+def build_android_config():
+    return messaging.AndroidConfig(
+        notification=messaging.AndroidNotification(
+            channel_id='smartfarm_notifications',
+            priority='high',
+            sound='default',
+        )
+    )
+
 
 def send_fcm_notification(user, title, body, data=None):
     try:
@@ -16,6 +31,7 @@ def send_fcm_notification(user, title, body, data=None):
         fcm_token = user.fcm_token.token if hasattr(user, 'fcm_token') else None
         
         if fcm_token:
+            get_firebase_app()
             message = messaging.Message(
                 notification=messaging.Notification(
                     title=title,
@@ -23,13 +39,7 @@ def send_fcm_notification(user, title, body, data=None):
                 ),
                 data=data or {},
                 token=fcm_token,
-                android=messaging.AndroidConfig(
-                    notification=messaging.AndroidNotification(
-                        channel_id='smartfarm_notifications',
-                        priority='high',
-                        sound='default',
-                    )
-                ),
+                android=build_android_config(),
             )
             
             response = messaging.send(message)
@@ -38,4 +48,4 @@ def send_fcm_notification(user, title, body, data=None):
             
     except Exception as e:
         print(f"❌ FCM notification failed: {e}")
-        return False
\ No newline at end of file
+        return False
@@ -0,0 +1,8 @@
+def get_user_group_name(user_id):
+    """Channel group of one user's WebSocket connections"""
+    return f"notifications_{user_id}"
+
+
+def get_project_group_name(project_id):
+    """Channel group shared by every connection of users with access to a project"""
+    return f"project_notifications_{project_id}"
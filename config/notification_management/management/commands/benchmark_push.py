@@ -0,0 +1,44 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from notification_management.push import BatchedPushSender, FakeFCMTransport
+
+
+class Command(BaseCommand):
+    help = 'Measure batched push throughput against the local fake FCM transport'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tokens', type=int, default=10000, help='Number of device tokens to send to')
+        parser.add_argument('--invalid', type=int, default=0, help='How many of those tokens are invalid')
+        parser.add_argument('--batch-size', type=int, default=500, help='Tokens per multicast call (max 500)')
+        parser.add_argument('--workers', type=int, default=4, help='Concurrent multicast calls')
+        parser.add_argument('--latency-ms', type=int, default=50, help='Simulated latency of one multicast call')
+        parser.add_argument('--failure-rate', type=float, default=0.0, help='Share of valid tokens failing transiently')
+
+    def handle(self, *args, **options):
+        transport = FakeFCMTransport(
+            latency=options['latency_ms'] / 1000,
+            failure_rate=options['failure_rate']
+        )
+        sender = BatchedPushSender(transport=transport, batch_size=options['batch_size'], workers=options['workers'])
+
+        invalid = options['invalid']
+        tokens = [f"invalid-token-{i}" for i in range(invalid)]
+        tokens += [f"token-{i}" for i in range(options['tokens'] - invalid)]
+
+        started = time.perf_counter()
+        results = sender.send(tokens, 'Benchmark', 'Benchmark push', {'type': 'benchmark'}, deactivate_invalid=False)
+        elapsed = time.perf_counter() - started
+
+        delivered = sum(1 for result in results if result.success)
+        invalid_found = sum(1 for result in results if result.invalid_token)
+
+        self.stdout.write(f"Tokens:          {len(tokens)}")
+        self.stdout.write(f"Multicast calls: {transport.calls}")
+        self.stdout.write(f"Delivered:       {delivered}")
+        self.stdout.write(f"Invalid tokens:  {invalid_found}")
+        self.stdout.write(f"Other failures:  {len(results) - delivered - invalid_found}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Elapsed {elapsed:.3f}s, {len(tokens) / elapsed:,.0f} tokens/s"
+        ))
@@ -0,0 +1,81 @@
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from notification_management.models import PushOutbox
+from notification_management.outbox import drain_outbox
+from notification_management.push import BatchedPushSender, FakeFCMTransport
+
+
+class Command(BaseCommand):
+    help = 'Deliver due pushes from the outbox, or measure drain throughput against the fake FCM transport'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Keep draining until interrupted')
+        parser.add_argument('--interval', type=float, default=1.0, help='Seconds between drains with --loop')
+        parser.add_argument('--batch-size', type=int, default=500, help='Rows claimed per batch')
+        parser.add_argument('--benchmark', type=int, default=0, help='Drain this many synthetic rows through the fake transport, then roll them back')
+        parser.add_argument('--invalid', type=int, default=0, help='Benchmark rows with an invalid token')
+        parser.add_argument('--workers', type=int, default=4, help='Concurrent multicast calls in the benchmark')
+        parser.add_argument('--latency-ms', type=int, default=50, help='Simulated latency of one multicast call')
+        parser.add_argument('--failure-rate', type=float, default=0.0, help='Share of valid tokens failing transiently')
+
+    def handle(self, *args, **options):
+        if options['benchmark']:
+            self.benchmark(options)
+            return
+
+        while True:
+            totals = drain_outbox(batch_size=options['batch_size'], schedule_retries=False)
+            if totals:
+                self.stdout.write(f"{timezone.now():%H:%M:%S} {totals}")
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+
+    def benchmark(self, options):
+        transport = FakeFCMTransport(
+            latency=options['latency_ms'] / 1000,
+            failure_rate=options['failure_rate']
+        )
+        sender = BatchedPushSender(transport=transport, workers=options['workers'])
+
+        run_id = uuid.uuid4().hex[:8]
+        invalid = options['invalid']
+        now = timezone.now()
+
+        with transaction.atomic():
+            PushOutbox.objects.bulk_create([
+                PushOutbox(
+                    idempotency_key=f"benchmark:{run_id}:{i}",
+                    token=f"invalid-token-{i}" if i < invalid else f"token-{i}",
+                    title='Benchmark',
+                    body='Benchmark push',
+                    data={'type': 'benchmark', 'run': run_id},
+                    next_attempt_at=now,
+                )
+                for i in range(options['benchmark'])
+            ], batch_size=1000)
+
+            started = time.perf_counter()
+            totals = drain_outbox(
+                batch_size=options['batch_size'],
+                sender=sender,
+                schedule_retries=False,
+                idempotency_key__startswith=f"benchmark:{run_id}:"
+            )
+            elapsed = time.perf_counter() - started
+
+            # Benchmark rows never reach the real outbox
+            transaction.set_rollback(True)
+
+        self.stdout.write(f"Rows:            {options['benchmark']}")
+        self.stdout.write(f"Multicast calls: {transport.calls}")
+        for status, count in sorted(totals.items()):
+            self.stdout.write(f"{status.capitalize() + ':':<17}{count}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Elapsed {elapsed:.3f}s, {options['benchmark'] / elapsed:,.0f} rows/s"
+        ))
@@ -0,0 +1,202 @@
+import asyncio
+import json
+import time
+
+import psutil
+import websockets
+from channels.layers import get_channel_layer
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework_simplejwt.tokens import AccessToken
+
+from authentication.models import AppUser
+from project_management.models import Project
+from notification_management.dispatcher import percentile
+from notification_management.groups import get_project_group_name
+
+
+class LoadClient:
+    """One WebSocket connection, records when each synthetic detection arrived"""
+
+    def __init__(self, index, url):
+        self.index = index
+        self.url = url
+        self.connection = None
+        self.received = {}
+        self.error = None
+        self.closing = False
+        self.closed_early = False
+
+    async def connect(self):
+        try:
+            self.connection = await websockets.connect(self.url, max_queue=None, ping_interval=None)
+        except Exception as e:
+            self.error = str(e)
+
+    async def listen(self):
+        try:
+            async for message in self.connection:
+                payload = json.loads(message)
+                sequence = payload.get('loadtest_sequence')
+                if sequence is not None:
+                    self.received[sequence] = time.time()
+        except websockets.ConnectionClosed:
+            self.closed_early = not self.closing
+
+    async def close(self):
+        self.closing = True
+        if self.connection is not None:
+            await self.connection.close()
+
+
+def get_rss(pid):
+    """Resident memory of a server process and its workers, in bytes"""
+    process = psutil.Process(pid)
+    return sum(p.memory_info().rss for p in [process, *process.children(recursive=True)])
+
+
+class Command(BaseCommand):
+    help = (
+        'Open many authenticated notification WebSockets against a running server, broadcast '
+        'synthetic detections to their project group and report delivery latency, drops and memory'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='ws://localhost:8000/ws/notifications/', help='WebSocket endpoint')
+        parser.add_argument('--project', type=int, required=True, help='Project whose members the clients log in as')
+        parser.add_argument('--clients', type=int, default=1000, help='Concurrent connections to open')
+        parser.add_argument('--connect-concurrency', type=int, default=200, help='Connections opened at the same time')
+        parser.add_argument('--events', type=int, default=100, help='Synthetic detections to broadcast')
+        parser.add_argument('--rate', type=float, default=10.0, help='Detections per second')
+        parser.add_argument('--settle', type=float, default=5.0, help='Seconds to wait for late messages')
+        parser.add_argument('--server-pid', type=int, help='Server process to sample memory from (workers included)')
+
+    def handle(self, *args, **options):
+        try:
+            project = Project.objects.get(id=options['project'])
+        except Project.DoesNotExist:
+            raise CommandError(f"Project {options['project']} does not exist")
+
+        users = list(AppUser.objects.filter(
+            project_roles__project=project, project_roles__is_active=True
+        ).distinct()) or [project.created_by]
+
+        # Clients cycle through the project members, several connections per user are fine
+        tokens = []
+        for user in users:
+            token = AccessToken.for_user(user)
+            token['user_type'] = user.user_type
+            token['full_name'] = user.get_full_name()
+            tokens.append(str(token))
+
+        separator = '&' if '?' in options['url'] else '?'
+        urls = [f"{options['url']}{separator}token={tokens[i % len(tokens)]}" for i in range(options['clients'])]
+
+        asyncio.run(self.run(project, urls, options))
+
+    async def run(self, project, urls, options):
+        server_pid = options['server_pid']
+        rss_before = get_rss(server_pid) if server_pid else None
+
+        # Connect
+        clients = [LoadClient(i, url) for i, url in enumerate(urls)]
+        semaphore = asyncio.Semaphore(options['connect_concurrency'])
+
+        async def connect(client):
+            async with semaphore:
+                await client.connect()
+
+        started = time.perf_counter()
+        await asyncio.gather(*(connect(client) for client in clients))
+        connect_seconds = time.perf_counter() - started
+
+        connected = [client for client in clients if client.connection is not None]
+        failed = len(clients) - len(connected)
+        self.stdout.write(f"Connected {len(connected)}/{len(clients)} clients in {connect_seconds:.1f}s")
+        if not connected:
+            errors = {client.error for client in clients if client.error}
+            raise CommandError(f"No client could connect: {', '.join(sorted(errors))}")
+
+        listeners = [asyncio.ensure_future(client.listen()) for client in connected]
+
+        # Give the server time to settle after the connection burst before sampling memory
+        await asyncio.sleep(1)
+        rss_connected = get_rss(server_pid) if server_pid else None
+
+        # Broadcast synthetic detections the same way fanout_detection does
+        channel_layer = get_channel_layer()
+        group_name = get_project_group_name(project.id)
+        sent_at = {}
+        interval = 1 / options['rate'] if options['rate'] > 0 else 0
+
+        for sequence in range(options['events']):
+            sent_at[sequence] = time.time()
+            await channel_layer.group_send(group_name, {
+                'type': 'notification_message',
+                'notification': {
+                    'id': None,
+                    'notification_type': 'detection',
+                    'title': 'Load test detection',
+                    'message': f'Synthetic detection #{sequence}',
+                    'is_read': False,
+                    'project_id': project.id,
+                    'loadtest_sequence': sequence,
+                }
+            })
+            await asyncio.sleep(interval)
+
+        await asyncio.sleep(options['settle'])
+
+        for client in connected:
+            await client.close()
+        await asyncio.gather(*listeners, return_exceptions=True)
+
+        self.report(connected, failed, sent_at, rss_before, rss_connected)
+
+    def report(self, clients, failed, sent_at, rss_before, rss_connected):
+        expected = len(clients) * len(sent_at)
+        latencies = sorted(
+            received_at - sent_at[sequence]
+            for client in clients
+            for sequence, received_at in client.received.items()
+        )
+        delivered = len(latencies)
+
+        # group_send drops messages for a full channel without raising, so a
+        # client that stayed connected and still missed messages had a full channel
+        lost_connection = [client for client in clients if client.closed_early]
+        channel_full = [
+            client for client in clients
+            if not client.closed_early and len(client.received) < len(sent_at)
+        ]
+        dropped_full = sum(len(sent_at) - len(client.received) for client in channel_full)
+
+        self.stdout.write(f"Clients:           {len(clients)} connected, {failed} failed")
+        self.stdout.write(f"Detections sent:   {len(sent_at)}")
+        self.stdout.write(f"Messages expected: {expected}")
+        self.stdout.write(f"Messages received: {delivered}")
+        self.stdout.write(f"Dropped:           {expected - delivered} ({(expected - delivered) / expected:.2%})")
+        self.stdout.write(
+            f"Channel full:      {len(channel_full)} clients, {dropped_full} messages dropped by the channel layer"
+        )
+        self.stdout.write(f"Lost connection:   {len(lost_connection)} clients")
+
+        if latencies:
+            self.stdout.write(
+                "Latency ms:        "
+                f"p50 {percentile(latencies, 0.5) * 1000:.1f}, "
+                f"p95 {percentile(latencies, 0.95) * 1000:.1f}, "
+                f"p99 {percentile(latencies, 0.99) * 1000:.1f}, "
+                f"max {latencies[-1] * 1000:.1f}"
+            )
+
+        if rss_before is not None:
+            per_connection = (rss_connected - rss_before) / len(clients)
+            self.stdout.write(
+                f"Server memory:     {rss_before / 2 ** 20:.1f} MiB idle, {rss_connected / 2 ** 20:.1f} MiB connected, "
+                f"{per_connection / 1024:.1f} KiB per connection"
+            )
+
+        client_rss = psutil.Process().memory_info().rss
+        self.stdout.write(self.style.SUCCESS(
+            f"Load client memory: {client_rss / 2 ** 20:.1f} MiB ({client_rss / len(clients) / 1024:.1f} KiB per connection)"
+        ))
@@ -0,0 +1,48 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from notification_management.retention import get_retention_policy, purge_expired
+
+
+class Command(BaseCommand):
+    help = 'Delete notifications older than the retention policy, optionally archiving them to gzipped JSON Lines files'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--read-days', type=int, help='Override the retention of read notifications (0 keeps them)')
+        parser.add_argument('--unread-days', type=int, help='Override the retention of unread notifications (0 keeps them)')
+        parser.add_argument('--batch-size', type=int, help='Notifications deleted per transaction')
+        parser.add_argument('--pause', type=float, default=0.0, help='Seconds to wait between batches')
+        parser.add_argument('--archive', action='store_true', help='Archive rows before deleting them')
+        parser.add_argument(
+            '--archive-dir',
+            default=getattr(settings, 'NOTIFICATION_ARCHIVE_DIR', None),
+            help='Directory receiving the archive files'
+        )
+        parser.add_argument('--dry-run', action='store_true', help='Only count what would be purged')
+
+    def handle(self, *args, **options):
+        policy = get_retention_policy()
+        if options['read_days'] is not None:
+            policy['read'] = options['read_days']
+        if options['unread_days'] is not None:
+            policy['unread'] = options['unread_days']
+
+        self.stdout.write(
+            f"Keeping read notifications {policy['read'] or 'forever'} days, "
+            f"unread {policy['unread'] or 'forever'} days"
+        )
+
+        deleted, archive_files = purge_expired(
+            policy=policy,
+            batch_size=options['batch_size'],
+            archive_dir=options['archive_dir'] if options['archive'] else None,
+            pause=options['pause'],
+            dry_run=options['dry_run'],
+            log=self.stdout.write
+        )
+
+        if options['dry_run']:
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f"Purged {deleted} notifications, {len(archive_files)} archive files written"
+        ))
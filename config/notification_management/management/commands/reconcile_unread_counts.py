@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from notification_management.unread import iter_cached_user_ids, reconcile
+
+
+class Command(BaseCommand):
+    help = 'Correct the cached unread notification counters against Postgres'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Counters checked per query')
+
+    def handle(self, *args, **options):
+        checked = 0
+        changed = 0
+        for user_ids in iter_cached_user_ids(options['batch_size']):
+            checked += len(user_ids)
+            changed += reconcile(user_ids)
+
+        self.stdout.write(self.style.SUCCESS(f"Checked {checked} unread counters, corrected {changed}"))
@@ -14,6 +14,8 @@ class Notification(models.Model):
     title = models.CharField(max_length=200)
     message = models.TextField()
     is_read = models.BooleanField(default=False)
+    occurrence_count = models.PositiveIntegerField(default=1)  # Detections coalesced into this notification
+    last_occurred_at = models.DateTimeField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     
     class Meta:
@@ -21,6 +23,7 @@ class Notification(models.Model):
         indexes = [
             models.Index(fields=['user', '-created_at']),
             models.Index(fields=['user', 'is_read']),
+            models.Index(fields=['is_read', 'created_at']),  # Retention purges
         ]
     
     def __str__(self):
@@ -34,4 +37,47 @@ class FCMToken(models.Model):
     is_active = models.BooleanField(default=True)
     
     def __str__(self):
-        return f"FCM Token for {self.user.username}"
\ No newline at end of file
+        return f"FCM Token for {self.user.username}"
+
+class PushOutbox(models.Model):
+    """
+    One push waiting to be delivered to one device. Rows are written in the
+    same transaction as the notifications they announce and drained by
+    notification_management.outbox, so a failed push is retried instead of lost.
+    """
+    STATUSES = [
+        ('pending', 'Pending'),
+        ('sending', 'Sending'),
+        ('retrying', 'Retrying'),
+        ('sent', 'Sent'),
+        ('skipped', 'Skipped'),  # Acknowledged over WebSocket before the push was due
+        ('dead', 'Dead'),
+    ]
+    
+    idempotency_key = models.CharField(max_length=150, unique=True)
+    user = models.ForeignKey(AppUser, on_delete=models.CASCADE, null=True, blank=True, related_name='push_deliveries')
+    detection = models.ForeignKey(Detection, on_delete=models.CASCADE, null=True, blank=True)
+    notification = models.ForeignKey(Notification, on_delete=models.CASCADE, null=True, blank=True)
+    token = models.TextField()
+    title = models.CharField(max_length=200)
+    body = models.TextField()
+    data = models.JSONField(default=dict, blank=True)
+    priority = models.PositiveSmallIntegerField(default=0)  # Index of the dispatch lane, lower is sent first
+    requires_ack = models.BooleanField(default=False)  # Skip when the user acknowledged over WebSocket
+    status = models.CharField(max_length=10, choices=STATUSES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField()
+    last_error = models.TextField(blank=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['priority', 'next_attempt_at']
+        indexes = [
+            models.Index(fields=['status', 'priority', 'next_attempt_at']),
+            models.Index(fields=['detection', 'status']),
+        ]
+    
+    def __str__(self):
+        return f"Push {self.idempotency_key} ({self.status})"
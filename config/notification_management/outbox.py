@@ -0,0 +1,223 @@
+import json
+import random
+from collections import defaultdict
+from datetime import timedelta
+
+import redis
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Min, Q
+from django.utils import timezone
+
+from .dispatcher import LANES, LANE_SYSTEM, notification_dispatcher
+from .models import PushOutbox
+from .push import push_sender
+from . import presence
+
+# Statuses the drainer picks up, 'sending' rows are only taken back once their lease expired
+CLAIMABLE_STATUSES = ['pending', 'retrying', 'sending']
+FINAL_STATUSES = ['sent', 'skipped', 'dead']
+
+
+def get_max_attempts():
+    return getattr(settings, 'PUSH_OUTBOX_MAX_ATTEMPTS', 8)
+
+
+def get_backoff(attempts):
+    """Delay before the next attempt after `attempts` failed ones, with some jitter"""
+    base = getattr(settings, 'PUSH_OUTBOX_BACKOFF_SECONDS', 2)
+    cap = getattr(settings, 'PUSH_OUTBOX_MAX_BACKOFF_SECONDS', 900)
+    delay = min(cap, base * 2 ** max(attempts - 1, 0))
+    return timedelta(seconds=delay * random.uniform(0.8, 1.2))
+
+
+def build_deliveries(users, key_prefix, title, body, data, lane=LANE_SYSTEM,
+                     detection=None, notifications_by_user=None, delay=0, requires_ack=False):
+    """
+    Outbox rows for the active FCM tokens of `users`, to be saved with
+    enqueue() in the transaction that creates the notifications.
+    """
+    notifications_by_user = notifications_by_user or {}
+    next_attempt_at = timezone.now() + timedelta(seconds=delay)
+    return [
+        PushOutbox(
+            idempotency_key=f"{key_prefix}:user:{user.id}",
+            user=user,
+            detection=detection,
+            notification=notifications_by_user.get(user.id),
+            token=user.fcm_token.token,
+            title=title,
+            body=body,
+            data=data,
+            priority=LANES.index(lane),
+            requires_ack=requires_ack,
+            next_attempt_at=next_attempt_at,
+        )
+        for user in users
+        if hasattr(user, 'fcm_token') and user.fcm_token.is_active
+    ]
+
+
+def enqueue(deliveries):
+    """Save outbox rows, a key that was already enqueued is left untouched"""
+    if deliveries:
+        PushOutbox.objects.bulk_create(deliveries, ignore_conflicts=True)
+    return len(deliveries)
+
+
+def claim_batch(batch_size, **filters):
+    """Lock due rows, lease them to this drainer and return them"""
+    now = timezone.now()
+    with transaction.atomic():
+        rows = list(
+            PushOutbox.objects.select_for_update(skip_locked=True).filter(
+                status__in=CLAIMABLE_STATUSES,
+                next_attempt_at__lte=now,
+                **filters
+            ).order_by('priority', 'next_attempt_at')[:batch_size]
+        )
+        if not rows:
+            return []
+        
+        # A drainer that dies mid-send gives its rows back when the lease runs out
+        lease = timedelta(seconds=getattr(settings, 'PUSH_OUTBOX_LEASE_SECONDS', 60))
+        PushOutbox.objects.filter(id__in=[row.id for row in rows]).update(
+            status='sending',
+            attempts=F('attempts') + 1,
+            next_attempt_at=now + lease
+        )
+    
+    for row in rows:
+        row.status = 'sending'
+        row.attempts += 1
+    return rows
+
+
+def skip_acknowledged(rows):
+    """Mark rows of users who acknowledged the detection over WebSocket, returns the rest"""
+    ack_rows = [row for row in rows if row.requires_ack and row.user_id and row.detection_id]
+    if not ack_rows:
+        return rows
+    
+    skipped = set()
+    by_detection = defaultdict(list)
+    for row in ack_rows:
+        by_detection[row.detection_id].append(row)
+    
+    for detection_id, detection_rows in by_detection.items():
+        user_ids = [row.user_id for row in detection_rows]
+        try:
+            unacknowledged = presence.get_unacknowledged_user_ids(user_ids, detection_id)
+        except redis.RedisError as e:
+            print(f"❌ Acknowledgement lookup failed, pushing to every online user: {e}")
+            continue
+        skipped.update(row.id for row in detection_rows if row.user_id not in unacknowledged)
+    
+    for row in rows:
+        if row.id in skipped:
+            row.status = 'skipped'
+    return [row for row in rows if row.id not in skipped]
+
+
+def deliver(rows, sender=None):
+    """Send claimed rows as multicast batches and record the outcome of each one"""
+    sender = sender or push_sender
+    now = timezone.now()
+    
+    to_send = skip_acknowledged(rows)
+    
+    # Rows sharing a payload go out in the same multicast batches
+    groups = defaultdict(list)
+    for row in to_send:
+        groups[(row.title, row.body, json.dumps(row.data, sort_keys=True))].append(row)
+    
+    for (title, body, data), group_rows in groups.items():
+        results = sender.send([row.token for row in group_rows], title, body, json.loads(data))
+        results_by_token = {result.token: result for result in results}
+        
+        for row in group_rows:
+            result = results_by_token.get(row.token)
+            if result and result.success:
+                row.status = 'sent'
+                row.sent_at = now
+                row.last_error = ''
+            elif result and result.invalid_token:
+                # Retrying an unregistered token can never succeed
+                row.status = 'dead'
+                row.last_error = result.error or 'Invalid token'
+            elif row.attempts >= get_max_attempts():
+                row.status = 'dead'
+                row.last_error = result.error if result else 'No result from transport'
+            else:
+                row.status = 'retrying'
+                row.next_attempt_at = now + get_backoff(row.attempts)
+                row.last_error = result.error if result else 'No result from transport'
+    
+    # bulk_update skips auto_now fields
+    for row in rows:
+        row.updated_at = now
+    PushOutbox.objects.bulk_update(rows, ['status', 'next_attempt_at', 'last_error', 'sent_at', 'updated_at'])
+    
+    totals = defaultdict(int)
+    for row in rows:
+        totals[row.status] += 1
+    return totals
+
+
+def drain_outbox(batch_size=None, max_batches=None, sender=None, schedule_retries=True, **filters):
+    """
+    Deliver due outbox rows batch by batch until none is left (or
+    `max_batches` ran). `filters` restrict the rows, e.g. detection_id.
+    Returns the number of rows per resulting status.
+    """
+    batch_size = batch_size or getattr(settings, 'PUSH_OUTBOX_BATCH_SIZE', 500)
+    totals = defaultdict(int)
+    batches = 0
+    
+    while max_batches is None or batches < max_batches:
+        rows = claim_batch(batch_size, **filters)
+        if not rows:
+            break
+        batches += 1
+        for status, count in deliver(rows, sender=sender).items():
+            totals[status] += count
+    
+    if totals['retrying'] and schedule_retries:
+        schedule_next_drain()
+    
+    if batches:
+        print(f"📤 Push outbox drained in {batches} batches: {dict(totals)}")
+    return dict(totals)
+
+
+def schedule_next_drain():
+    """Wake the drainer when the earliest retry is due"""
+    next_attempt_at = PushOutbox.objects.filter(
+        status__in=['pending', 'retrying']
+    ).aggregate(next_attempt_at=Min('next_attempt_at'))['next_attempt_at']
+    if next_attempt_at is None:
+        return
+    
+    delay = max((next_attempt_at - timezone.now()).total_seconds(), 0)
+    notification_dispatcher.schedule(delay, drain_outbox, lane=LANE_SYSTEM)
+
+
+def get_outbox_stats():
+    """Row counts per status plus deliveries stuck for longer than PUSH_OUTBOX_STUCK_SECONDS"""
+    counts = {
+        row['status']: row['count']
+        for row in PushOutbox.objects.values('status').annotate(count=Count('id'))
+    }
+    waiting = PushOutbox.objects.exclude(status__in=FINAL_STATUSES)
+    return {
+        'by_status': counts,
+        'stuck': PushOutbox.objects.filter(stuck_deliveries_filter()).count(),
+        'oldest_waiting_at': waiting.aggregate(created_at=Min('created_at'))['created_at'],
+        'dead': counts.get('dead', 0),
+    }
+
+
+def stuck_deliveries_filter():
+    """Q matching deliveries that are still not final after PUSH_OUTBOX_STUCK_SECONDS"""
+    stuck_before = timezone.now() - timedelta(seconds=getattr(settings, 'PUSH_OUTBOX_STUCK_SECONDS', 300))
+    return ~Q(status__in=FINAL_STATUSES) & Q(created_at__lt=stuck_before)
@@ -0,0 +1,72 @@
+import base64
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+
+
+class NotificationKeysetPagination(BasePagination):
+    """
+    Newest first keyset pagination on (created_at, id). The cursor holds the
+    last row of the previous page, so every page is one index range scan on
+    (user, -created_at) however deep the client scrolls.
+    """
+    page_size = 50
+    max_page_size = 200
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    ordering = ('-created_at', '-id')
+    
+    def encode_cursor(self, notification):
+        raw = f"{notification.created_at.isoformat()}|{notification.id}"
+        return base64.urlsafe_b64encode(raw.encode()).decode()
+    
+    def decode_cursor(self, cursor):
+        try:
+            created_at, notification_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+            created_at = parse_datetime(created_at)
+            if created_at is None:
+                raise ValueError
+            return created_at, int(notification_id)
+        except (ValueError, UnicodeDecodeError):
+            raise ValidationError({'cursor': 'Invalid cursor'})
+    
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except ValueError:
+            return self.page_size
+        return max(1, min(page_size, self.max_page_size))
+    
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size_value = self.get_page_size(request)
+        
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            created_at, notification_id = self.decode_cursor(cursor)
+            queryset = queryset.filter(
+                Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=notification_id)
+            )
+        
+        # One extra row tells whether there is a next page
+        rows = list(queryset.order_by(*self.ordering)[:self.page_size_value + 1])
+        self.has_next = len(rows) > self.page_size_value
+        self.page = rows[:self.page_size_value]
+        return self.page
+    
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        params = self.request.query_params.copy()
+        params[self.cursor_query_param] = self.encode_cursor(self.page[-1])
+        return f"{self.request.build_absolute_uri(self.request.path)}?{params.urlencode()}"
+    
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'next_cursor': self.encode_cursor(self.page[-1]) if self.has_next else None,
+            'results': data,
+        })
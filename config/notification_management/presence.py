@@ -0,0 +1,84 @@
+import time
+
+import redis
+from django.conf import settings
+
+from utils.redis_client import get_redis
+
+
+def get_presence_ttl():
+    return getattr(settings, 'PRESENCE_TTL_SECONDS', 60)
+
+
+def get_ack_window():
+    return getattr(settings, 'NOTIFICATION_ACK_WINDOW_SECONDS', 10)
+
+
+def get_presence_key(user_id):
+    # Sorted set of the user's WebSocket channel names scored by expiry time
+    return f"presence:user:{user_id}"
+
+
+def get_ack_key(user_id, detection_id):
+    return f"presence:ack:{user_id}:{detection_id}"
+
+
+def mark_online(user_id, channel_name):
+    """Register or refresh one WebSocket connection of the user, called on connect and heartbeat"""
+    ttl = get_presence_ttl()
+    key = get_presence_key(user_id)
+    pipe = get_redis().pipeline()
+    pipe.zadd(key, {channel_name: time.time() + ttl})
+    pipe.expire(key, ttl)
+    pipe.execute()
+
+
+def mark_offline(user_id, channel_name):
+    """Forget one WebSocket connection of the user, called on disconnect"""
+    get_redis().zrem(get_presence_key(user_id), channel_name)
+
+
+def get_online_user_ids(user_ids):
+    """Get the subset of `user_ids` with at least one live WebSocket connection"""
+    user_ids = list(user_ids)
+    if not user_ids:
+        return set()
+    
+    now = time.time()
+    pipe = get_redis().pipeline()
+    for user_id in user_ids:
+        pipe.zcount(get_presence_key(user_id), now, '+inf')
+    
+    return {user_id for user_id, live_connections in zip(user_ids, pipe.execute()) if live_connections}
+
+
+def acknowledge(user_id, detection_id):
+    """Record that the user's client displayed the WebSocket message of a detection"""
+    get_redis().set(get_ack_key(user_id, detection_id), 1, ex=get_ack_window() * 6)
+
+
+def get_unacknowledged_user_ids(user_ids, detection_id):
+    """Get the subset of `user_ids` that never acknowledged the detection"""
+    user_ids = list(user_ids)
+    if not user_ids:
+        return set()
+    
+    pipe = get_redis().pipeline()
+    for user_id in user_ids:
+        pipe.exists(get_ack_key(user_id, detection_id))
+    
+    return {user_id for user_id, acked in zip(user_ids, pipe.execute()) if not acked}
+
+
+def split_by_presence(user_ids):
+    """
+    Split users into (online, offline) sets. When Redis is unavailable
+    everybody is treated as offline so nobody misses a push.
+    """
+    user_ids = set(user_ids)
+    try:
+        online = get_online_user_ids(user_ids)
+    except redis.RedisError as e:
+        print(f"❌ Presence lookup failed, pushing to everybody: {e}")
+        online = set()
+    return online, user_ids - online
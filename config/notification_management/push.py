@@ -0,0 +1,153 @@
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+# Firebase accepts at most 500 tokens per multicast call
+FCM_MULTICAST_LIMIT = 500
+
+
+class PushResult:
+    """Outcome of sending to one token"""
+    
+    def __init__(self, token, success, error=None, invalid_token=False):
+        self.token = token
+        self.success = success
+        self.error = error
+        self.invalid_token = invalid_token
+
+
+class FirebaseTransport:
+    """Send multicast messages through Firebase Admin"""
+    
+    def send_multicast(self, tokens, title, body, data):
+        from firebase_admin import messaging
+        from .firebase_utils import build_android_config, get_firebase_app
+        
+        get_firebase_app()
+        message = messaging.MulticastMessage(
+            notification=messaging.Notification(title=title, body=body),
+            data=data or {},
+            tokens=tokens,
+            android=build_android_config(),
+        )
+        response = messaging.send_each_for_multicast(message)
+        
+        results = []
+        for token, send_response in zip(tokens, response.responses):
+            if send_response.success:
+                results.append(PushResult(token, True))
+                continue
+            
+            error = send_response.exception
+            # INVALID_ARGUMENT is also returned for every token when the message itself is
+            # rejected (e.g. oversized data), only a malformed token names the token in the error
+            invalid_token = isinstance(error, (messaging.UnregisteredError, messaging.SenderIdMismatchError)) or (
+                getattr(error, 'code', None) == 'INVALID_ARGUMENT' and 'registration token' in str(error).lower()
+            )
+            results.append(PushResult(token, False, str(error), invalid_token))
+        
+        return results
+
+
+class FakeFCMTransport:
+    """
+    Local stand-in for Firebase, for throughput tests without network.
+    Each call sleeps for `latency` seconds, tokens starting with
+    `invalid_prefix` are reported as unregistered and `failure_rate`
+    of the remaining ones fail with a transient error.
+    """
+    
+    def __init__(self, latency=None, failure_rate=None, invalid_prefix='invalid'):
+        self.latency = latency if latency is not None else getattr(settings, 'FAKE_FCM_LATENCY_MS', 50) / 1000
+        self.failure_rate = failure_rate if failure_rate is not None else getattr(settings, 'FAKE_FCM_FAILURE_RATE', 0.0)
+        self.invalid_prefix = invalid_prefix
+        self.calls = 0
+        self.messages_sent = 0
+        self._lock = threading.Lock()
+    
+    def send_multicast(self, tokens, title, body, data):
+        time.sleep(self.latency)
+        
+        results = []
+        for token in tokens:
+            if token.startswith(self.invalid_prefix):
+                results.append(PushResult(token, False, 'Requested entity was not found.', invalid_token=True))
+            elif self.failure_rate and random.random() < self.failure_rate:
+                results.append(PushResult(token, False, 'Service unavailable'))
+            else:
+                results.append(PushResult(token, True))
+        
+        with self._lock:
+            self.calls += 1
+            self.messages_sent += sum(1 for result in results if result.success)
+        
+        return results
+
+
+_transport = None
+
+
+def get_push_transport():
+    """Get the transport configured by FCM_TRANSPORT (a dotted path)"""
+    global _transport
+    if _transport is None:
+        transport_path = getattr(settings, 'FCM_TRANSPORT', 'notification_management.push.FirebaseTransport')
+        _transport = import_string(transport_path)()
+    return _transport
+
+
+class BatchedPushSender:
+    """
+    Send one push to many tokens, grouped into multicast batches that are
+    sent concurrently. Tokens Firebase reports as invalid are deactivated.
+    """
+    
+    def __init__(self, transport=None, batch_size=FCM_MULTICAST_LIMIT, workers=None):
+        self.transport = transport
+        self.batch_size = min(batch_size, FCM_MULTICAST_LIMIT)
+        self.workers = workers or getattr(settings, 'FCM_SEND_WORKERS', 4)
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='fcm-send')
+    
+    def get_transport(self):
+        return self.transport or get_push_transport()
+    
+    def send(self, tokens, title, body, data=None, deactivate_invalid=True):
+        """Send to every token, returns the list of PushResult"""
+        tokens = list(dict.fromkeys(token for token in tokens if token))
+        if not tokens:
+            return []
+        
+        transport = self.get_transport()
+        batches = [tokens[i:i + self.batch_size] for i in range(0, len(tokens), self.batch_size)]
+        futures = [
+            self._executor.submit(self._send_batch, transport, batch, title, body, data)
+            for batch in batches
+        ]
+        
+        results = []
+        for future in futures:
+            results.extend(future.result())
+        
+        invalid_tokens = [result.token for result in results if result.invalid_token]
+        if deactivate_invalid and invalid_tokens:
+            from .models import FCMToken
+            deactivated = FCMToken.objects.filter(token__in=invalid_tokens, is_active=True).update(is_active=False)
+            print(f"🧹 Deactivated {deactivated} invalid FCM tokens")
+        
+        sent = sum(1 for result in results if result.success)
+        print(f"✅ FCM multicast: {sent}/{len(tokens)} delivered in {len(batches)} batches")
+        return results
+    
+    def _send_batch(self, transport, tokens, title, body, data):
+        try:
+            return transport.send_multicast(tokens, title, body, data)
+        except Exception as e:
+            print(f"❌ FCM multicast batch of {len(tokens)} failed: {e}")
+            return [PushResult(token, False, str(e)) for token in tokens]
+
+
+push_sender = BatchedPushSender()
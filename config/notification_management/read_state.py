@@ -0,0 +1,79 @@
+import asyncio
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db.models import Q
+
+from .groups import get_user_group_name
+from .models import Notification
+from . import unread
+
+
+def get_flush_interval():
+    """Seconds a WebSocket connection buffers read marks before writing them"""
+    return getattr(settings, 'NOTIFICATION_READ_FLUSH_MS', 300) / 1000
+
+
+def parse_read_request(data):
+    """
+    Read the ids to mark from a WebSocket message or request body:
+    `notification_ids` (or a single `notification_id`) and/or `up_to_id`.
+    Returns (ids, up_to_id), raises ValueError on malformed values.
+    """
+    ids = data.get('notification_ids') or []
+    if not isinstance(ids, (list, tuple)):
+        raise ValueError('notification_ids must be a list')
+    if data.get('notification_id') is not None:
+        ids = [*ids, data['notification_id']]
+    
+    up_to_id = data.get('up_to_id')
+    return {int(notification_id) for notification_id in ids}, int(up_to_id) if up_to_id is not None else None
+
+
+def mark_read(user_id, ids=None, up_to_id=None):
+    """Mark the given ids and everything up to `up_to_id` as read in one UPDATE, returns the rows changed"""
+    condition = Q()
+    if ids:
+        condition |= Q(id__in=ids)
+    if up_to_id is not None:
+        condition |= Q(id__lte=up_to_id)
+    if not condition:
+        return 0
+    
+    updated = Notification.objects.filter(condition, user_id=user_id, is_read=False).update(is_read=True)
+    unread.adjust([user_id], -updated)
+    return updated
+
+
+def broadcast_unread_count(user_id, unread_count):
+    """Send the new unread count to every WebSocket connection of the user"""
+    try:
+        async_to_sync(get_channel_layer().group_send)(
+            get_user_group_name(user_id),
+            {'type': 'unread_count', 'unread_count': unread_count}
+        )
+    except Exception as e:
+        print(f"❌ Unread count broadcast failed for user {user_id}: {e}")
+
+
+def broadcast_unread_counts(counts):
+    """Send each user in `counts` (user id -> unread count) their new count, all group sends in one batch"""
+    if not counts:
+        return
+    
+    channel_layer = get_channel_layer()
+    
+    async def send_all():
+        results = await asyncio.gather(*(
+            channel_layer.group_send(get_user_group_name(user_id), {'type': 'unread_count', 'unread_count': count})
+            for user_id, count in counts.items()
+        ), return_exceptions=True)
+        failed = sum(1 for result in results if isinstance(result, Exception))
+        if failed:
+            print(f"❌ Unread count broadcast failed for {failed} of {len(results)} users")
+    
+    try:
+        async_to_sync(send_all)()
+    except Exception as e:
+        print(f"❌ Unread count broadcast failed: {e}")
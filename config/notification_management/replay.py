@@ -0,0 +1,158 @@
+import json
+from datetime import datetime, timezone as dt_timezone
+
+import redis
+from django.conf import settings
+
+from utils.redis_client import get_redis
+from .models import Notification
+from .serializers import NotificationSerializer
+
+# Append one notification to the user's stream and trim it to its max length.
+# The floor hash remembers the newest notification that is no longer in the
+# stream (trimmed, or created before the stream existed): a reconnect whose
+# cursor is below the floor cannot be served from Redis.
+APPEND_SCRIPT = """
+local stream, floor = KEYS[1], KEYS[2]
+local maxlen, ttl = tonumber(ARGV[1]), tonumber(ARGV[5])
+if redis.call('EXISTS', floor) == 0 then
+    redis.call('HSET', floor, 'id', tonumber(ARGV[2]) - 1, 'ts', ARGV[3])
+end
+redis.call('XADD', stream, '*', 'id', ARGV[2], 'ts', ARGV[3], 'payload', ARGV[4])
+local excess = redis.call('XLEN', stream) - maxlen
+if excess > 0 then
+    local floor_id = tonumber(redis.call('HGET', floor, 'id'))
+    local floor_ts = redis.call('HGET', floor, 'ts')
+    for _, entry in ipairs(redis.call('XRANGE', stream, '-', '+', 'COUNT', excess)) do
+        local fields = entry[2]
+        if tonumber(fields[2]) > floor_id then floor_id = tonumber(fields[2]) end
+        if tonumber(fields[4]) > tonumber(floor_ts) then floor_ts = fields[4] end
+        redis.call('XDEL', stream, entry[1])
+    end
+    redis.call('HSET', floor, 'id', floor_id, 'ts', floor_ts)
+end
+redis.call('EXPIRE', stream, ttl)
+redis.call('EXPIRE', floor, ttl)
+return excess
+"""
+
+_append_script = None
+
+
+def get_stream_length():
+    return getattr(settings, 'NOTIFICATION_REPLAY_STREAM_LENGTH', 200)
+
+
+def get_replay_limit():
+    return getattr(settings, 'NOTIFICATION_REPLAY_LIMIT', 200)
+
+
+def get_stream_key(user_id):
+    return f"notifications:stream:{user_id}"
+
+
+def get_floor_key(user_id):
+    return f"notifications:stream:{user_id}:floor"
+
+
+def get_append_script():
+    global _append_script
+    if _append_script is None:
+        _append_script = get_redis().register_script(APPEND_SCRIPT)
+    return _append_script
+
+
+def record_notifications(notifications, payload):
+    """
+    Append freshly created notifications to their users' replay streams.
+    `payload` is the shared serialized notification, each entry gets its own id.
+    """
+    if not notifications:
+        return
+    
+    script = get_append_script()
+    ttl = getattr(settings, 'NOTIFICATION_REPLAY_TTL_SECONDS', 7 * 24 * 3600)
+    try:
+        pipe = get_redis().pipeline(transaction=False)
+        for notification in notifications:
+            script(
+                keys=[get_stream_key(notification.user_id), get_floor_key(notification.user_id)],
+                args=[
+                    get_stream_length(),
+                    notification.id,
+                    repr(notification.created_at.timestamp()),
+                    json.dumps({**payload, 'id': notification.id}, default=str),
+                    ttl,
+                ],
+                client=pipe
+            )
+        pipe.execute()
+    except redis.RedisError as e:
+        print(f"❌ Replay stream update failed, reconnects will read from the database: {e}")
+        forget_streams(notification.user_id for notification in notifications)
+
+
+def forget_streams(user_ids):
+    """Drop the floors so the next reconnect of these users falls back to the database"""
+    try:
+        get_redis().delete(*[get_floor_key(user_id) for user_id in user_ids])
+    except redis.RedisError:
+        pass
+
+
+def read_stream(user_id, last_id=None, since=None):
+    """Payloads newer than the cursor from the stream, or None when the stream cannot cover it"""
+    pipe = get_redis().pipeline(transaction=False)
+    pipe.hgetall(get_floor_key(user_id))
+    pipe.xrange(get_stream_key(user_id))
+    floor, entries = pipe.execute()
+    
+    if not floor:
+        return None
+    if last_id is not None and last_id < int(floor['id']):
+        return None
+    if since is not None and since < float(floor['ts']):
+        return None
+    
+    return [
+        json.loads(fields['payload'])
+        for _, fields in entries
+        if (last_id is None or int(fields['id']) > last_id)
+        and (since is None or float(fields['ts']) > since)
+    ]
+
+
+def read_database(user_id, last_id=None, since=None, limit=None):
+    """Payloads newer than the cursor from Postgres, oldest first"""
+    notifications = Notification.objects.filter(user_id=user_id).select_related(
+        'detection', 'detection__camera', 'detection__detection_type'
+    )
+    if last_id is not None:
+        notifications = notifications.filter(id__gt=last_id)
+    if since is not None:
+        notifications = notifications.filter(created_at__gt=datetime.fromtimestamp(since, tz=dt_timezone.utc))
+    return NotificationSerializer(notifications.order_by('id')[:limit], many=True).data
+
+
+def get_missed_notifications(user_id, last_id=None, since=None):
+    """
+    Notifications a reconnecting client missed after `last_id` (a notification
+    id) or `since` (epoch seconds), oldest first. Returns (payloads, source,
+    truncated); Postgres is only read when the Redis stream was trimmed past
+    the cursor or is gone.
+    """
+    limit = get_replay_limit()
+    
+    payloads = None
+    try:
+        payloads = read_stream(user_id, last_id=last_id, since=since)
+    except redis.RedisError as e:
+        print(f"❌ Replay stream read failed for user {user_id}: {e}")
+    
+    source = 'stream'
+    if payloads is None:
+        source = 'database'
+        payloads = list(read_database(user_id, last_id=last_id, since=since, limit=limit + 1))
+    
+    truncated = len(payloads) > limit
+    return payloads[:limit], source, truncated
@@ -0,0 +1,130 @@
+import gzip
+import json
+import os
+import time
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Notification
+from . import unread
+
+# Columns written to archive files
+ARCHIVE_FIELDS = [
+    'id', 'user_id', 'detection_id', 'notification_type', 'title', 'message',
+    'is_read', 'occurrence_count', 'last_occurred_at', 'created_at',
+]
+
+
+def get_retention_policy():
+    """Days read and unread notifications are kept, None keeps them forever"""
+    policy = getattr(settings, 'NOTIFICATION_RETENTION_DAYS', {})
+    return {
+        'read': policy.get('read'),
+        'unread': policy.get('unread'),
+    }
+
+
+def get_expired_filter(policy=None, now=None):
+    """Q matching notifications past the retention policy, None when the policy keeps everything"""
+    policy = policy or get_retention_policy()
+    now = now or timezone.now()
+    
+    condition = Q()
+    if policy.get('read'):
+        condition |= Q(is_read=True, created_at__lt=now - timedelta(days=policy['read']))
+    if policy.get('unread'):
+        condition |= Q(is_read=False, created_at__lt=now - timedelta(days=policy['unread']))
+    return condition or None
+
+
+def fsync_path(path):
+    """fsync a file or a directory"""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def archive_rows(rows, archive_dir):
+    """Write rows to a new gzipped JSON Lines file, returns its path"""
+    os.makedirs(archive_dir, exist_ok=True)
+    path = os.path.join(
+        archive_dir,
+        f"notifications-{timezone.now():%Y%m%d-%H%M%S}-{rows[0]['id']}-{rows[-1]['id']}.jsonl.gz"
+    )
+    
+    # Write, fsync the complete file (gzip trailer included), rename and fsync the
+    # directory, so the archive is durable before its rows are deleted
+    tmp_path = f"{path}.tmp"
+    with gzip.open(tmp_path, 'wt', encoding='utf-8') as f:
+        for row in rows:
+            f.write(json.dumps(row, default=str))
+            f.write('\n')
+    fsync_path(tmp_path)
+    os.replace(tmp_path, path)
+    fsync_path(archive_dir)
+    return path
+
+
+def purge_batch(ids):
+    """Delete one batch in its own short transaction and fix the unread counters of its users"""
+    with transaction.atomic():
+        unread_by_user = Counter(
+            Notification.objects.filter(id__in=ids, is_read=False).values_list('user_id', flat=True)
+        )
+        _, deleted_per_model = Notification.objects.filter(id__in=ids).delete()
+    
+    for user_id, count in unread_by_user.items():
+        unread.adjust([user_id], -count)
+    return deleted_per_model.get(Notification._meta.label, 0)
+
+
+def purge_expired(policy=None, batch_size=None, archive_dir=None, pause=0, dry_run=False, log=print):
+    """
+    Delete notifications past the retention policy in batches of `batch_size`,
+    oldest first, archiving each batch to `archive_dir` first when given.
+    Returns (deleted, archive_files).
+    """
+    batch_size = batch_size or getattr(settings, 'NOTIFICATION_RETENTION_BATCH_SIZE', 2000)
+    expired = get_expired_filter(policy)
+    if expired is None:
+        log("Retention policy keeps every notification, nothing to purge")
+        return 0, []
+    
+    # The policy cut-off is fixed when the run starts, rows expiring meanwhile wait for the next run
+    expired_notifications = Notification.objects.filter(expired)
+    
+    if dry_run:
+        count = expired_notifications.count()
+        log(f"{count} notifications would be purged")
+        return count, []
+    
+    deleted = 0
+    archive_files = []
+    last_key = None
+    while True:
+        batch = expired_notifications
+        if last_key is not None:
+            batch = batch.filter(Q(created_at__gt=last_key[0]) | Q(created_at=last_key[0], id__gt=last_key[1]))
+        rows = list(batch.order_by('created_at', 'id').values(*ARCHIVE_FIELDS)[:batch_size])
+        if not rows:
+            break
+        last_key = (rows[-1]['created_at'], rows[-1]['id'])
+        
+        if archive_dir:
+            archive_files.append(archive_rows(rows, archive_dir))
+        
+        deleted += purge_batch([row['id'] for row in rows])
+        log(f"Purged {deleted} notifications so far (up to {last_key[0]:%Y-%m-%d %H:%M})")
+        
+        # Gives replication and concurrent writers room between batches
+        if pause:
+            time.sleep(pause)
+    
+    return deleted, archive_files
@@ -10,5 +10,16 @@ class NotificationSerializer(serializers.ModelSerializer):
         model = Notification
         fields = [
             'id', 'notification_type', 'title', 'message', 'is_read', 
+            'occurrence_count', 'last_occurred_at',
             'created_at', 'detection_id', 'detection_type', 'camera_id'
-        ]
\ No newline at end of file
+        ]
+
+class NotificationCompactSerializer(serializers.ModelSerializer):
+    """List entry without the detection, camera and type joins"""
+    
+    class Meta:
+        model = Notification
+        fields = [
+            'id', 'notification_type', 'title', 'is_read',
+            'occurrence_count', 'created_at', 'detection_id'
+        ]
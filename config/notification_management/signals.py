@@ -1,86 +1,61 @@
-from django.db.models.signals import post_save
-from django.dispatch import receiver
-from channels.layers import get_channel_layer
 from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 from detection_management.models import Detection
+from detection_management.signals import detections_created
 from project_management.models import UserProjectRole
-from .models import Notification
-from .serializers import NotificationSerializer
-from .firebase_utils import send_fcm_notification
+from .dispatcher import get_lane_for_detection_type, notification_dispatcher
+from .fanout import fanout_detection
+from .groups import get_user_group_name
 
 @receiver(post_save, sender=Detection)
 def create_detection_notification(sender, instance, created, **kwargs):
     """
     Single receiver function that handles both WebSocket and FCM notifications
     """
-    if created and not instance.is_false_positive:
+    if created:
         print(f"🎯 Detection signal fired for detection ID: {instance.id}")
-        
-        project = instance.camera.project
-        users_to_notify = []
-        
-        # Get all users with access to this project
-        project_users = UserProjectRole.objects.filter(
-            project=project, 
-            is_active=True
-        ).select_related('user')
-        
-        for project_user in project_users:
-            users_to_notify.append(project_user.user)
-        
-        print(f"📨 Will notify {len(users_to_notify)} users")
-        
-        # Create notifications and send both WebSocket and FCM for each user
+        notify_detection(instance)
+
+
+@receiver(detections_created, sender=Detection)
+def create_bulk_detection_notifications(sender, detections, **kwargs):
+    """Handle the single event sent for detections saved with bulk_create"""
+    print(f"🎯 Bulk detection signal fired for {len(detections)} detections")
+    for detection in detections:
+        notify_detection(detection)
+
+
+def notify_detection(instance):
+    """Queue the notification fanout for a detection once its transaction commits"""
+    if instance.is_false_positive:
+        return
+    
+    detection_id = instance.id
+    lane = get_lane_for_detection_type(instance.detection_type.name)
+    transaction.on_commit(lambda: notification_dispatcher.submit(fanout_detection, detection_id, lane=lane))
+
+
+def send_projects_changed(user_ids):
+    """Tell the users' open WebSockets to rejoin their project groups once the change commits"""
+    user_ids = {user_id for user_id in user_ids if user_id is not None}
+    
+    def send():
         channel_layer = get_channel_layer()
-        
-        for user in users_to_notify:
-            print(f"📤 Processing notification for user: {user.username}")
-            
-            # Create single notification in database
-            notification = Notification.objects.create(
-                user=user,
-                detection=instance,
-                notification_type='detection',
-                title=f'New {instance.detection_type.name.capitalize()} Detection',
-                message=f'Camera #{instance.camera.id} detected {instance.detection_type.name} with {instance.confidence_score:.1%} confidence'
-            )
-            
-            print(f"✅ Database notification created: ID {notification.id}")
-            
-            # Send WebSocket notification (for real-time updates when user is active)
-            try:
-                notification_data = NotificationSerializer(notification).data
-                group_name = f"notifications_{user.id}"
-                
-                async_to_sync(channel_layer.group_send)(
-                    group_name,
-                    {
-                        'type': 'notification_message',
-                        'notification': notification_data
-                    }
-                )
-                print(f"✅ WebSocket notification sent to {user.username}")
-            except Exception as e:
-                print(f"❌ WebSocket notification failed for {user.username}: {e}")
-            
-            # Send FCM notification (for push notifications when user is not active)
+        for user_id in user_ids:
             try:
-                send_fcm_notification(
-                    user=user,
-                    title=f'🚨 New {instance.detection_type.name} Detection',
-                    body=f'Camera #{instance.camera.id} detected {instance.detection_type.name}',
-                    data={
-                        'notification_id': str(notification.id),
-                        'detection_id': str(instance.id),
-                        'type': 'detection',
-                        'camera_id': str(instance.camera.id),
-                        'project_id': str(project.id),
-                    },
-                    #high_priority=True,
-                    #heads_up=True  # Show as heads-up notification
-                )
-                print(f"✅ FCM notification sent to {user.username}")
+                async_to_sync(channel_layer.group_send)(get_user_group_name(user_id), {'type': 'projects_changed'})
             except Exception as e:
-                print(f"❌ FCM notification failed for {user.username}: {e}")
-        
-        print(f"🎉 Detection notification processing completed for {len(users_to_notify)} users")
\ No newline at end of file
+                print(f"❌ Project change broadcast failed for user {user_id}: {e}")
+    
+    if user_ids:
+        transaction.on_commit(send)
+
+
+@receiver([post_save, post_delete], sender=UserProjectRole)
+def refresh_member_project_groups(sender, instance, **kwargs):
+    """Adding, (de)activating or removing a role changes which project groups the user is in"""
+    send_projects_changed([instance.user_id])
+
@@ -1,3 +1,489 @@
-from django.test import TestCase
+import asyncio
+import gzip
+import json
+import os
+import tempfile
+import threading
+from datetime import timedelta
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from authentication.models import AppUser
+from detection_management.models import Detection, DetectionIncident, DetectionType
+from project_management.models import Camera, FarmBoundary, Project, UserProjectRole
+from utils.redis_client import get_redis, redis_available
+from . import coalescing, outbox, read_state, replay, retention, unread
+from .consumers import NotificationConsumer
+from .dispatcher import LANE_CRITICAL, LANE_NORMAL, LANE_SYSTEM, NotificationDispatcher
+from .fanout import fanout_detection, flush_digest, get_member_project_ids, get_project_recipients
+from .groups import get_project_group_name, get_user_group_name
+from .models import Notification, PushOutbox
+from .push import BatchedPushSender, FakeFCMTransport
+
+
+@mock.patch('notification_management.coalescing.open_window', return_value=0)
+@mock.patch('notification_management.outbox.push_sender')
+@mock.patch('notification_management.presence.get_online_user_ids', return_value=set())
+@mock.patch('notification_management.fanout.get_channel_layer')
+class DetectionFanoutQueryTests(TestCase):
+    def setUp(self):
+        owner = AppUser.objects.create_user(username='owner', password='secret', user_type='supervisor')
+        self.project = Project.objects.create(name='Test Farm', created_by=owner)
+        boundary = FarmBoundary.objects.create(project=self.project)
+        self.camera = Camera.objects.create(
+            project=self.project,
+            farm_boundary=boundary,
+            camera_type='cellular',
+            cellular_identifier='test-camera'
+        )
+        self.detection_type = DetectionType.objects.create(name='fire')
+        self.member_count = 0
+    
+    def add_members(self, count):
+        for _ in range(count):
+            self.member_count += 1
+            user = AppUser.objects.create_user(
+                username=f'client{self.member_count}', password='secret', user_type='client'
+            )
+            UserProjectRole.objects.create(user=user, project=self.project, role='client')
+    
+    def count_fanout_queries(self):
+        detection = Detection.objects.create(
+            camera=self.camera,
+            detection_type=self.detection_type,
+            confidence_score=0.9,
+            bounding_boxes=[],
+            image_original='test_original.jpg',
+            image_annotated='test_annotated.jpg'
+        )
+        with CaptureQueriesContext(connection) as queries:
+            fanout_detection(detection.id)
+        return len(queries)
+    
+    def test_query_count_does_not_grow_with_members(self, get_channel_layer, get_online_user_ids, push_sender, open_window):
+        get_channel_layer.return_value.group_send = mock.AsyncMock()
+        self.add_members(1)
+        small_project_queries = self.count_fanout_queries()
+        
+        self.add_members(24)
+        large_project_queries = self.count_fanout_queries()
+        
+        self.assertEqual(small_project_queries, large_project_queries)
+        self.assertEqual(Notification.objects.count(), 1 + 25)
+    
+    def test_websocket_broadcast_once_per_project(self, get_channel_layer, get_online_user_ids, push_sender, open_window):
+        get_channel_layer.return_value.group_send = mock.AsyncMock()
+        self.add_members(3)
+        self.count_fanout_queries()
+        
+        group_send = get_channel_layer.return_value.group_send
+        group_send.assert_called_once()
+        self.assertEqual(group_send.call_args.args[0], get_project_group_name(self.project.id))
+        self.assertIsNone(group_send.call_args.args[1]['notification']['id'])
+
+
+
+class ProjectGroupMembershipTests(TestCase):
+    def test_groups_follow_notification_recipients(self):
+        owner = AppUser.objects.create_user(username='owner', password='secret', user_type='supervisor')
+        member = AppUser.objects.create_user(username='member', password='secret', user_type='client')
+        former = AppUser.objects.create_user(username='former', password='secret', user_type='client')
+        project = Project.objects.create(name='Test Farm', created_by=owner)
+        UserProjectRole.objects.create(user=member, project=project, role='client')
+        UserProjectRole.objects.create(user=former, project=project, role='client', is_active=False)
+        
+        recipients = {user.id for user in get_project_recipients(project.id)}
+        self.assertEqual(recipients, {member.id})
+        for user in (owner, member, former):
+            self.assertEqual(project.id in get_member_project_ids(user.id), user.id in recipients)
+
+@skipUnless(redis_available(), 'Redis is not reachable')
+@override_settings(NOTIFICATION_COALESCE_WINDOWS={'fire': 30})
+@mock.patch('notification_management.outbox.push_sender')
+@mock.patch('notification_management.presence.get_online_user_ids', return_value=set())
+@mock.patch('notification_management.fanout.notification_dispatcher')
+@mock.patch('notification_management.fanout.get_channel_layer')
+class DetectionCoalescingTests(TestCase):
+    def setUp(self):
+        owner = AppUser.objects.create_user(username='owner', password='secret', user_type='supervisor')
+        project = Project.objects.create(name='Test Farm', created_by=owner)
+        self.camera = Camera.objects.create(
+            project=project,
+            farm_boundary=FarmBoundary.objects.create(project=project),
+            camera_type='cellular',
+            cellular_identifier='test-camera'
+        )
+        self.detection_type = DetectionType.objects.create(name='fire')
+        self.incident = DetectionIncident.objects.create(camera=self.camera, detection_type=self.detection_type)
+        
+        self.member = AppUser.objects.create_user(username='client', password='secret', user_type='client')
+        UserProjectRole.objects.create(user=self.member, project=project, role='client')
+        
+        get_redis().delete(
+            coalescing.get_window_key(self.camera.id, 'fire'),
+            coalescing.get_pending_key(self.camera.id, 'fire')
+        )
+    
+    def create_detection(self, opens_incident):
+        return Detection.objects.create(
+            camera=self.camera,
+            detection_type=self.detection_type,
+            confidence_score=0.9,
+            bounding_boxes=[],
+            image_original='test_original.jpg',
+            image_annotated='test_annotated.jpg',
+            incident=self.incident,
+            opens_incident=opens_incident
+        )
+    
+    def test_incident_frames_are_counted_and_digested(self, get_channel_layer, notification_dispatcher, get_online_user_ids, push_sender):
+        group_send = get_channel_layer.return_value.group_send = mock.AsyncMock()
+        
+        opening = self.create_detection(opens_incident=True)
+        fanout_detection(opening.id)
+        notification_dispatcher.schedule.assert_called_once()
+        window, flush, *flush_args = notification_dispatcher.schedule.call_args.args
+        self.assertEqual((window, flush), (30, flush_digest))
+        
+        # Frames continuing the incident while the window is open only bump the counter
+        for _ in range(2):
+            fanout_detection(self.create_detection(opens_incident=False).id)
+        notification_dispatcher.schedule.assert_called_once()
+        self.assertEqual(Notification.objects.get(detection=opening, user=self.member).occurrence_count, 3)
+        
+        group_send.reset_mock()
+        flush_digest(*flush_args)
+        digest = group_send.call_args.args[1]['notification']
+        self.assertEqual(digest['notification_type'], 'digest')
+        self.assertEqual(digest['occurrence_count'], 2)
+        
+        # The next frame after the digest opens a new window
+        fanout_detection(self.create_detection(opens_incident=False).id)
+        self.assertEqual(notification_dispatcher.schedule.call_count, 2)
+        self.assertEqual(Notification.objects.get(detection=opening, user=self.member).occurrence_count, 4)
+
+
+@override_settings(
+    PUSH_OUTBOX_MAX_ATTEMPTS=3,
+    PUSH_OUTBOX_BACKOFF_SECONDS=10,
+    PUSH_OUTBOX_LEASE_SECONDS=60
+)
+class PushOutboxTests(TestCase):
+    def setUp(self):
+        self.failing_sender = BatchedPushSender(transport=FakeFCMTransport(latency=0, failure_rate=1.0), workers=1)
+        self.working_sender = BatchedPushSender(transport=FakeFCMTransport(latency=0), workers=1)
+    
+    def create_delivery(self, token='device-token'):
+        return PushOutbox.objects.create(
+            idempotency_key=f'test:{token}',
+            token=token,
+            title='Fire detected',
+            body='Fire detected on camera 1',
+            next_attempt_at=timezone.now()
+        )
+    
+    def make_due(self, delivery):
+        PushOutbox.objects.filter(id=delivery.id).update(next_attempt_at=timezone.now() - timedelta(seconds=1))
+    
+    def test_claim_leases_rows_until_expiry(self):
+        delivery = self.create_delivery()
+        
+        before = timezone.now()
+        self.assertEqual([row.id for row in outbox.claim_batch(10)], [delivery.id])
+        delivery.refresh_from_db()
+        self.assertEqual((delivery.status, delivery.attempts), ('sending', 1))
+        self.assertGreaterEqual(delivery.next_attempt_at, before + timedelta(seconds=60))
+        
+        # A leased row is not handed to another drainer
+        self.assertEqual(outbox.claim_batch(10), [])
+        
+        # Once the lease ran out (the drainer died mid-send) the row is claimed again
+        self.make_due(delivery)
+        self.assertEqual([row.id for row in outbox.claim_batch(10)], [delivery.id])
+        delivery.refresh_from_db()
+        self.assertEqual((delivery.status, delivery.attempts), ('sending', 2))
+    
+    def test_backoff_then_dead(self):
+        delivery = self.create_delivery()
+        
+        # Each failure waits twice as long as the previous one, with +-20% jitter
+        for attempts, backoff in ((1, 10), (2, 20)):
+            before = timezone.now()
+            outbox.drain_outbox(sender=self.failing_sender, schedule_retries=False)
+            after = timezone.now()
+            
+            delivery.refresh_from_db()
+            self.assertEqual((delivery.status, delivery.attempts), ('retrying', attempts))
+            self.assertEqual(delivery.last_error, 'Service unavailable')
+            self.assertGreaterEqual(delivery.next_attempt_at, before + timedelta(seconds=backoff * 0.8))
+            self.assertLessEqual(delivery.next_attempt_at, after + timedelta(seconds=backoff * 1.2))
+            
+            # Not due yet, nothing is claimed
+            self.assertEqual(outbox.claim_batch(10), [])
+            self.make_due(delivery)
+        
+        totals = outbox.drain_outbox(sender=self.failing_sender, schedule_retries=False)
+        self.assertEqual(totals['dead'], 1)
+        delivery.refresh_from_db()
+        self.assertEqual((delivery.status, delivery.attempts), ('dead', 3))
+        self.assertIsNone(delivery.sent_at)
+        
+        # Dead rows are never claimed again
+        self.make_due(delivery)
+        self.assertEqual(outbox.claim_batch(10), [])
+    
+    def test_sent_and_invalid_tokens(self):
+        sent = self.create_delivery()
+        invalid = self.create_delivery(token='invalid-token')
+        
+        totals = outbox.drain_outbox(sender=self.working_sender, schedule_retries=False)
+        self.assertEqual((totals['sent'], totals['dead']), (1, 1))
+        
+        sent.refresh_from_db()
+        self.assertEqual((sent.status, sent.attempts), ('sent', 1))
+        self.assertIsNotNone(sent.sent_at)
+        
+        # An unregistered token is dead on the first attempt, retrying can never succeed
+        invalid.refresh_from_db()
+        self.assertEqual((invalid.status, invalid.attempts), ('dead', 1))
+
+
+@skipUnless(redis_available(), 'Redis is not reachable')
+@override_settings(NOTIFICATION_REPLAY_STREAM_LENGTH=3, NOTIFICATION_REPLAY_LIMIT=10)
+class ReplayStreamTests(TestCase):
+    def setUp(self):
+        self.user = AppUser.objects.create_user(username='client', password='secret', user_type='client')
+        get_redis().delete(replay.get_stream_key(self.user.id), replay.get_floor_key(self.user.id))
+        
+        self.ids = []
+        for index in range(5):
+            notification = Notification.objects.create(user=self.user, title=f'Alert {index}', message='Fire detected')
+            replay.record_notifications([notification], {'title': notification.title})
+            self.ids.append(notification.id)
+    
+    def get_missed(self, last_id):
+        payloads, source, truncated = replay.get_missed_notifications(self.user.id, last_id=last_id)
+        return [payload['id'] for payload in payloads], source, truncated
+    
+    def test_cursor_above_the_floor_reads_the_stream(self):
+        # The stream keeps the last 3 notifications, the floor is the newest one trimmed
+        self.assertEqual(self.get_missed(self.ids[2]), (self.ids[3:], 'stream', False))
+        self.assertEqual(self.get_missed(self.ids[1]), (self.ids[2:], 'stream', False))
+        self.assertEqual(self.get_missed(self.ids[4]), ([], 'stream', False))
+    
+    def test_cursor_below_the_floor_reads_the_database(self):
+        self.assertEqual(self.get_missed(self.ids[0]), (self.ids[1:], 'database', False))
+    
+    def test_lost_stream_reads_the_database(self):
+        replay.forget_streams([self.user.id])
+        self.assertEqual(self.get_missed(self.ids[2]), (self.ids[3:], 'database', False))
+    
+    @override_settings(NOTIFICATION_REPLAY_LIMIT=2)
+    def test_truncated_to_the_limit(self):
+        self.assertEqual(self.get_missed(self.ids[0]), (self.ids[1:3], 'database', True))
+
+
+@override_settings(NOTIFICATION_READ_FLUSH_MS=20)
+class ReadMarkBatchingTests(TestCase):
+    def setUp(self):
+        self.user = AppUser.objects.create_user(username='client', password='secret', user_type='client')
+        self.ids = [
+            Notification.objects.create(user=self.user, title=f'Alert {index}', message='Fire detected').id
+            for index in range(5)
+        ]
+    
+    def create_consumer(self):
+        consumer = NotificationConsumer()
+        consumer.user = self.user
+        consumer.group_name = get_user_group_name(self.user.id)
+        consumer.channel_layer = mock.Mock(group_send=mock.AsyncMock())
+        consumer.update_presence = mock.AsyncMock()
+        consumer.write_read_marks = mock.AsyncMock(return_value=(3, 2))
+        return consumer
+    
+    def test_marks_within_the_interval_are_written_once(self):
+        consumer = self.create_consumer()
+        
+        async def send_marks():
+            consumer.buffer_read_marks({1}, None)
+            consumer.buffer_read_marks({2, 3}, 10)
+            consumer.buffer_read_marks(set(), 5)
+            consumer.write_read_marks.assert_not_awaited()
+            await asyncio.sleep(0.1)
+        
+        async_to_sync(send_marks)()
+        consumer.write_read_marks.assert_awaited_once_with({1, 2, 3}, 10)
+        consumer.channel_layer.group_send.assert_awaited_once_with(
+            consumer.group_name, {'type': 'unread_count', 'unread_count': 2, 'marked_read': 3}
+        )
+        self.assertIsNone(consumer.read_flush_task)
+        self.assertEqual((consumer.pending_read_ids, consumer.pending_read_up_to), (set(), None))
+    
+    def test_disconnect_flushes_pending_marks(self):
+        consumer = self.create_consumer()
+        
+        async def mark_and_disconnect():
+            consumer.buffer_read_marks({4}, None)
+            await consumer.disconnect(1000)
+        
+        async_to_sync(mark_and_disconnect)()
+        consumer.write_read_marks.assert_awaited_once_with({4}, None)
+    
+    def test_mark_read_is_one_update(self):
+        with mock.patch('notification_management.unread.adjust') as adjust, self.assertNumQueries(1):
+            updated = read_state.mark_read(self.user.id, ids={self.ids[4]}, up_to_id=self.ids[1])
+        
+        self.assertEqual(updated, 3)
+        adjust.assert_called_once_with([self.user.id], -3)
+        self.assertEqual(
+            set(Notification.objects.filter(is_read=True).values_list('id', flat=True)),
+            {self.ids[0], self.ids[1], self.ids[4]}
+        )
+
+
+class NotificationPaginationTests(TestCase):
+    def setUp(self):
+        self.user = AppUser.objects.create_user(username='client', password='secret', user_type='client')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        
+        # Pairs of rows share a created_at, the id breaks the tie
+        start = timezone.now() - timedelta(hours=1)
+        for index in range(7):
+            notification = Notification.objects.create(user=self.user, title=f'Alert {index}', message='Fire detected')
+            Notification.objects.filter(id=notification.id).update(created_at=start + timedelta(minutes=index // 2))
+        self.expected = list(
+            Notification.objects.order_by('-created_at', '-id').values_list('id', flat=True)
+        )
+    
+    def get_page(self, cursor=None):
+        params = {'page_size': 3}
+        if cursor:
+            params['cursor'] = cursor
+        response = self.client.get(reverse('notifications'), params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+    
+    def test_pages_are_stable_while_notifications_arrive(self):
+        seen = []
+        cursor = None
+        while True:
+            page = self.get_page(cursor)
+            seen.extend(notification['id'] for notification in page['results'])
+            cursor = page['next_cursor']
+            if cursor is None:
+                break
+            # A new notification between two pages neither shifts nor repeats rows
+            Notification.objects.create(user=self.user, title='Newer', message='Fire detected')
+        
+        self.assertEqual(seen, self.expected)
+    
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse('notifications'), {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 400)
+
+
+class RetentionPurgeTests(TestCase):
+    policy = {'read': 30, 'unread': 90}
+    
+    def setUp(self):
+        self.user = AppUser.objects.create_user(username='client', password='secret', user_type='client')
+        now = timezone.now()
+        self.ids = {}
+        for name, is_read, days in (
+            ('old_read', True, 31),
+            ('recent_read', True, 29),
+            ('read_age_unread', False, 31),
+            ('old_unread', False, 91),
+            ('recent_unread', False, 89),
+        ):
+            notification = Notification.objects.create(user=self.user, title=name, message='Fire detected', is_read=is_read)
+            Notification.objects.filter(id=notification.id).update(created_at=now - timedelta(days=days))
+            self.ids[name] = notification.id
+    
+    def test_cut_offs_per_read_state(self):
+        self.assertEqual(retention.purge_expired(self.policy, dry_run=True, log=lambda message: None), (2, []))
+        
+        with tempfile.TemporaryDirectory() as archive_dir, mock.patch('notification_management.unread.adjust') as adjust:
+            deleted, archive_files = retention.purge_expired(
+                self.policy, batch_size=1, archive_dir=archive_dir, log=lambda message: None
+            )
+            
+            # One archive per batch, oldest first
+            archived_ids = []
+            for path in archive_files:
+                self.assertEqual(os.path.dirname(path), archive_dir)
+                with gzip.open(path, 'rt', encoding='utf-8') as f:
+                    archived_ids.extend(json.loads(line)['id'] for line in f)
+            self.assertFalse([name for name in os.listdir(archive_dir) if name.endswith('.tmp')])
+        
+        self.assertEqual(deleted, 2)
+        self.assertEqual(archived_ids, [self.ids['old_unread'], self.ids['old_read']])
+        self.assertEqual(
+            set(Notification.objects.values_list('id', flat=True)),
+            {self.ids['recent_read'], self.ids['read_age_unread'], self.ids['recent_unread']}
+        )
+        # Only the purged unread notification comes off the counter
+        adjust.assert_called_once_with([self.user.id], -1)
+    
+    def test_policy_keeping_everything(self):
+        self.assertEqual(retention.purge_expired({'read': None, 'unread': None}, log=lambda message: None), (0, []))
+        self.assertEqual(Notification.objects.count(), 5)
+
+
+class DispatcherScheduleTests(SimpleTestCase):
+    def test_delayed_tasks_share_one_scheduler_thread(self):
+        dispatcher = NotificationDispatcher(lane_workers={LANE_CRITICAL: 1, LANE_NORMAL: 0, LANE_SYSTEM: 1})
+        ran = []
+        done = threading.Event()
+        
+        def task(name):
+            ran.append(name)
+            if len(ran) == 3:
+                done.set()
+        
+        dispatcher.schedule(0.3, task, 'last')
+        dispatcher.schedule(0.1, task, 'first')
+        dispatcher.schedule(0.2, task, 'second', lane=LANE_CRITICAL)
+        
+        # No thread per delayed task, they wait in the scheduler's heap
+        self.assertFalse([thread for thread in threading.enumerate() if isinstance(thread, threading.Timer)])
+        self.assertEqual(len(dispatcher._scheduled), 3)
+        
+        self.assertTrue(done.wait(5))
+        self.assertEqual(ran, ['first', 'second', 'last'])
+
+
+@skipUnless(redis_available(), 'Redis is not reachable')
+class MarkAllReadTests(TestCase):
+    def setUp(self):
+        self.user = AppUser.objects.create_user(username='client', password='secret', user_type='client')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        for index in range(3):
+            Notification.objects.create(user=self.user, title=f'Alert {index}', message='Fire detected')
+        get_redis().delete(unread.get_unread_key(self.user.id))
+    
+    @mock.patch('notification_management.read_state.broadcast_unread_count')
+    def test_counter_keeps_increments_after_the_update(self, broadcast_unread_count):
+        # One more notification was counted by a fanout that commits after the UPDATE
+        get_redis().set(unread.get_unread_key(self.user.id), 4)
+        
+        response = self.client.post(reverse('mark_all_read'))
+        self.assertEqual(response.json()['updated'], 3)
+        self.assertEqual(response.json()['unread_count'], 1)
+        self.assertEqual(unread.get_unread_count(self.user.id), 1)
+        broadcast_unread_count.assert_called_once_with(self.user.id, 1)
+    
+    @mock.patch('notification_management.read_state.broadcast_unread_count')
+    def test_missing_counter_is_recounted(self, broadcast_unread_count):
+        response = self.client.post(reverse('mark_all_read'))
+        self.assertEqual(response.json()['unread_count'], 0)
+        broadcast_unread_count.assert_called_once_with(self.user.id, 0)
@@ -0,0 +1,152 @@
+import redis
+from django.conf import settings
+from django.db.models import Count
+
+from utils.redis_client import get_redis
+from .models import Notification
+
+# Adjust existing counters only, a missing counter is rebuilt from Postgres on
+# its next read. Counters never go below zero. Returns the new value of each
+# key, false for missing counters.
+ADJUST_SCRIPT = """
+local counts = {}
+for i, key in ipairs(KEYS) do
+    counts[i] = false
+    if redis.call('EXISTS', key) == 1 then
+        local count = redis.call('INCRBY', key, ARGV[1])
+        if count < 0 then
+            redis.call('SET', key, 0, 'KEEPTTL')
+            count = 0
+        end
+        counts[i] = count
+    end
+end
+return counts
+"""
+
+_adjust_script = None
+
+
+def get_unread_key(user_id):
+    return f"notifications:unread:{user_id}"
+
+
+def get_counter_ttl():
+    # Counters expire and are recounted from Postgres, which bounds any drift
+    return getattr(settings, 'NOTIFICATION_UNREAD_TTL_SECONDS', 3600)
+
+
+def count_unread(user_id):
+    return Notification.objects.filter(user_id=user_id, is_read=False).count()
+
+
+def get_unread_count(user_id):
+    """Unread notifications of the user from the Redis counter, counted in Postgres on a miss"""
+    try:
+        cached = get_redis().get(get_unread_key(user_id))
+        if cached is not None:
+            return int(cached)
+    except redis.RedisError as e:
+        print(f"❌ Unread counter read failed for user {user_id}: {e}")
+        return count_unread(user_id)
+    
+    unread_count = count_unread(user_id)
+    try:
+        get_redis().set(get_unread_key(user_id), unread_count, ex=get_counter_ttl(), nx=True)
+    except redis.RedisError:
+        pass
+    return unread_count
+
+
+def get_unread_counts(user_ids):
+    """Unread counts of many users, from their counters and one grouped Postgres count for the missing ones"""
+    user_ids = list(user_ids)
+    if not user_ids:
+        return {}
+    
+    keys = [get_unread_key(user_id) for user_id in user_ids]
+    try:
+        cached = get_redis().mget(keys)
+    except redis.RedisError as e:
+        print(f"❌ Unread counter read failed: {e}")
+        cached = [None] * len(user_ids)
+    
+    counts = {user_id: int(value) for user_id, value in zip(user_ids, cached) if value is not None}
+    missing = [user_id for user_id in user_ids if user_id not in counts]
+    if missing:
+        counted = dict(
+            Notification.objects.filter(user_id__in=missing, is_read=False)
+            .values('user_id').annotate(unread=Count('id')).values_list('user_id', 'unread')
+        )
+        try:
+            pipe = get_redis().pipeline(transaction=False)
+            for user_id in missing:
+                counts[user_id] = counted.get(user_id, 0)
+                pipe.set(get_unread_key(user_id), counts[user_id], ex=get_counter_ttl(), nx=True)
+            pipe.execute()
+        except redis.RedisError:
+            pass
+    return counts
+
+
+def adjust(user_ids, amount):
+    """Add `amount` to the counters of `user_ids` that are cached, returns their new values by user id"""
+    global _adjust_script
+    user_ids = list(user_ids)
+    if not user_ids or not amount:
+        return {}
+    
+    try:
+        if _adjust_script is None:
+            _adjust_script = get_redis().register_script(ADJUST_SCRIPT)
+        counts = _adjust_script(keys=[get_unread_key(user_id) for user_id in user_ids], args=[amount])
+    except redis.RedisError as e:
+        print(f"❌ Unread counter update failed, dropping the counters: {e}")
+        forget(user_ids)
+        return {}
+    # Lua false comes back as None
+    return {user_id: int(count) for user_id, count in zip(user_ids, counts) if count is not None}
+
+
+def forget(user_ids):
+    try:
+        get_redis().delete(*[get_unread_key(user_id) for user_id in user_ids])
+    except redis.RedisError:
+        pass
+
+
+def reconcile(user_ids):
+    """Overwrite the cached counters of `user_ids` with the counts from Postgres, returns how many changed"""
+    user_ids = list(user_ids)
+    if not user_ids:
+        return 0
+    
+    counts = dict(
+        Notification.objects.filter(user_id__in=user_ids, is_read=False)
+        .values('user_id').annotate(unread=Count('id')).values_list('user_id', 'unread')
+    )
+    
+    keys = [get_unread_key(user_id) for user_id in user_ids]
+    cached = get_redis().mget(keys)
+    
+    pipe = get_redis().pipeline(transaction=False)
+    changed = 0
+    for user_id, key, value in zip(user_ids, keys, cached):
+        if value is not None and int(value) != counts.get(user_id, 0):
+            pipe.set(key, counts.get(user_id, 0), keepttl=True)
+            changed += 1
+    pipe.execute()
+    return changed
+
+
+def iter_cached_user_ids(batch_size=500):
+    """User ids that currently have a cached counter, in batches"""
+    prefix = get_unread_key('')
+    batch = []
+    for key in get_redis().scan_iter(match=f"{prefix}*", count=batch_size):
+        batch.append(int(key[len(prefix):]))
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
@@ -1,10 +1,16 @@
 from django.urls import path
-from .views import NotificationListView, mark_notification_read, mark_all_read, store_fcm_token
+from .views import (
+    NotificationListView, mark_notification_read, mark_notifications_read, mark_all_read, unread_count,
+    store_fcm_token, dispatch_stats
+)
 
 urlpatterns = [
     path('notifications/', NotificationListView.as_view(), name='notifications'),
     path('notifications/<int:notification_id>/read/', mark_notification_read, name='mark_notification_read'),
+    path('notifications/mark-read/', mark_notifications_read, name='mark_notifications_read'),
     path('notifications/mark-all-read/', mark_all_read, name='mark_all_read'),
+    path('notifications/unread-count/', unread_count, name='notification_unread_count'),
+    path('notifications/dispatch-stats/', dispatch_stats, name='notification_dispatch_stats'),
 
 
     path('fcm-token/', store_fcm_token, name='store_fcm_token'),
@@ -1,37 +1,119 @@
+# Django imports
+from django.conf import settings
+from django.utils.dateparse import parse_datetime
+
 # Django REST Framework imports
 from rest_framework import generics, status
 from rest_framework.decorators import api_view, permission_classes
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
 
 # Local app imports
+from .dispatcher import notification_dispatcher
 from .models import Notification, FCMToken
-from .serializers import NotificationSerializer
+from .outbox import get_outbox_stats
+from . import read_state, unread
+from .pagination import NotificationKeysetPagination
+from .serializers import NotificationCompactSerializer, NotificationSerializer
 
 
 class NotificationListView(generics.ListAPIView):
+    """
+    Notifications of the user, newest first. Query parameters:
+    `page_size` / `cursor` for keyset pagination, `compact=1` for entries
+    without detection data, `since` / `before` (ISO datetimes) for incremental sync.
+    Without pagination parameters the newest NOTIFICATION_LIST_LIMIT are returned as a list.
+    """
     serializer_class = NotificationSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = NotificationKeysetPagination
+    
+    def is_compact(self):
+        return self.request.query_params.get('compact') in ('1', 'true', 'yes')
+    
+    def get_serializer_class(self):
+        return NotificationCompactSerializer if self.is_compact() else NotificationSerializer
     
     def get_queryset(self):
-        return Notification.objects.filter(user=self.request.user).select_related('detection', 'detection__camera', 'detection__detection_type')
+        notifications = Notification.objects.filter(user=self.request.user)
+        
+        for param, lookup in (('since', 'created_at__gt'), ('before', 'created_at__lt')):
+            value = self.request.query_params.get(param)
+            if not value:
+                continue
+            try:
+                parsed = parse_datetime(value)
+            except ValueError:
+                parsed = None
+            if parsed is None:
+                raise ValidationError({param: 'Expected an ISO 8601 datetime'})
+            notifications = notifications.filter(**{lookup: parsed})
+        
+        if self.is_compact():
+            return notifications
+        return notifications.select_related('detection', 'detection__camera', 'detection__detection_type')
+    
+    def paginate_queryset(self, queryset):
+        params = self.request.query_params
+        if 'cursor' in params or 'page_size' in params:
+            return super().paginate_queryset(queryset)
+        return None
+    
+    def list(self, request, *args, **kwargs):
+        queryset = self.get_queryset()
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(self.get_serializer(page, many=True).data)
+        
+        # Unpaginated clients still get a bounded list
+        limit = getattr(settings, 'NOTIFICATION_LIST_LIMIT', 200)
+        queryset = queryset.order_by('-created_at', '-id')[:limit]
+        return Response(self.get_serializer(queryset, many=True).data)
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def mark_notification_read(request, notification_id):
-    try:
-        notification = Notification.objects.get(id=notification_id, user=request.user)
-        notification.is_read = True
-        notification.save()
-        return Response({'status': 'success'})
-    except Notification.DoesNotExist:
+    updated = read_state.mark_read(request.user.id, ids={notification_id})
+    if not updated and not Notification.objects.filter(id=notification_id, user=request.user).exists():
         return Response({'error': 'Notification not found'}, status=status.HTTP_404_NOT_FOUND)
+    read_state.broadcast_unread_count(request.user.id, unread.get_unread_count(request.user.id))
+    return Response({'status': 'success'})
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def mark_notifications_read(request):
+    """Mark many notifications as read: `notification_ids` and/or everything up to `up_to_id`"""
+    try:
+        ids, up_to_id = read_state.parse_read_request(request.data)
+    except (TypeError, ValueError):
+        return Response({'error': 'notification_ids must be a list of ids and up_to_id an id'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    if not ids and up_to_id is None:
+        return Response({'error': 'notification_ids or up_to_id required'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    updated = read_state.mark_read(request.user.id, ids=ids, up_to_id=up_to_id)
+    unread_count = unread.get_unread_count(request.user.id)
+    read_state.broadcast_unread_count(request.user.id, unread_count)
+    return Response({'status': 'success', 'updated': updated, 'unread_count': unread_count})
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def mark_all_read(request):
-    Notification.objects.filter(user=request.user, is_read=False).update(is_read=True)
-    return Response({'status': 'success'})
+    updated = Notification.objects.filter(user=request.user, is_read=False).update(is_read=True)
+    # Subtract what was marked instead of writing 0, a notification counted after
+    # the UPDATE stays unread and keeps its increment
+    unread_count = unread.adjust([request.user.id], -updated).get(request.user.id)
+    if unread_count is None:
+        unread_count = unread.get_unread_count(request.user.id)
+    read_state.broadcast_unread_count(request.user.id, unread_count)
+    return Response({'status': 'success', 'updated': updated, 'unread_count': unread_count})
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def unread_count(request):
+    """Badge count, served from the Redis counter"""
+    return Response({'unread_count': unread.get_unread_count(request.user.id)})
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
@@ -43,4 +125,13 @@ def store_fcm_token(request):
             defaults={'token': token, 'is_active': True}
         )
         return Response({'status': 'success'})
-    return Response({'error': 'Token required'}, status=status.HTTP_400_BAD_REQUEST)
\ No newline at end of file
+    return Response({'error': 'Token required'}, status=status.HTTP_400_BAD_REQUEST)
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def dispatch_stats(request):
+    """Queue depth, counters and detection-to-push latency for each notification lane, plus the push outbox"""
+    return Response({
+        'lanes': notification_dispatcher.get_stats(),
+        'outbox': get_outbox_stats(),
+    })
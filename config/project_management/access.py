@@ -0,0 +1,65 @@
+import redis
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+
+from .models import Project
+
+
+def get_accessible_projects_key(user_id):
+    return f"projects:accessible:{user_id}"
+
+
+def get_cache_timeout():
+    # Bounds how long a set can outlive a write that raced with its refill
+    return getattr(settings, 'PROJECT_ACCESS_CACHE_SECONDS', 300)
+
+
+def load_accessible_project_ids(user_id):
+    """
+    Active projects the user created or holds a role in, read from Postgres.
+    This is the access rule of the API views, kept in this one place.
+    """
+    return sorted(Project.objects.filter(
+        Q(created_by_id=user_id) | Q(user_roles__user_id=user_id),
+        is_active=True
+    ).values_list('id', flat=True).distinct())
+
+
+def get_accessible_project_ids(user):
+    """
+    Sorted ids of the active projects `user` can access, from the cache and
+    loaded from Postgres on a miss. Queries should filter on the literal ids
+    rather than joining through the roles table.
+    """
+    key = get_accessible_projects_key(user.id)
+    try:
+        project_ids = cache.get(key)
+        if project_ids is not None:
+            return project_ids
+    except redis.RedisError as e:
+        print(f"❌ Accessible projects read failed for user {user.id}: {e}")
+        return load_accessible_project_ids(user.id)
+    
+    project_ids = load_accessible_project_ids(user.id)
+    try:
+        cache.set(key, project_ids, timeout=get_cache_timeout())
+    except redis.RedisError:
+        pass
+    return project_ids
+
+
+def invalidate_users(user_ids):
+    """Drop the cached project sets of the users once the current transaction commits"""
+    keys = [get_accessible_projects_key(user_id) for user_id in set(user_ids) if user_id is not None]
+    if not keys:
+        return
+    
+    def drop():
+        try:
+            cache.delete_many(keys)
+        except redis.RedisError as e:
+            print(f"❌ Accessible projects invalidation failed: {e}")
+    
+    transaction.on_commit(drop)
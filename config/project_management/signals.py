@@ -0,0 +1,19 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import Project, UserProjectRole
+from . import access
+
+
+@receiver([post_save, post_delete], sender=UserProjectRole)
+def invalidate_role_user_projects(sender, instance, **kwargs):
+    access.invalidate_users([instance.user_id])
+
+
+@receiver([post_save, post_delete], sender=Project)
+def invalidate_project_users(sender, instance, **kwargs):
+    """Creating, (de)activating or deleting a project changes the sets of its owner and members"""
+    access.invalidate_users([
+        instance.created_by_id,
+        *UserProjectRole.objects.filter(project_id=instance.id).values_list('user_id', flat=True)
+    ])
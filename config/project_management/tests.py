@@ -1,3 +1,36 @@
-from django.test import TestCase
+from django.test import TestCase, override_settings
 
-# Create your tests here.
+from authentication.models import AppUser
+from .access import get_accessible_project_ids
+from .models import Project, UserProjectRole
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class AccessibleProjectTests(TestCase):
+    def setUp(self):
+        self.user = AppUser.objects.create_user(username='client', password='secret', user_type='client')
+        self.owner = AppUser.objects.create_user(username='owner', password='secret', user_type='supervisor')
+    
+    def test_access_rule(self):
+        created = Project.objects.create(name='Created', created_by=self.user)
+        member = Project.objects.create(name='Member', created_by=self.owner)
+        inactive_role = Project.objects.create(name='Inactive role', created_by=self.owner)
+        inactive_project = Project.objects.create(name='Inactive project', created_by=self.user, is_active=False)
+        Project.objects.create(name='Other', created_by=self.owner)
+        UserProjectRole.objects.create(user=self.user, project=member, role='client')
+        UserProjectRole.objects.create(user=self.user, project=inactive_role, role='client', is_active=False)
+        
+        # Any role grants API access, whether or not it is active
+        self.assertEqual(
+            get_accessible_project_ids(self.user),
+            sorted([created.id, member.id, inactive_role.id])
+        )
+        self.assertNotIn(inactive_project.id, get_accessible_project_ids(self.user))
+    
+    def test_role_changes_drop_the_cached_set(self):
+        project = Project.objects.create(name='Member', created_by=self.owner)
+        self.assertEqual(get_accessible_project_ids(self.user), [])
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            UserProjectRole.objects.create(user=self.user, project=project, role='client')
+        self.assertEqual(get_accessible_project_ids(self.user), [project.id])
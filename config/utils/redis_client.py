@@ -0,0 +1,20 @@
+import redis
+from django.conf import settings
+
+_client = None
+
+
+def get_redis():
+    """Get the shared Redis client (connections are created lazily by the pool)"""
+    global _client
+    if _client is None:
+        _client = redis.Redis.from_url(settings.REDIS_URL, decode_responses=True)
+    return _client
+
+
+def redis_available():
+    """Whether the shared Redis answers, for tests that need a live server"""
+    try:
+        return get_redis().ping()
+    except redis.RedisError:
+        return False